@@ -1,39 +1,51 @@
+import time
+
 from flask import Flask
 import click
 
 from config import Config
 from app.extensions import db, jwt, migrate
+from app.json_provider import AppJSONProvider
+from app.metrics import init_metrics
+from app.profiling import init_profiling
 
 
 def create_app(config_class=Config):
     app = Flask(__name__)
+    app.json = AppJSONProvider(app)
     app.config.from_object(config_class)
 
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
+    init_metrics(app)
+    init_profiling(app)
 
     from app.routes.auth import auth_bp
     from app.routes.mesas import mesas_bp
     from app.routes.platillos import platillos_bp
     from app.routes.pedidos import pedidos_bp
     from app.routes.compras import compras_bp
+    from app.routes.proveedores import proveedores_bp
     from app.routes.inventario import inventario_bp
     from app.routes.inventario_fisico import inventario_fisico_bp
     from app.routes.caja import caja_bp
     from app.routes.protected_examples import protected_bp
     from app.routes.deployments import deployments_bp
+    from app.routes.profiling import profiling_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(mesas_bp)
     app.register_blueprint(platillos_bp)
     app.register_blueprint(pedidos_bp)
     app.register_blueprint(compras_bp)
+    app.register_blueprint(proveedores_bp)
     app.register_blueprint(inventario_bp)
     app.register_blueprint(inventario_fisico_bp)
     app.register_blueprint(caja_bp)
     app.register_blueprint(protected_bp)
     app.register_blueprint(deployments_bp)
+    app.register_blueprint(profiling_bp)
 
     with app.app_context():
         from app import models  # noqa: F401
@@ -66,4 +78,113 @@ def create_app(config_class=Config):
         click.echo("Seed ADMIN ejecutado correctamente")
         click.echo(str(summary))
 
+    @app.cli.command("generate-load-data")
+    @click.option("--mesas", default=40, show_default=True, help="Mesas a crear.")
+    @click.option("--productos", default=1000, show_default=True, help="Productos de inventario.")
+    @click.option("--platillos", default=200, show_default=True, help="Platillos con receta.")
+    @click.option("--compras", default=500, show_default=True, help="Compras programadas además de las reposiciones.")
+    @click.option("--meses", default=3, show_default=True, help="Meses de historia a generar.")
+    @click.option("--pedidos-por-dia", default=300, show_default=True, help="Pedidos cobrados por día.")
+    @click.option("--seed", default=42, show_default=True, help="Semilla para datos reproducibles.")
+    @click.option("--chunk-size", default=5000, show_default=True, help="Filas por inserción masiva.")
+    def generate_load_data_command(mesas, productos, platillos, compras, meses, pedidos_por_dia, seed, chunk_size):
+        from app.load_data import generate_load_data
+
+        dias = meses * 30
+        started = time.perf_counter()
+        with app.app_context():
+            with db.session.begin():
+                db.create_all()
+                summary = generate_load_data(
+                    productos=productos,
+                    platillos=platillos,
+                    mesas=mesas,
+                    pedidos=dias * pedidos_por_dia,
+                    dias=dias,
+                    compras=compras,
+                    seed=seed,
+                    chunk_size=chunk_size,
+                )
+        click.echo(f"Datos de carga generados en {time.perf_counter() - started:.1f}s ({sum(summary.values())} filas)")
+        click.echo(str(summary))
+
+    @app.cli.command("repair-order-totals")
+    @click.option("--dry-run", is_flag=True, help="Solo reporta los pedidos desfasados, sin modificarlos.")
+    @click.option("--chunk-size", default=5000, show_default=True, help="Pedidos por lote de UPDATE.")
+    def repair_order_totals_command(dry_run, chunk_size):
+        from app.services.order_service import repair_order_totals
+
+        with app.app_context():
+            with db.session.begin():
+                summary = repair_order_totals(dry_run=dry_run, chunk_size=chunk_size)
+        click.echo("Revisión de totales (sin cambios)" if dry_run else "Totales de pedidos corregidos")
+        click.echo(str(summary))
+        if summary["cobrados_corregidos"]:
+            click.echo("Aviso: hay pedidos cobrados con total corregido; el monto de sus cobros no se modifica.")
+
+    @app.cli.command("refresh-recipe-costs")
+    def refresh_recipe_costs_command():
+        from app.services.recipe_service import refresh_platillos
+
+        with app.app_context():
+            with db.session.begin():
+                actualizados = refresh_platillos()
+        click.echo(f"Costo de receta y porciones disponibles recalculados para {actualizados} platillos")
+
+    @app.cli.command("check-kardex")
+    @click.option("--limite", default=20, show_default=True, help="Inconsistencias a listar.")
+    @click.option("--yield-per", default=5000, show_default=True, help="Filas leídas por lote.")
+    def check_kardex_command(limite, yield_per):
+        from app.services.inventory_service import verify_kardex
+
+        started = time.perf_counter()
+        with app.app_context():
+            resultado = verify_kardex(limite=limite, yield_per=yield_per)
+            db.session.rollback()
+        click.echo(
+            f"Kardex revisado en {time.perf_counter() - started:.1f}s: {resultado['productos']} productos, "
+            f"{resultado['movimientos']} movimientos, {resultado['total_inconsistencias']} inconsistencias"
+        )
+        for item in resultado["inconsistencias"]:
+            click.echo(str(item))
+        if not resultado["ok"]:
+            raise SystemExit(1)
+
+    @app.cli.command("replay-kardex")
+    @click.option("--producto-id", type=int, default=None, help="Solo este producto (por defecto todos).")
+    @click.option("--desde", default=None, help="Fecha/hora ISO desde la que se recalcula (por defecto todo el kardex).")
+    @click.option("--dry-run", is_flag=True, help="Solo reporta las diferencias, sin modificarlas.")
+    @click.option("--batch-size", default=5000, show_default=True, help="Movimientos por lote de lectura y UPDATE.")
+    def replay_kardex_command(producto_id, desde, dry_run, batch_size):
+        from datetime import datetime
+
+        from app.services.kardex_service import replay_kardex
+
+        desde_dt = datetime.fromisoformat(desde) if desde else None
+        started = time.perf_counter()
+        with app.app_context():
+            resultado = replay_kardex(producto_id=producto_id, desde=desde_dt, dry_run=dry_run, batch_size=batch_size, limite=20)
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+        click.echo(
+            f"Kardex {'revisado (sin cambios)' if dry_run else 'recalculado'} en {time.perf_counter() - started:.1f}s: "
+            f"{resultado['movimientos']} movimientos, {resultado['movimientos_corregidos']} corregidos "
+            f"en {resultado['productos_corregidos']} productos"
+        )
+        for cambio in resultado["cambios"]:
+            click.echo(str(cambio))
+        if resultado["saldos_negativos"]:
+            click.echo(f"Aviso: {resultado['saldos_negativos']} movimientos quedan con saldo negativo; revisa el kardex.")
+
+    @app.cli.command("purge-idempotency-keys")
+    def purge_idempotency_keys_command():
+        from app.idempotency import purge_expired_keys
+
+        with app.app_context():
+            with db.session.begin():
+                borradas = purge_expired_keys()
+        click.echo(f"Claves de idempotencia vencidas eliminadas: {borradas}")
+
     return app
@@ -0,0 +1,179 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import IdempotencyKey
+from app.routes.utils import error_response
+
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 80
+
+
+class _ResponseCache:
+    """LRU en memoria con las respuestas ya completadas, para no ir a la base en cada reintento."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            value = self._items.get(cache_key)
+            if value is not None:
+                self._items.move_to_end(cache_key)
+            return value
+
+    def put(self, cache_key, value):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._items[cache_key] = value
+            self._items.move_to_end(cache_key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+
+def _cache():
+    capacity = int(current_app.config.get("IDEMPOTENCY_CACHE_SIZE", 1024))
+    return current_app.extensions.setdefault("idempotency_cache", _ResponseCache(capacity))
+
+
+def _ttl():
+    return timedelta(hours=float(current_app.config.get("IDEMPOTENCY_TTL_HOURS", 24)))
+
+
+def _lock_timeout():
+    return timedelta(seconds=float(current_app.config.get("IDEMPOTENCY_LOCK_SECONDS", 60)))
+
+
+def _fingerprint():
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _replay(stored, fingerprint):
+    stored_fingerprint, status_code, body, _, etag = stored
+    if stored_fingerprint != fingerprint:
+        return error_response(f"{IDEMPOTENCY_HEADER} ya fue usada con otra solicitud", 422)
+    response = Response(body, status=status_code, mimetype="application/json")
+    if etag:
+        response.headers["ETag"] = etag
+    response.headers[REPLAY_HEADER] = "true"
+    return response
+
+
+def _is_expired(registro, now):
+    limite = _lock_timeout() if registro.status_code is None else _ttl()
+    return registro.created_at < now - limite
+
+
+def _release(registro_id):
+    db.session.rollback()
+    db.session.query(IdempotencyKey).filter(IdempotencyKey.id == registro_id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def idempotent(fn):
+    """Permite reintentar un POST con el header Idempotency-Key sin repetir su efecto.
+
+    La primera solicitud reserva la clave (por usuario) antes de ejecutar la vista y, si responde
+    2xx, guarda el status, el cuerpo y el ETag. Los reintentos con la misma clave y el mismo cuerpo
+    reciben esa respuesta guardada; con otro cuerpo reciben 422 y, mientras la primera sigue en
+    proceso, 409.
+    Las respuestas de error liberan la clave para que el cliente pueda corregir y reintentar.
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return error_response(f"{IDEMPOTENCY_HEADER} no puede superar {MAX_KEY_LENGTH} caracteres")
+
+        user_id = int(get_jwt_identity())
+        fingerprint = _fingerprint()
+        cache = _cache()
+        now = datetime.utcnow()
+
+        cached = cache.get((user_id, key))
+        if cached is not None and cached[3] >= now - _ttl():
+            return _replay(cached, fingerprint)
+
+        registro = (
+            db.session.query(IdempotencyKey)
+            .filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .first()
+        )
+        if registro is not None and _is_expired(registro, now):
+            _release(registro.id)
+            registro = None
+
+        if registro is not None:
+            if registro.status_code is None:
+                if registro.fingerprint != fingerprint:
+                    return error_response(f"{IDEMPOTENCY_HEADER} ya fue usada con otra solicitud", 422)
+                return error_response("La solicitud original sigue en proceso, reintenta en unos segundos", 409)
+            stored = (
+                registro.fingerprint,
+                registro.status_code,
+                registro.response_body,
+                registro.created_at,
+                registro.response_etag,
+            )
+            cache.put((user_id, key), stored)
+            return _replay(stored, fingerprint)
+
+        registro = IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            endpoint=request.endpoint,
+            fingerprint=fingerprint,
+            created_at=now,
+        )
+        db.session.add(registro)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Otro worker reservó la misma clave entre la consulta y el INSERT.
+            db.session.rollback()
+            return error_response("La solicitud original sigue en proceso, reintenta en unos segundos", 409)
+        registro_id = registro.id
+
+        try:
+            response = current_app.make_response(fn(*args, **kwargs))
+        except Exception:
+            _release(registro_id)
+            raise
+
+        if not 200 <= response.status_code < 300:
+            _release(registro_id)
+            return response
+
+        body = response.get_data(as_text=True)
+        etag = response.headers.get("ETag")
+        db.session.query(IdempotencyKey).filter(IdempotencyKey.id == registro_id).update(
+            {"status_code": response.status_code, "response_body": body, "response_etag": etag},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        cache.put((user_id, key), (fingerprint, response.status_code, body, now, etag))
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys():
+    limite = datetime.utcnow() - _ttl()
+    return db.session.query(IdempotencyKey).filter(IdempotencyKey.created_at < limite).delete(synchronize_session=False)
@@ -0,0 +1,13 @@
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class AppJSONProvider(DefaultJSONProvider):
+    """Serializa Decimal como número; el proveedor por defecto de Flask lo convierte a string."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return DefaultJSONProvider.default(o)
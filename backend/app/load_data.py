@@ -0,0 +1,385 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+from werkzeug.security import generate_password_hash
+
+from app.extensions import db
+from app.models import (
+    AperturaCaja,
+    CajaEstadoEnum,
+    CierreCaja,
+    Cobro,
+    CobroMetodoEnum,
+    Compra,
+    DetalleCompra,
+    Mesa,
+    MesaEstadoEnum,
+    MovimientoInventario,
+    MovimientoTipoEnum,
+    Pedido,
+    PedidoDetalle,
+    PedidoEstadoEnum,
+    Platillo,
+    PlatilloIngrediente,
+    Producto,
+    RoleEnum,
+    User,
+)
+from app.money import money, quantity, to_decimal
+from app.services.inventory_service import weighted_average_cost
+from app.services.order_service import line_subtotal
+from app.services.recipe_service import refresh_platillos
+from app.services.supplier_service import get_or_create_proveedor
+
+
+UNIDADES = ("kg", "g", "lt", "ml", "unidad")
+PROVEEDORES = (
+    "Distribuidora Central",
+    "Mercado La Terminal",
+    "Carnes Selectas",
+    "Lácteos del Valle",
+    "Abarrotes Don Pepe",
+    "Verduras Frescas",
+)
+LOAD_PASSWORD = "load123"
+PUNTO_REPOSICION = quantity(30)
+
+
+class _BulkWriter:
+    """Acumula filas por tabla y las inserta en lotes con executemany.
+
+    Siempre vacía todas las tablas en orden de dependencias para respetar las llaves foráneas.
+    """
+
+    ORDER = (
+        User,
+        Mesa,
+        Producto,
+        Platillo,
+        PlatilloIngrediente,
+        Compra,
+        DetalleCompra,
+        AperturaCaja,
+        Pedido,
+        PedidoDetalle,
+        Cobro,
+        CierreCaja,
+        MovimientoInventario,
+    )
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.pending = {model: [] for model in self.ORDER}
+        self.counts = {}
+
+    def add(self, model, row):
+        rows = self.pending[model]
+        rows.append(row)
+        if len(rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        for model in self.ORDER:
+            rows = self.pending[model]
+            if not rows:
+                continue
+            db.session.execute(insert(model.__table__), rows)
+            self.counts[model.__tablename__] = self.counts.get(model.__tablename__, 0) + len(rows)
+            self.pending[model] = []
+
+
+class _IdSequence:
+    def __init__(self, model):
+        self.next_id = (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+    def take(self):
+        value = self.next_id
+        self.next_id += 1
+        return value
+
+
+def generate_load_data(productos=200, platillos=60, mesas=20, pedidos=5000, dias=30, compras=0, seed=42, chunk_size=5000):
+    """Genera un volumen realista de datos con inserciones masivas.
+
+    Los pedidos históricos quedan COBRADOS con su cobro en la caja del día y sus salidas VENTA en el
+    kardex. Además de `compras` programadas, cuando un producto baja del punto de reposición se
+    registra una compra, así los saldos del kardex quedan consistentes.
+    """
+    rng = random.Random(seed)
+    writer = _BulkWriter(chunk_size)
+    ids = {model: _IdSequence(model) for model in _BulkWriter.ORDER}
+    inicio = datetime.utcnow() - timedelta(days=dias)
+    prefijo = f"L{seed}-{ids[Producto].next_id}"
+
+    password_hash = generate_password_hash(LOAD_PASSWORD)
+    meseros = []
+    cajeros = []
+    for role in (RoleEnum.ADMIN, RoleEnum.CAJERO, RoleEnum.MESERO, RoleEnum.MESERO, RoleEnum.COCINA):
+        user_id = ids[User].take()
+        writer.add(
+            User,
+            {
+                "id": user_id,
+                "username": f"load_{role.value.lower()}_{user_id}",
+                "password_hash": password_hash,
+                "role": role,
+                "is_active": True,
+                "created_at": inicio,
+            },
+        )
+        if role == RoleEnum.MESERO:
+            meseros.append(user_id)
+        if role == RoleEnum.CAJERO:
+            cajeros.append(user_id)
+
+    max_numero = db.session.query(func.max(Mesa.numero)).scalar() or 0
+    mesa_ids = []
+    for offset in range(mesas):
+        mesa_id = ids[Mesa].take()
+        writer.add(Mesa, {"id": mesa_id, "numero": max_numero + offset + 1, "estado": MesaEstadoEnum.LIBRE})
+        mesa_ids.append(mesa_id)
+
+    # Estado en memoria del kardex por producto: [saldo, costo_promedio, costo_base].
+    kardex = {}
+    for index in range(productos):
+        producto_id = ids[Producto].take()
+        kardex[producto_id] = [quantity(0), quantity(0), quantity(rng.uniform(0.5, 25.0))]
+        writer.add(
+            Producto,
+            {
+                "id": producto_id,
+                "nombre": f"{prefijo} Producto {index + 1}",
+                "unidad": rng.choice(UNIDADES),
+                "stock_actual": quantity(0),
+                "costo_promedio": quantity(0),
+                "activo": True,
+            },
+        )
+    writer.flush()
+
+    producto_ids = list(kardex)
+    proveedores = {nombre: get_or_create_proveedor(nombre).id for nombre in PROVEEDORES}
+
+    def registrar_compra(fecha, lineas):
+        compra_id = ids[Compra].take()
+        lineas = [
+            (producto_id, cantidad, quantity(kardex[producto_id][2] * to_decimal(rng.uniform(0.9, 1.1))))
+            for producto_id, cantidad in lineas
+        ]
+        proveedor = rng.choice(PROVEEDORES)
+        writer.add(
+            Compra,
+            {
+                "id": compra_id,
+                "proveedor": proveedor,
+                "proveedor_id": proveedores[proveedor],
+                "fecha": fecha,
+                "total": sum((money(cantidad * costo) for _, cantidad, costo in lineas), money(0)),
+            },
+        )
+        for producto_id, cantidad, costo in lineas:
+            estado = kardex[producto_id]
+            # Mismo cálculo que register_purchase para que recalcular el kardex no encuentre diferencias.
+            estado[1] = weighted_average_cost(estado[0], estado[1], cantidad, costo)
+            estado[0] = quantity(estado[0] + cantidad)
+            writer.add(
+                DetalleCompra,
+                {
+                    "id": ids[DetalleCompra].take(),
+                    "compra_id": compra_id,
+                    "producto_id": producto_id,
+                    "cantidad": cantidad,
+                    "costo_unitario": costo,
+                    "subtotal": money(cantidad * costo),
+                },
+            )
+            writer.add(
+                MovimientoInventario,
+                {
+                    "id": ids[MovimientoInventario].take(),
+                    "producto_id": producto_id,
+                    "tipo": MovimientoTipoEnum.COMPRA,
+                    "referencia_tipo": "COMPRA",
+                    "referencia_id": compra_id,
+                    "cantidad": cantidad,
+                    "costo_unitario": costo,
+                    "saldo_cantidad": estado[0],
+                    "costo_promedio_resultante": estado[1],
+                    "created_at": fecha,
+                },
+            )
+
+    registrar_compra(inicio, [(producto_id, quantity(rng.randint(50, 200))) for producto_id in producto_ids])
+
+    recetas = {}
+    precios = {}
+    for index in range(platillos):
+        platillo_id = ids[Platillo].take()
+        ingredientes = rng.sample(producto_ids, k=min(len(producto_ids), rng.randint(2, 6)))
+        receta = [(producto_id, quantity(rng.uniform(0.01, 0.5))) for producto_id in ingredientes]
+        costo = sum(cantidad * kardex[producto_id][2] for producto_id, cantidad in receta)
+        precios[platillo_id] = money(max(costo * to_decimal(rng.uniform(2.0, 3.5)), 1))
+        recetas[platillo_id] = receta
+        writer.add(
+            Platillo,
+            {"id": platillo_id, "nombre": f"{prefijo} Platillo {index + 1}", "precio": precios[platillo_id], "activo": True},
+        )
+        for producto_id, cantidad in receta:
+            writer.add(
+                PlatilloIngrediente,
+                {
+                    "id": ids[PlatilloIngrediente].take(),
+                    "platillo_id": platillo_id,
+                    "producto_id": producto_id,
+                    "cantidad_por_unidad": cantidad,
+                },
+            )
+    writer.flush()
+
+    platillo_ids = list(recetas)
+    metodos = (CobroMetodoEnum.EFECTIVO, CobroMetodoEnum.TARJETA, CobroMetodoEnum.TRANSFERENCIA)
+    caja = {"apertura_id": None, "dia": None, "totales": None, "cierre": None}
+
+    def cerrar_caja():
+        if caja["apertura_id"] is None:
+            return
+        totales = caja["totales"]
+        writer.add(
+            CierreCaja,
+            {
+                "id": ids[CierreCaja].take(),
+                "apertura_caja_id": caja["apertura_id"],
+                "total_ventas": sum(totales.values(), money(0)),
+                "total_efectivo": totales[CobroMetodoEnum.EFECTIVO],
+                "total_tarjeta": totales[CobroMetodoEnum.TARJETA],
+                "total_transferencia": totales[CobroMetodoEnum.TRANSFERENCIA],
+                "closed_at": caja["cierre"],
+            },
+        )
+
+    def caja_del_dia(fecha):
+        if caja["dia"] == fecha.date():
+            return caja["apertura_id"]
+        cerrar_caja()
+        apertura_id = ids[AperturaCaja].take()
+        writer.add(
+            AperturaCaja,
+            {
+                "id": apertura_id,
+                "user_id": rng.choice(cajeros),
+                "monto_inicial": money(100),
+                "opened_at": fecha - timedelta(minutes=5),
+                "estado": CajaEstadoEnum.CERRADA,
+            },
+        )
+        caja.update(apertura_id=apertura_id, dia=fecha.date(), totales={metodo: money(0) for metodo in metodos})
+        return apertura_id
+
+    def compra_programada(fecha):
+        lineas_compra = rng.sample(producto_ids, k=min(len(producto_ids), rng.randint(3, 10)))
+        registrar_compra(fecha, [(producto_id, quantity(rng.randint(10, 50))) for producto_id in lineas_compra])
+
+    fechas_compras = sorted(inicio + timedelta(seconds=rng.uniform(0, dias * 86400)) for _ in range(compras))
+    siguiente_compra = 0
+
+    paso = timedelta(days=dias) / max(pedidos, 1)
+    for index in range(pedidos):
+        fecha = inicio + paso * (index + 1)
+        while siguiente_compra < len(fechas_compras) and fechas_compras[siguiente_compra] <= fecha:
+            compra_programada(fechas_compras[siguiente_compra])
+            siguiente_compra += 1
+
+        pedido_id = ids[Pedido].take()
+        lineas = [(rng.choice(platillo_ids), quantity(rng.randint(1, 3))) for _ in range(rng.randint(1, 4))]
+
+        consumo = {}
+        for platillo_id, cantidad in lineas:
+            for producto_id, por_unidad in recetas[platillo_id]:
+                consumo[producto_id] = consumo.get(producto_id, quantity(0)) + quantity(cantidad * por_unidad)
+
+        reposicion = [
+            (producto_id, quantity(rng.randint(50, 200)) + cantidad)
+            for producto_id, cantidad in sorted(consumo.items())
+            if kardex[producto_id][0] - cantidad < PUNTO_REPOSICION
+        ]
+        if reposicion:
+            registrar_compra(fecha - timedelta(seconds=1), reposicion)
+
+        apertura_id = caja_del_dia(fecha)
+        subtotales = [line_subtotal(cantidad, precios[platillo_id]) for platillo_id, cantidad in lineas]
+        total = sum(subtotales, money(0))
+        writer.add(
+            Pedido,
+            {
+                "id": pedido_id,
+                "mesa_id": rng.choice(mesa_ids),
+                "user_id": rng.choice(meseros),
+                "estado": PedidoEstadoEnum.COBRADO,
+                "total": total,
+                "created_at": fecha,
+            },
+        )
+        for (platillo_id, cantidad), subtotal in zip(lineas, subtotales):
+            writer.add(
+                PedidoDetalle,
+                {
+                    "id": ids[PedidoDetalle].take(),
+                    "pedido_id": pedido_id,
+                    "platillo_id": platillo_id,
+                    "cantidad": cantidad,
+                    "precio_unitario": precios[platillo_id],
+                    "subtotal": subtotal,
+                },
+            )
+
+        for producto_id, cantidad in sorted(consumo.items()):
+            estado = kardex[producto_id]
+            estado[0] = quantity(estado[0] - cantidad)
+            writer.add(
+                MovimientoInventario,
+                {
+                    "id": ids[MovimientoInventario].take(),
+                    "producto_id": producto_id,
+                    "tipo": MovimientoTipoEnum.VENTA,
+                    "referencia_tipo": "PEDIDO",
+                    "referencia_id": pedido_id,
+                    "cantidad": -cantidad,
+                    "costo_unitario": estado[1],
+                    "saldo_cantidad": estado[0],
+                    "costo_promedio_resultante": estado[1],
+                    "created_at": fecha,
+                },
+            )
+
+        metodo = rng.choice(metodos)
+        paid_at = fecha + timedelta(minutes=rng.randint(20, 90))
+        writer.add(
+            Cobro,
+            {
+                "id": ids[Cobro].take(),
+                "pedido_id": pedido_id,
+                "apertura_caja_id": apertura_id,
+                "metodo": metodo,
+                "monto": total,
+                "paid_at": paid_at,
+            },
+        )
+        caja["totales"][metodo] += total
+        caja["cierre"] = paid_at + timedelta(minutes=5)
+
+    for fecha in fechas_compras[siguiente_compra:]:
+        compra_programada(fecha)
+    cerrar_caja()
+    writer.flush()
+
+    db.session.execute(
+        Producto.__table__.update().where(Producto.__table__.c.id == db.bindparam("b_id")),
+        [
+            {"b_id": producto_id, "stock_actual": estado[0], "costo_promedio": estado[1]}
+            for producto_id, estado in kardex.items()
+        ],
+    )
+    refresh_platillos()
+
+    return dict(sorted(writer.counts.items()))
@@ -0,0 +1,171 @@
+import os
+import time
+
+from flask import Response, current_app, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+from app.extensions import db
+
+
+# Con gunicorn cada worker escribe sus valores en PROMETHEUS_MULTIPROC_DIR y /metrics los agrega.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "garrobito_http_request_duration_seconds",
+    "Latencia de requests HTTP por endpoint.",
+    ["blueprint", "endpoint", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_COUNT = Counter(
+    "garrobito_http_requests_total",
+    "Requests HTTP atendidos por endpoint y status.",
+    ["blueprint", "endpoint", "method", "status"],
+)
+DB_TIME = Histogram(
+    "garrobito_db_time_seconds",
+    "Tiempo acumulado en base de datos por request.",
+    ["blueprint", "endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Counter(
+    "garrobito_db_queries_total",
+    "Sentencias SQL ejecutadas por endpoint.",
+    ["blueprint", "endpoint"],
+)
+ORDER_TRANSITIONS = Counter(
+    "garrobito_pedido_transiciones_total",
+    "Transiciones de estado de pedidos.",
+    ["desde", "hacia"],
+)
+CASH_AMOUNT = Counter(
+    "garrobito_cobros_monto_total",
+    "Monto cobrado acumulado por método.",
+    ["metodo"],
+)
+CASH_COUNT = Counter(
+    "garrobito_cobros_total",
+    "Cobros registrados por método.",
+    ["metodo"],
+)
+INVENTORY_APPLY_TIME = Histogram(
+    "garrobito_inventario_fisico_aplicar_seconds",
+    "Tiempo por fase al aplicar un inventario físico.",
+    ["fase"],
+    buckets=LATENCY_BUCKETS,
+)
+INVENTORY_APPLY_ITEMS = Counter(
+    "garrobito_inventario_fisico_ajustes_total",
+    "Ajustes de stock generados al aplicar inventarios físicos.",
+    ["tipo"],
+)
+
+
+def _label(value):
+    if value is None:
+        return "none"
+    return getattr(value, "value", value)
+
+
+def record_order_transition(desde, hacia):
+    ORDER_TRANSITIONS.labels(desde=_label(desde), hacia=_label(hacia)).inc()
+
+
+def record_payment(metodo, monto):
+    metodo_label = _label(metodo)
+    CASH_COUNT.labels(metodo=metodo_label).inc()
+    CASH_AMOUNT.labels(metodo=metodo_label).inc(float(monto))
+
+
+def record_inventory_apply(resumen):
+    for fase, milisegundos in resumen["tiempos_ms"].items():
+        INVENTORY_APPLY_TIME.labels(fase=fase).observe(milisegundos / 1000)
+    INVENTORY_APPLY_ITEMS.labels(tipo="AJUSTE_POS").inc(resumen["ajustes_positivos"])
+    INVENTORY_APPLY_ITEMS.labels(tipo="AJUSTE_NEG").inc(resumen["ajustes_negativos"])
+
+
+def _request_labels():
+    return _label(request.blueprint), _label(request.endpoint)
+
+
+def _before_request():
+    g.metrics_started_at = time.perf_counter()
+    g.metrics_db_time = 0.0
+    g.metrics_db_queries = 0
+
+
+def _after_request(response):
+    started_at = g.pop("metrics_started_at", None)
+    if started_at is None:
+        return response
+
+    blueprint, endpoint = _request_labels()
+    REQUEST_LATENCY.labels(blueprint=blueprint, endpoint=endpoint, method=request.method).observe(
+        time.perf_counter() - started_at
+    )
+    REQUEST_COUNT.labels(
+        blueprint=blueprint,
+        endpoint=endpoint,
+        method=request.method,
+        status=str(response.status_code),
+    ).inc()
+
+    queries = g.pop("metrics_db_queries", 0)
+    db_time = g.pop("metrics_db_time", 0.0)
+    DB_TIME.labels(blueprint=blueprint, endpoint=endpoint).observe(db_time)
+    if queries:
+        DB_QUERIES.labels(blueprint=blueprint, endpoint=endpoint).inc(queries)
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    # Fuera de un request (CLI, seed) no hay a quién atribuir el tiempo.
+    if g and "metrics_db_time" in g:
+        g.metrics_db_time += elapsed
+        g.metrics_db_queries += 1
+
+
+def _metrics_registry():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view():
+    expected = (current_app.config.get("METRICS_API_KEY") or "").strip()
+    if expected:
+        provided = (request.headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+        if provided != expected:
+            return Response("No autorizado\n", status=401, mimetype="text/plain")
+    return Response(generate_latest(_metrics_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db.engine, "after_cursor_execute", _after_cursor_execute)
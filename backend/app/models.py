@@ -32,6 +32,11 @@ class MovimientoTipoEnum(str, Enum):
     AJUSTE_NEG = "AJUSTE_NEG"
 
 
+class AlertaStockTipoEnum(str, Enum):
+    BAJO_STOCK = "BAJO_STOCK"
+    REPUESTO = "REPUESTO"
+
+
 class InventarioFisicoTipoEnum(str, Enum):
     INICIAL = "INICIAL"
     MENSUAL = "MENSUAL"
@@ -70,6 +75,9 @@ class Mesa(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     numero = db.Column(db.Integer, unique=True, nullable=False)
     estado = db.Column(db.Enum(MesaEstadoEnum), default=MesaEstadoEnum.LIBRE, nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
 
 class Pedido(db.Model, TimestampMixin):
@@ -77,20 +85,23 @@ class Pedido(db.Model, TimestampMixin):
     mesa_id = db.Column(db.Integer, db.ForeignKey("mesa.id"), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     estado = db.Column(db.Enum(PedidoEstadoEnum), default=PedidoEstadoEnum.ABIERTO, nullable=False)
-    total = db.Column(db.Float, default=0.0, nullable=False)
+    total = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
 
     mesa = db.relationship("Mesa")
     user = db.relationship("User")
     detalles = db.relationship("PedidoDetalle", back_populates="pedido", cascade="all, delete-orphan")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class PedidoDetalle(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    pedido_id = db.Column(db.Integer, db.ForeignKey("pedido.id"), nullable=False)
+    pedido_id = db.Column(db.Integer, db.ForeignKey("pedido.id"), nullable=False, index=True)
     platillo_id = db.Column(db.Integer, db.ForeignKey("platillo.id"), nullable=False)
-    cantidad = db.Column(db.Float, nullable=False)
-    precio_unitario = db.Column(db.Float, nullable=False)
-    subtotal = db.Column(db.Float, nullable=False)
+    cantidad = db.Column(db.Numeric(14, 6), nullable=False)
+    precio_unitario = db.Column(db.Numeric(12, 2), nullable=False)
+    subtotal = db.Column(db.Numeric(12, 2), nullable=False)
 
     pedido = db.relationship("Pedido", back_populates="detalles")
     platillo = db.relationship("Platillo")
@@ -99,17 +110,21 @@ class PedidoDetalle(db.Model):
 class Platillo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(120), unique=True, nullable=False)
-    precio = db.Column(db.Float, nullable=False)
+    precio = db.Column(db.Numeric(12, 2), nullable=False)
     activo = db.Column(db.Boolean, default=True, nullable=False)
+    # Costo teórico de una porción según la receta y el costo promedio vigente de cada producto.
+    costo_receta = db.Column(db.Numeric(14, 6), default=0, server_default="0", nullable=False)
+    # Porciones que alcanza el stock actual; NULL si el platillo no tiene receta.
+    porciones_disponibles = db.Column(db.Integer, nullable=True)
 
     ingredientes = db.relationship("PlatilloIngrediente", back_populates="platillo", cascade="all, delete-orphan")
 
 
 class PlatilloIngrediente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    platillo_id = db.Column(db.Integer, db.ForeignKey("platillo.id"), nullable=False)
+    platillo_id = db.Column(db.Integer, db.ForeignKey("platillo.id"), nullable=False, index=True)
     producto_id = db.Column(db.Integer, db.ForeignKey("producto.id"), nullable=False)
-    cantidad_por_unidad = db.Column(db.Float, nullable=False)
+    cantidad_por_unidad = db.Column(db.Numeric(14, 6), nullable=False)
 
     platillo = db.relationship("Platillo", back_populates="ingredientes")
     producto = db.relationship("Producto")
@@ -119,9 +134,15 @@ class Producto(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(120), unique=True, nullable=False)
     unidad = db.Column(db.String(32), nullable=False)
-    stock_actual = db.Column(db.Float, default=0.0, nullable=False)
-    costo_promedio = db.Column(db.Float, default=0.0, nullable=False)
+    stock_actual = db.Column(db.Numeric(14, 6), default=0, nullable=False)
+    costo_promedio = db.Column(db.Numeric(14, 6), default=0, nullable=False)
+    # Parte de stock_actual apartada por pedidos abiertos; el disponible es stock_actual - stock_reservado.
+    stock_reservado = db.Column(db.Numeric(14, 6), default=0, server_default="0", nullable=False)
     activo = db.Column(db.Boolean, default=True, nullable=False)
+    # Punto de reorden; 0 desactiva la alerta. `bajo_stock` vale stock_actual < stock_minimo y lo
+    # mantiene el mismo UPDATE que mueve el stock, así listar los productos bajo mínimo usa el índice.
+    stock_minimo = db.Column(db.Numeric(14, 6), default=0, server_default="0", nullable=False)
+    bajo_stock = db.Column(db.Boolean, default=False, server_default="0", nullable=False, index=True)
 
 
 class MovimientoInventario(db.Model, TimestampMixin):
@@ -130,19 +151,65 @@ class MovimientoInventario(db.Model, TimestampMixin):
     tipo = db.Column(db.Enum(MovimientoTipoEnum), nullable=False)
     referencia_tipo = db.Column(db.String(50), nullable=False)
     referencia_id = db.Column(db.Integer, nullable=False)
-    cantidad = db.Column(db.Float, nullable=False)
-    costo_unitario = db.Column(db.Float, nullable=False)
-    saldo_cantidad = db.Column(db.Float, nullable=False)
-    costo_promedio_resultante = db.Column(db.Float, nullable=False)
+    cantidad = db.Column(db.Numeric(14, 6), nullable=False)
+    costo_unitario = db.Column(db.Numeric(14, 6), nullable=False)
+    saldo_cantidad = db.Column(db.Numeric(14, 6), nullable=False)
+    costo_promedio_resultante = db.Column(db.Numeric(14, 6), nullable=False)
+
+    producto = db.relationship("Producto")
+
+    __table_args__ = (
+        db.Index("ix_movimiento_inventario_referencia", "referencia_tipo", "referencia_id"),
+        db.Index("ix_movimiento_inventario_producto_kardex", "producto_id", "created_at", "id"),
+    )
+
+
+class AlertaStock(db.Model, TimestampMixin):
+    """Cruce del stock mínimo de un producto, hacia abajo (BAJO_STOCK) o de vuelta (REPUESTO)."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey("producto.id"), nullable=False, index=True)
+    tipo = db.Column(db.Enum(AlertaStockTipoEnum), nullable=False)
+    stock_actual = db.Column(db.Numeric(14, 6), nullable=False)
+    stock_minimo = db.Column(db.Numeric(14, 6), nullable=False)
 
     producto = db.relationship("Producto")
 
 
+class ReservaInventario(db.Model, TimestampMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    pedido_id = db.Column(db.Integer, db.ForeignKey("pedido.id"), nullable=False)
+    producto_id = db.Column(db.Integer, db.ForeignKey("producto.id"), nullable=False)
+    cantidad = db.Column(db.Numeric(14, 6), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint("pedido_id", "producto_id", name="uq_reserva_inventario_pedido_producto"),)
+
+
+class Proveedor(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(120), nullable=False)
+    nombre_normalizado = db.Column(db.String(120), nullable=False, unique=True)
+
+    terminos = db.relationship("ProveedorTermino", cascade="all, delete-orphan")
+
+
+class ProveedorTermino(db.Model):
+    """Cada palabra normalizada del nombre de un proveedor, indexada para buscar por prefijo."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    proveedor_id = db.Column(db.Integer, db.ForeignKey("proveedor.id"), nullable=False)
+    termino = db.Column(db.String(120), nullable=False, index=True)
+
+    __table_args__ = (db.UniqueConstraint("proveedor_id", "termino", name="uq_proveedor_termino"),)
+
+
 class Compra(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # Nombre tal como se escribió en la compra; la búsqueda usa `proveedor_id`.
     proveedor = db.Column(db.String(120), nullable=False)
+    proveedor_id = db.Column(db.Integer, db.ForeignKey("proveedor.id"), nullable=False, index=True)
     fecha = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    total = db.Column(db.Float, default=0.0, nullable=False)
+    total = db.Column(db.Numeric(12, 2), default=0, nullable=False)
 
     detalles = db.relationship("DetalleCompra", back_populates="compra", cascade="all, delete-orphan")
 
@@ -151,9 +218,9 @@ class DetalleCompra(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     compra_id = db.Column(db.Integer, db.ForeignKey("compra.id"), nullable=False)
     producto_id = db.Column(db.Integer, db.ForeignKey("producto.id"), nullable=False)
-    cantidad = db.Column(db.Float, nullable=False)
-    costo_unitario = db.Column(db.Float, nullable=False)
-    subtotal = db.Column(db.Float, nullable=False)
+    cantidad = db.Column(db.Numeric(14, 6), nullable=False)
+    costo_unitario = db.Column(db.Numeric(14, 6), nullable=False)
+    subtotal = db.Column(db.Numeric(12, 2), nullable=False)
 
     compra = db.relationship("Compra", back_populates="detalles")
     producto = db.relationship("Producto")
@@ -176,18 +243,22 @@ class InventarioFisicoDet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     inventario_fisico_id = db.Column(db.Integer, db.ForeignKey("inventario_fisico.id"), nullable=False)
     producto_id = db.Column(db.Integer, db.ForeignKey("producto.id"), nullable=False)
-    conteo = db.Column(db.Float, nullable=False)
-    stock_sistema = db.Column(db.Float, nullable=False)
-    diferencia = db.Column(db.Float, nullable=False)
+    conteo = db.Column(db.Numeric(14, 6), nullable=False)
+    stock_sistema = db.Column(db.Numeric(14, 6), nullable=False)
+    diferencia = db.Column(db.Numeric(14, 6), nullable=False)
 
     inventario_fisico = db.relationship("InventarioFisico", back_populates="detalles")
     producto = db.relationship("Producto")
 
+    __table_args__ = (
+        db.UniqueConstraint("inventario_fisico_id", "producto_id", name="uq_inventario_fisico_det_producto"),
+    )
+
 
 class AperturaCaja(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    monto_inicial = db.Column(db.Float, nullable=False)
+    monto_inicial = db.Column(db.Numeric(12, 2), nullable=False)
     opened_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     estado = db.Column(db.Enum(CajaEstadoEnum), default=CajaEstadoEnum.ABIERTA, nullable=False)
 
@@ -199,7 +270,7 @@ class Cobro(db.Model):
     pedido_id = db.Column(db.Integer, db.ForeignKey("pedido.id"), nullable=False, unique=True)
     apertura_caja_id = db.Column(db.Integer, db.ForeignKey("apertura_caja.id"), nullable=False)
     metodo = db.Column(db.Enum(CobroMetodoEnum), nullable=False)
-    monto = db.Column(db.Float, nullable=False)
+    monto = db.Column(db.Numeric(12, 2), nullable=False)
     paid_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     pedido = db.relationship("Pedido")
@@ -209,10 +280,25 @@ class Cobro(db.Model):
 class CierreCaja(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     apertura_caja_id = db.Column(db.Integer, db.ForeignKey("apertura_caja.id"), nullable=False, unique=True)
-    total_ventas = db.Column(db.Float, nullable=False)
-    total_efectivo = db.Column(db.Float, nullable=False)
-    total_tarjeta = db.Column(db.Float, nullable=False)
-    total_transferencia = db.Column(db.Float, nullable=False)
+    total_ventas = db.Column(db.Numeric(12, 2), nullable=False)
+    total_efectivo = db.Column(db.Numeric(12, 2), nullable=False)
+    total_tarjeta = db.Column(db.Numeric(12, 2), nullable=False)
+    total_transferencia = db.Column(db.Numeric(12, 2), nullable=False)
     closed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     apertura_caja = db.relationship("AperturaCaja")
+
+
+class IdempotencyKey(db.Model, TimestampMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    key = db.Column(db.String(80), nullable=False)
+    endpoint = db.Column(db.String(80), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # NULL mientras la primera solicitud sigue en proceso.
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    # Los reintentos deben recibir el mismo ETag que la respuesta original.
+    response_etag = db.Column(db.String(80), nullable=True)
+
+    __table_args__ = (db.UniqueConstraint("user_id", "key", name="uq_idempotency_key_user_key"),)
@@ -0,0 +1,26 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+
+CENTAVOS = Decimal("0.01")
+# Cantidades, stock y costos unitarios se guardan como Numeric(14, 6).
+SEIS_DECIMALES = Decimal("0.000001")
+# Mayor valor que cabe en Numeric(14, 6).
+CANTIDAD_MAXIMA = Decimal("99999999.999999")
+
+
+def to_decimal(value):
+    # str() evita arrastrar el error binario del float (0.1 -> 0.1000000000000000055...).
+    result = value if isinstance(value, Decimal) else Decimal(str(value if value is not None else 0))
+    if not result.is_finite():
+        raise ValueError("Valor numérico inválido")
+    return result
+
+
+def money(value):
+    """Redondea a centavos con la regla comercial (0.005 -> 0.01)."""
+    return to_decimal(value).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def quantity(value):
+    """Redondea cantidades y costos unitarios a la escala de sus columnas."""
+    return to_decimal(value).quantize(SEIS_DECIMALES, rounding=ROUND_HALF_UP)
@@ -0,0 +1,147 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+from app.models import RoleEnum
+
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_ARG = "_profile"
+PROFILE_ID_RE = re.compile(r"^[0-9]{14}-[a-z0-9_.]+-[0-9a-f]{8}$")
+SORT_KEYS = {"cumulative", "tottime", "calls", "ncalls", "time"}
+
+
+def _truthy(value):
+    return str(value or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _wants_profile():
+    return _truthy(request.headers.get(PROFILE_HEADER)) or _truthy(request.args.get(PROFILE_QUERY_ARG))
+
+
+def _is_admin_request():
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        return False
+    return get_jwt().get("role") == RoleEnum.ADMIN.value
+
+
+def profiling_enabled():
+    return bool(current_app.config.get("PROFILING_ENABLED", False))
+
+
+def profiles_dir():
+    return current_app.config["PROFILING_DIR"]
+
+
+def _new_profile_id():
+    endpoint = re.sub(r"[^a-z0-9_.]", "_", (request.endpoint or "none").lower())
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:8]}"
+
+
+def _prune_profiles(directory, max_files):
+    files = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".prof")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in files[: max(0, len(files) - max_files)]:
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
+
+
+def list_profiles():
+    directory = profiles_dir()
+    if not os.path.isdir(directory):
+        return []
+    return sorted((entry.name[:-5] for entry in os.scandir(directory) if entry.name.endswith(".prof")), reverse=True)
+
+
+def render_profile(profile_id, sort="cumulative", limit=40):
+    if not PROFILE_ID_RE.match(profile_id or ""):
+        raise ValueError("Perfil inválido")
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort inválido. Valores permitidos: {', '.join(sorted(SORT_KEYS))}")
+
+    path = os.path.join(profiles_dir(), f"{profile_id}.prof")
+    if not os.path.exists(path):
+        raise LookupError("Perfil no encontrado")
+
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(int(limit))
+    return output.getvalue()
+
+
+def _before_request():
+    if not _wants_profile() or not _is_admin_request():
+        return
+
+    slots = current_app.extensions["profiling_slots"]
+    if not slots.acquire(blocking=False):
+        g.profile_status = "ocupado"
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Otro profiler ya está activo en el proceso.
+        slots.release()
+        g.profile_status = "ocupado"
+        return
+
+    g.profiler = profiler
+    g.profile_slots = slots
+
+
+def _after_request(response):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        status = g.pop("profile_status", None)
+        if status:
+            response.headers["X-Profile-Status"] = status
+        return response
+
+    profiler.disable()
+    directory = profiles_dir()
+    os.makedirs(directory, exist_ok=True)
+    profile_id = _new_profile_id()
+    profiler.dump_stats(os.path.join(directory, f"{profile_id}.prof"))
+    _prune_profiles(directory, int(current_app.config.get("PROFILING_MAX_FILES", 50)))
+
+    response.headers["X-Profile-Status"] = "guardado"
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+def _teardown_request(exc):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+    slots = g.pop("profile_slots", None)
+    if slots is not None:
+        slots.release()
+
+
+def init_profiling(app):
+    if not app.config.get("PROFILING_ENABLED", False):
+        return
+
+    if not app.config.get("PROFILING_DIR"):
+        app.config["PROFILING_DIR"] = os.path.join(tempfile.gettempdir(), "garrobito_profiles")
+    app.extensions["profiling_slots"] = threading.BoundedSemaphore(int(app.config.get("PROFILING_MAX_CONCURRENT", 1)))
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -1,10 +1,20 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
+from sqlalchemy.orm.exc import StaleDataError
 
 from app.auth_utils import roles_required
 from app.extensions import db
-from app.models import CierreCaja, Cobro, CobroMetodoEnum, RoleEnum
-from app.routes.utils import enum_value, error_response, parse_enum
+from app.idempotency import idempotent
+from app.metrics import record_order_transition, record_payment
+from app.models import CierreCaja, Cobro, CobroMetodoEnum, Pedido, PedidoEstadoEnum, RoleEnum
+from app.routes.utils import (
+    conflict_response,
+    enum_value,
+    error_response,
+    if_match_fails,
+    parse_enum,
+    precondition_failed_response,
+)
 from app.services.cash_service import CashError, close_cashbox, get_open_cashbox, open_cashbox, register_payment
 
 
@@ -56,6 +66,8 @@ def apertura_caja():
         db.session.rollback()
         return error_response(str(exc))
 
+    db.session.commit()
+
     return jsonify(
         {
             "id": apertura.id,
@@ -70,6 +82,7 @@ def apertura_caja():
 @caja_bp.post("/cobro")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN, RoleEnum.CAJERO)
+@idempotent
 def cobro():
     data = request.get_json() or {}
     pedido_id = data.get("pedido_id")
@@ -83,12 +96,23 @@ def cobro():
     except ValueError as exc:
         return error_response(str(exc))
 
+    pedido = db.session.get(Pedido, int(pedido_id))
+    if pedido and if_match_fails(pedido.version):
+        return precondition_failed_response(pedido.version)
+
     try:
         with db.session.begin_nested():
             cobro_obj = register_payment(pedido_id=int(pedido_id), metodo=metodo)
+        db.session.commit()
     except CashError as exc:
         db.session.rollback()
         return error_response(str(exc))
+    except StaleDataError:
+        db.session.rollback()
+        return conflict_response()
+
+    record_order_transition(PedidoEstadoEnum.SERVIDO, PedidoEstadoEnum.COBRADO)
+    record_payment(cobro_obj.metodo, cobro_obj.monto)
 
     return jsonify(
         {
@@ -118,6 +142,8 @@ def cierre():
         db.session.rollback()
         return error_response(str(exc))
 
+    db.session.commit()
+
     return jsonify(
         {
             "id": cierre_obj.id,
@@ -2,26 +2,59 @@ from datetime import datetime
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import selectinload
 
 from app.auth_utils import roles_required
 from app.extensions import db
-from app.models import Compra, DetalleCompra, RoleEnum
-from app.routes.utils import error_response
+from app.idempotency import idempotent
+from app.models import Compra, DetalleCompra, Proveedor, RoleEnum
+from app.money import money, quantity
+from app.routes.utils import error_response, include_detalles, keyset_paginate, with_next_cursor
 from app.services.inventory_service import InventoryError, register_purchase
+from app.services.supplier_service import filter_compras_by_proveedor, get_or_create_proveedor
 
 
 compras_bp = Blueprint("compras", __name__, url_prefix="/compras")
 
 
+def _compra_json(compra, detalles=True):
+    data = {
+        "id": compra.id,
+        "proveedor": compra.proveedor,
+        "proveedor_id": compra.proveedor_id,
+        "fecha": compra.fecha.isoformat(),
+        "total": compra.total,
+    }
+    if detalles:
+        data["detalles"] = [
+            {
+                "id": d.id,
+                "producto_id": d.producto_id,
+                "cantidad": d.cantidad,
+                "costo_unitario": d.costo_unitario,
+                "subtotal": d.subtotal,
+            }
+            for d in compra.detalles
+        ]
+    return data
+
+
 @compras_bp.get("")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN)
 def list_compras():
     query = db.session.query(Compra)
 
+    proveedor_id = request.args.get("proveedor_id")
+    if proveedor_id:
+        try:
+            query = query.filter(Compra.proveedor_id == int(proveedor_id))
+        except ValueError:
+            return error_response("proveedor_id debe ser numérico")
+
     proveedor = request.args.get("proveedor")
     if proveedor:
-        query = query.filter(Compra.proveedor.ilike(f"%{proveedor.strip()}%"))
+        query = filter_compras_by_proveedor(query, proveedor)
 
     date_from = request.args.get("date_from")
     if date_from:
@@ -37,59 +70,60 @@ def list_compras():
         except ValueError:
             return error_response("date_to inválido, usa YYYY-MM-DD")
 
-    compras = query.order_by(Compra.fecha.desc(), Compra.id.desc()).all()
-    return jsonify(
-        [
-            {
-                "id": c.id,
-                "proveedor": c.proveedor,
-                "fecha": c.fecha.isoformat(),
-                "total": c.total,
-                "detalles": [
-                    {
-                        "id": d.id,
-                        "producto_id": d.producto_id,
-                        "cantidad": d.cantidad,
-                        "costo_unitario": d.costo_unitario,
-                        "subtotal": d.subtotal,
-                    }
-                    for d in c.detalles
-                ],
-            }
-            for c in compras
-        ]
-    )
+    detalles = include_detalles()
+    if detalles:
+        query = query.options(selectinload(Compra.detalles))
+    try:
+        compras, next_cursor = keyset_paginate(query, Compra.fecha, Compra.id)
+    except ValueError as exc:
+        return error_response(str(exc))
+    return with_next_cursor(jsonify([_compra_json(c, detalles) for c in compras]), next_cursor)
 
 
 @compras_bp.post("")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN)
+@idempotent
 def create_compra():
     data = request.get_json() or {}
-    proveedor = data.get("proveedor")
+    proveedor_nombre = data.get("proveedor")
+    proveedor_id = data.get("proveedor_id")
     fecha_raw = data.get("fecha")
     detalles = data.get("detalles", [])
 
-    if not proveedor or not isinstance(detalles, list) or not detalles:
+    if not (proveedor_nombre or proveedor_id) or not isinstance(detalles, list) or not detalles:
         return error_response("proveedor y detalles son requeridos")
 
+    proveedor = None
+    if proveedor_id:
+        try:
+            proveedor = db.session.get(Proveedor, int(proveedor_id))
+        except (TypeError, ValueError):
+            return error_response("proveedor_id debe ser numérico")
+        if proveedor is None:
+            return error_response("Proveedor no encontrado", 404)
+        proveedor_nombre = proveedor.nombre
+
     try:
         fecha = datetime.fromisoformat(fecha_raw) if fecha_raw else datetime.utcnow()
         with db.session.begin_nested():
-            compra = Compra(proveedor=proveedor, fecha=fecha, total=0.0)
+            if proveedor is None:
+                proveedor = get_or_create_proveedor(proveedor_nombre)
+            compra = Compra(proveedor=proveedor_nombre, proveedor_id=proveedor.id, fecha=fecha, total=0)
             db.session.add(compra)
             db.session.flush()
 
-            total = 0.0
+            total = money(0)
+            entradas = []
             for item in detalles:
                 producto_id = item.get("producto_id")
-                cantidad = float(item.get("cantidad", 0))
-                costo_unitario = float(item.get("costo_unitario", 0))
+                cantidad = quantity(float(item.get("cantidad", 0)))
+                costo_unitario = quantity(float(item.get("costo_unitario", 0)))
 
                 if not producto_id or cantidad <= 0 or costo_unitario < 0:
                     raise ValueError("Detalle de compra inválido")
 
-                subtotal = cantidad * costo_unitario
+                subtotal = money(cantidad * costo_unitario)
                 det = DetalleCompra(
                     compra_id=compra.id,
                     producto_id=int(producto_id),
@@ -98,19 +132,24 @@ def create_compra():
                     subtotal=subtotal,
                 )
                 db.session.add(det)
+                entradas.append((int(producto_id), cantidad, costo_unitario))
+                total += subtotal
 
+            # Orden por producto para tomar los locks de fila siempre en la misma secuencia.
+            for producto_id, cantidad, costo_unitario in sorted(entradas, key=lambda entrada: entrada[0]):
                 register_purchase(
-                    producto_id=int(producto_id),
+                    producto_id=producto_id,
                     cantidad=cantidad,
                     costo_compra=costo_unitario,
                     referencia_tipo="COMPRA",
                     referencia_id=compra.id,
                 )
-                total += subtotal
 
             compra.total = total
     except (ValueError, InventoryError) as exc:
         db.session.rollback()
         return error_response(str(exc))
 
-    return jsonify({"id": compra.id, "proveedor": compra.proveedor, "fecha": compra.fecha.isoformat(), "total": compra.total}), 201
+    db.session.commit()
+
+    return jsonify(_compra_json(compra, detalles=False)), 201
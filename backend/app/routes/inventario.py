@@ -1,11 +1,26 @@
-from flask import Blueprint, jsonify, request
+import math
+from datetime import datetime, timedelta
+from decimal import InvalidOperation
+
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import jwt_required
 
 from app.auth_utils import roles_required
 from app.extensions import db
 from app.models import MovimientoInventario, Producto, RoleEnum
-from app.routes.utils import enum_value, error_response
-from app.services.inventory_service import InventoryError, register_purchase
+from app.money import CANTIDAD_MAXIMA, quantity
+from app.routes.utils import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, enum_value, error_response
+from app.services.inventory_service import (
+    InventoryError,
+    low_stock_products,
+    register_purchase,
+    set_stock_minimo,
+    stock_alerts,
+    valuation_report,
+    verify_kardex,
+)
+from app.services.kardex_service import replay_kardex
+from app.services.recipe_service import mark_producto_changed
 
 
 inventario_bp = Blueprint("inventario", __name__)
@@ -25,6 +40,24 @@ ALLOWED_UNITS = {
 }
 
 
+STOCK_MINIMO_INVALIDO = f"stock_minimo debe ser numérico y no mayor a {CANTIDAD_MAXIMA}"
+
+
+def _parse_stock_minimo(raw_value):
+    """Convierte `stock_minimo` a la escala de su columna; None si no es un número que quepa en ella."""
+    try:
+        value = float(raw_value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(value):
+        return None
+    try:
+        value = quantity(value)
+    except InvalidOperation:
+        return None
+    return value if value <= CANTIDAD_MAXIMA else None
+
+
 def normalize_unit(raw_value):
     if raw_value is None:
         return None
@@ -48,7 +81,11 @@ def list_productos():
                 "nombre": p.nombre,
                 "unidad": p.unidad,
                 "stock_actual": p.stock_actual,
+                "stock_reservado": p.stock_reservado,
+                "stock_disponible": quantity(p.stock_actual) - quantity(p.stock_reservado),
                 "costo_promedio": p.costo_promedio,
+                "stock_minimo": p.stock_minimo,
+                "bajo_stock": p.bajo_stock,
                 "activo": p.activo,
             }
             for p in productos
@@ -69,6 +106,9 @@ def create_producto():
 
     stock_inicial = float(data.get("stock_actual", 0.0))
     costo_inicial = float(data.get("costo_promedio", 0.0))
+    stock_minimo = _parse_stock_minimo(data.get("stock_minimo", 0))
+    if stock_minimo is None:
+        return error_response(STOCK_MINIMO_INVALIDO)
     if stock_inicial < 0:
         return error_response("stock_actual no puede ser negativo")
     if stock_inicial > 0 and costo_inicial < 0:
@@ -94,10 +134,14 @@ def create_producto():
                     referencia_tipo="PRODUCTO_INICIAL",
                     referencia_id=producto.id,
                 )
+            # El mínimo se fija después del stock inicial: así solo alerta si el producto parte bajo mínimo.
+            if stock_minimo:
+                set_stock_minimo(producto.id, stock_minimo)
     except InventoryError as exc:
         db.session.rollback()
         return error_response(str(exc))
 
+    db.session.commit()
     return jsonify({"id": producto.id, "nombre": producto.nombre, "stock_actual": producto.stock_actual}), 201
 
 
@@ -119,6 +163,16 @@ def update_producto(producto_id):
         producto.unidad = unidad
     if "activo" in data:
         producto.activo = bool(data["activo"])
+        mark_producto_changed(producto.id)
+    if "stock_minimo" in data:
+        stock_minimo = _parse_stock_minimo(data["stock_minimo"])
+        if stock_minimo is None:
+            return error_response(STOCK_MINIMO_INVALIDO)
+        try:
+            set_stock_minimo(producto.id, stock_minimo)
+        except InventoryError as exc:
+            db.session.rollback()
+            return error_response(str(exc))
 
     db.session.commit()
     return jsonify(
@@ -128,11 +182,102 @@ def update_producto(producto_id):
             "unidad": producto.unidad,
             "stock_actual": producto.stock_actual,
             "costo_promedio": producto.costo_promedio,
+            "stock_minimo": producto.stock_minimo,
+            "bajo_stock": producto.bajo_stock,
             "activo": producto.activo,
         }
     )
 
 
+@inventario_bp.get("/inventario/bajo-stock")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN, RoleEnum.CAJERO, RoleEnum.COCINA)
+def get_bajo_stock():
+    return jsonify(low_stock_products())
+
+
+@inventario_bp.get("/inventario/alertas")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN, RoleEnum.CAJERO, RoleEnum.COCINA)
+def get_alertas_stock():
+    """Alertas posteriores a `despues_de`; se consultan periódicamente pasando el `ultimo_id` recibido."""
+    try:
+        despues_de = int(request.args.get("despues_de", 0))
+        limite = int(request.args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return error_response("despues_de y limit deben ser numéricos")
+    if not 1 <= limite <= MAX_PAGE_SIZE:
+        return error_response(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+    # Las alertas más recientes esperan unos segundos para no saltarse las que aún no se confirman.
+    hasta = datetime.utcnow() - timedelta(seconds=float(current_app.config.get("STOCK_ALERTS_DELAY_SECONDS", 10)))
+    return jsonify(stock_alerts(despues_de=despues_de, limite=limite, hasta=hasta))
+
+
+@inventario_bp.get("/inventario/valorizacion")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def get_valorizacion():
+    """Valor del inventario por producto o unidad (`agrupacion`); con `fecha` (YYYY-MM-DD) al cierre de ese día."""
+    corte = None
+    fecha = request.args.get("fecha")
+    if fecha:
+        try:
+            corte = datetime.fromisoformat(fecha + "T23:59:59.999999")
+        except ValueError:
+            return error_response("fecha inválida, usa YYYY-MM-DD")
+
+    try:
+        reporte = valuation_report(request.args.get("agrupacion", "producto"), corte)
+    except ValueError as exc:
+        return error_response(str(exc))
+    return jsonify(reporte)
+
+
+@inventario_bp.get("/kardex/verificacion")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def get_kardex_verificacion():
+    """Revisa el kardex de todos los productos; `limite` acota cuántas inconsistencias se listan."""
+    try:
+        limite = int(request.args.get("limite", 100))
+    except ValueError:
+        return error_response("limite debe ser numérico")
+    if limite < 0:
+        return error_response("limite no puede ser negativo")
+    return jsonify(verify_kardex(limite=limite))
+
+
+@inventario_bp.post("/kardex/recalcular")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def recalcular_kardex():
+    """Recalcula saldos y costo promedio desde `desde`.
+
+    Por defecto solo devuelve las diferencias; para escribirlas hay que enviar `"dry_run": false`.
+    """
+    data = request.get_json() or {}
+    producto_id = data.get("producto_id")
+    desde_raw = data.get("desde")
+    dry_run = data.get("dry_run", True)
+    if not isinstance(dry_run, bool):
+        return error_response("dry_run debe ser true o false")
+
+    try:
+        producto_id = int(producto_id) if producto_id is not None else None
+        desde = datetime.fromisoformat(desde_raw) if desde_raw else None
+    except (TypeError, ValueError):
+        return error_response("producto_id o desde inválido (desde: YYYY-MM-DD o ISO 8601)")
+    if producto_id is not None and not db.session.get(Producto, producto_id):
+        return error_response("Producto no encontrado", 404)
+
+    resultado = replay_kardex(producto_id=producto_id, desde=desde, dry_run=dry_run)
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return jsonify(resultado)
+
+
 @inventario_bp.get("/kardex/<int:producto_id>")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN, RoleEnum.CAJERO, RoleEnum.COCINA)
@@ -1,21 +1,34 @@
 from datetime import datetime
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import jwt_required
+from sqlalchemy import bindparam, func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 
 from app.auth_utils import roles_required
 from app.extensions import db
+from app.metrics import record_inventory_apply
 from app.models import (
     InventarioFisico,
     InventarioFisicoDet,
     InventarioFisicoEstadoEnum,
     InventarioFisicoTipoEnum,
-    MovimientoTipoEnum,
     Producto,
     RoleEnum,
 )
-from app.routes.utils import enum_value, error_response, parse_enum
-from app.services.inventory_service import InventoryError, register_output, register_positive_adjustment
+from app.money import quantity
+from app.routes.utils import (
+    conflict_response,
+    enum_value,
+    error_response,
+    include_detalles,
+    keyset_paginate,
+    parse_enum,
+    with_next_cursor,
+)
+from app.services.inventory_service import register_bulk_adjustments
+from app.services.variance_service import variance_report
 
 
 inventario_fisico_bp = Blueprint("inventario_fisico", __name__, url_prefix="/inventarios-fisicos")
@@ -57,43 +70,199 @@ def list_inventarios_fisicos():
         except ValueError:
             return error_response("date_to inválido, usa YYYY-MM-DD")
 
-    inventarios = query.order_by(InventarioFisico.fecha.desc(), InventarioFisico.id.desc()).all()
-    return jsonify(
-        [
+    detalles = include_detalles()
+    if detalles:
+        query = query.options(selectinload(InventarioFisico.detalles))
+    try:
+        inventarios, next_cursor = keyset_paginate(query, InventarioFisico.fecha, InventarioFisico.id)
+    except ValueError as exc:
+        return error_response(str(exc))
+    return with_next_cursor(jsonify([_inventario_json(inv, detalles) for inv in inventarios]), next_cursor)
+
+
+@inventario_fisico_bp.get("/varianza")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def get_varianza():
+    """Merma y sobrante por producto y período (`agrupacion=mes|anio`) de los inventarios aplicados."""
+    desde = hasta = producto_id = None
+    try:
+        if request.args.get("date_from"):
+            desde = datetime.fromisoformat(request.args["date_from"])
+        if request.args.get("date_to"):
+            hasta = datetime.fromisoformat(request.args["date_to"] + "T23:59:59")
+    except ValueError:
+        return error_response("date_from/date_to inválido, usa YYYY-MM-DD")
+    if request.args.get("producto_id"):
+        try:
+            producto_id = int(request.args["producto_id"])
+        except ValueError:
+            return error_response("producto_id debe ser numérico")
+
+    try:
+        reporte = variance_report(request.args.get("agrupacion", "mes"), desde, hasta, producto_id)
+    except ValueError as exc:
+        return error_response(str(exc))
+    return jsonify(reporte)
+
+
+def _inventario_json(inventario, detalles=True):
+    data = {
+        "id": inventario.id,
+        "tipo": enum_value(inventario.tipo),
+        "fecha": inventario.fecha.isoformat(),
+        "estado": enum_value(inventario.estado),
+    }
+    if detalles:
+        data["detalles"] = [
             {
-                "id": inv.id,
-                "tipo": enum_value(inv.tipo),
-                "fecha": inv.fecha.isoformat(),
-                "estado": enum_value(inv.estado),
-                "detalles": [
-                    {
-                        "id": d.id,
-                        "producto_id": d.producto_id,
-                        "conteo": d.conteo,
-                        "stock_sistema": d.stock_sistema,
-                        "diferencia": d.diferencia,
-                    }
-                    for d in inv.detalles
-                ],
+                "id": d.id,
+                "producto_id": d.producto_id,
+                "conteo": d.conteo,
+                "stock_sistema": d.stock_sistema,
+                "diferencia": d.diferencia,
             }
-            for inv in inventarios
+            for d in inventario.detalles
         ]
+    return data
+
+
+def _parse_detalles(detalles):
+    if not isinstance(detalles, list) or not detalles:
+        raise ValueError("detalles debe ser una lista no vacía")
+
+    lineas = []
+    seen = set()
+    for item in detalles:
+        if not isinstance(item, dict):
+            raise ValueError("producto_id y conteo son requeridos")
+        producto_id = item.get("producto_id")
+        conteo = item.get("conteo")
+        if not producto_id or conteo is None:
+            raise ValueError("producto_id y conteo son requeridos")
+        try:
+            producto_id_int = int(producto_id)
+            conteo_val = quantity(float(conteo))
+        except (TypeError, ValueError) as exc:
+            raise ValueError("producto_id y conteo deben ser numéricos") from exc
+        if conteo_val < 0:
+            raise ValueError("conteo no puede ser negativo")
+        if producto_id_int in seen:
+            raise ValueError(f"producto_id duplicado en conteo: {producto_id_int}")
+        seen.add(producto_id_int)
+        lineas.append((producto_id_int, conteo_val))
+    return lineas
+
+
+def _upsert_lineas(inventario_id, lineas, sumar=False):
+    """Inserta o actualiza por producto las líneas del conteo con un executemany por operación.
+
+    El stock y las líneas existentes se leen con una consulta IN cada uno. `stock_sistema` guarda
+    el stock al momento de contar solo como referencia: al aplicar se vuelve a calcular.
+    """
+    producto_ids = {producto_id for producto_id, _ in lineas}
+    stock = dict(db.session.query(Producto.id, Producto.stock_actual).filter(Producto.id.in_(producto_ids)))
+    for producto_id, _ in lineas:
+        if producto_id not in stock:
+            raise ValueError(f"Producto {producto_id} no encontrado")
+
+    existentes = dict(
+        db.session.query(InventarioFisicoDet.producto_id, InventarioFisicoDet.conteo).filter(
+            InventarioFisicoDet.inventario_fisico_id == inventario_id,
+            InventarioFisicoDet.producto_id.in_(producto_ids),
+        )
     )
 
+    nuevas = []
+    cambios = []
+    for producto_id, conteo in lineas:
+        stock_sistema = quantity(stock[producto_id])
+        if producto_id in existentes:
+            if sumar:
+                conteo = quantity(existentes[producto_id]) + conteo
+            cambios.append(
+                {
+                    "b_producto_id": producto_id,
+                    "b_conteo": conteo,
+                    "b_stock_sistema": stock_sistema,
+                    "b_diferencia": conteo - stock_sistema,
+                }
+            )
+        else:
+            nuevas.append(
+                {
+                    "inventario_fisico_id": inventario_id,
+                    "producto_id": producto_id,
+                    "conteo": conteo,
+                    "stock_sistema": stock_sistema,
+                    "diferencia": conteo - stock_sistema,
+                }
+            )
+
+    if cambios:
+        tabla = InventarioFisicoDet.__table__
+        db.session.execute(
+            tabla.update()
+            .where(tabla.c.inventario_fisico_id == inventario_id, tabla.c.producto_id == bindparam("b_producto_id"))
+            .values(
+                conteo=bindparam("b_conteo"),
+                stock_sistema=bindparam("b_stock_sistema"),
+                diferencia=bindparam("b_diferencia"),
+            ),
+            cambios,
+        )
+    if nuevas:
+        db.session.execute(insert(InventarioFisicoDet), nuevas)
+    return len(nuevas), len(cambios)
+
+
+def _count_lineas(inventario_id):
+    return (
+        db.session.query(func.count(InventarioFisicoDet.id))
+        .filter(InventarioFisicoDet.inventario_fisico_id == inventario_id)
+        .scalar()
+    )
+
+
+def _get_borrador_or_raise(inventario_id):
+    # Bloquea el conteo: dos /aplicar simultáneos (o una carga de líneas durante la aplicación) se
+    # serializan y el segundo ve el estado ya confirmado, no la foto que leyó antes de esperar.
+    inventario = (
+        db.session.query(InventarioFisico)
+        .filter(InventarioFisico.id == inventario_id)
+        .populate_existing()
+        .with_for_update()
+        .one_or_none()
+    )
+    if not inventario:
+        raise ValueError("Inventario físico no encontrado")
+    if inventario.estado == InventarioFisicoEstadoEnum.APLICADO:
+        raise ValueError("Inventario físico ya aplicado")
+    return inventario
+
+
+@inventario_fisico_bp.get("/<int:inventario_id>")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def get_inventario_fisico(inventario_id):
+    inventario = db.session.get(InventarioFisico, inventario_id)
+    if not inventario:
+        return error_response("Inventario físico no encontrado", 404)
+    return jsonify(_inventario_json(inventario))
+
 
 @inventario_fisico_bp.post("")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN)
 def create_inventario_fisico():
+    """Crea un conteo. Sin `detalles` queda como borrador vacío para cargar líneas por partes."""
     data = request.get_json() or {}
     tipo_raw = data.get("tipo")
     fecha_raw = data.get("fecha")
-    detalles = data.get("detalles", [])
+    detalles = data.get("detalles")
 
     if not tipo_raw:
         return error_response("tipo es requerido")
-    if not isinstance(detalles, list) or not detalles:
-        return error_response("detalles debe ser una lista no vacía")
 
     try:
         tipo = parse_enum(InventarioFisicoTipoEnum, tipo_raw, "tipo")
@@ -102,76 +271,108 @@ def create_inventario_fisico():
 
     try:
         fecha = datetime.fromisoformat(fecha_raw) if fecha_raw else datetime.utcnow()
+        lineas = _parse_detalles(detalles) if detalles is not None else []
         with db.session.begin_nested():
             inventario = InventarioFisico(tipo=tipo, fecha=fecha, estado=InventarioFisicoEstadoEnum.BORRADOR)
             db.session.add(inventario)
             db.session.flush()
-
-            for item in detalles:
-                producto_id = item.get("producto_id")
-                conteo = item.get("conteo")
-                if not producto_id or conteo is None:
-                    raise ValueError("producto_id y conteo son requeridos")
-
-                producto = db.session.get(Producto, int(producto_id))
-                if not producto:
-                    raise ValueError(f"Producto {producto_id} no encontrado")
-
-                stock_sistema = float(producto.stock_actual)
-                conteo_val = float(conteo)
-                diferencia = conteo_val - stock_sistema
-
-                det = InventarioFisicoDet(
-                    inventario_fisico_id=inventario.id,
-                    producto_id=int(producto_id),
-                    conteo=conteo_val,
-                    stock_sistema=stock_sistema,
-                    diferencia=diferencia,
-                )
-                db.session.add(det)
+            if lineas:
+                _upsert_lineas(inventario.id, lineas)
     except ValueError as exc:
         db.session.rollback()
         return error_response(str(exc), 404 if "no encontrado" in str(exc) else 400)
 
+    db.session.commit()
     return jsonify({"id": inventario.id, "tipo": enum_value(inventario.tipo), "estado": enum_value(inventario.estado)}), 201
 
 
+@inventario_fisico_bp.post("/<int:inventario_id>/detalles")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def upsert_detalles_inventario_fisico(inventario_id):
+    """Agrega o corrige líneas de un borrador; cada producto tiene una sola línea por conteo.
+
+    Con `"modo": "sumar"` la cantidad se suma a la ya contada (mismo producto en otra ubicación);
+    por defecto la reemplaza, así reenviar el mismo lote tras un corte de red no duplica nada.
+    """
+    data = request.get_json() or {}
+    modo = data.get("modo", "reemplazar")
+    if modo not in ("reemplazar", "sumar"):
+        return error_response("modo inválido (reemplazar o sumar)")
+
+    try:
+        lineas = _parse_detalles(data.get("detalles"))
+        with db.session.begin_nested():
+            _get_borrador_or_raise(inventario_id)
+            nuevas, actualizadas = _upsert_lineas(inventario_id, lineas, sumar=modo == "sumar")
+        db.session.commit()
+    except ValueError as exc:
+        db.session.rollback()
+        return error_response(str(exc), 404 if "no encontrado" in str(exc) else 400)
+    except IntegrityError:
+        # Otro dispositivo insertó la misma línea entre la lectura y el INSERT.
+        db.session.rollback()
+        return conflict_response()
+
+    return jsonify(
+        {"id": inventario_id, "nuevas": nuevas, "actualizadas": actualizadas, "lineas": _count_lineas(inventario_id)}
+    )
+
+
+@inventario_fisico_bp.delete("/<int:inventario_id>/detalles/<int:producto_id>")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def delete_detalle_inventario_fisico(inventario_id, producto_id):
+    try:
+        _get_borrador_or_raise(inventario_id)
+    except ValueError as exc:
+        return error_response(str(exc), 404 if "no encontrado" in str(exc) else 400)
+
+    borradas = (
+        db.session.query(InventarioFisicoDet)
+        .filter(InventarioFisicoDet.inventario_fisico_id == inventario_id, InventarioFisicoDet.producto_id == producto_id)
+        .delete(synchronize_session=False)
+    )
+    if not borradas:
+        return error_response("Línea de conteo no encontrada", 404)
+    db.session.commit()
+    return jsonify({"id": inventario_id, "lineas": _count_lineas(inventario_id)})
+
+
 @inventario_fisico_bp.post("/<int:inventario_id>/aplicar")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN)
 def apply_inventario_fisico(inventario_id):
     try:
         with db.session.begin_nested():
-            inventario = db.session.get(InventarioFisico, inventario_id)
-            if not inventario:
-                raise ValueError("Inventario físico no encontrado")
-            if inventario.estado == InventarioFisicoEstadoEnum.APLICADO:
-                raise ValueError("Inventario físico ya aplicado")
-
-            detalles = db.session.query(InventarioFisicoDet).filter(InventarioFisicoDet.inventario_fisico_id == inventario_id).all()
-            for det in detalles:
-                diferencia = float(det.diferencia)
-                if diferencia > 0:
-                    register_positive_adjustment(
-                        producto_id=det.producto_id,
-                        cantidad=diferencia,
-                        referencia_tipo="INVENTARIO_FISICO",
-                        referencia_id=inventario_id,
-                    )
-                elif diferencia < 0:
-                    register_output(
-                        producto_id=det.producto_id,
-                        cantidad=abs(diferencia),
-                        tipo=MovimientoTipoEnum.AJUSTE_NEG,
-                        referencia_tipo="INVENTARIO_FISICO",
-                        referencia_id=inventario_id,
-                    )
+            inventario = _get_borrador_or_raise(inventario_id)
+            conteos = dict(
+                db.session.query(InventarioFisicoDet.producto_id, InventarioFisicoDet.conteo).filter(
+                    InventarioFisicoDet.inventario_fisico_id == inventario_id
+                )
+            )
+            if not conteos:
+                raise ValueError("El inventario físico no tiene líneas")
+
+            # La diferencia se calcula contra el stock al aplicar, no contra la foto de cuando se contó.
+            resumen = register_bulk_adjustments(conteos, "INVENTARIO_FISICO", inventario_id, conteo=True)
+            tabla = InventarioFisicoDet.__table__
+            db.session.execute(
+                tabla.update()
+                .where(tabla.c.inventario_fisico_id == inventario_id, tabla.c.producto_id == bindparam("b_producto_id"))
+                .values(stock_sistema=bindparam("b_stock_sistema"), diferencia=tabla.c.conteo - bindparam("b_stock_sistema")),
+                [
+                    {"b_producto_id": producto_id, "b_stock_sistema": stock}
+                    for producto_id, stock in resumen.pop("stock_sistema").items()
+                ],
+            )
+            db.session.expire(inventario, ["detalles"])
             inventario.estado = InventarioFisicoEstadoEnum.APLICADO
     except ValueError as exc:
         db.session.rollback()
         return error_response(str(exc), 404 if "no encontrado" in str(exc) else 400)
-    except InventoryError as exc:
-        db.session.rollback()
-        return error_response(str(exc))
 
-    return jsonify({"id": inventario.id, "estado": enum_value(inventario.estado)})
+    db.session.commit()
+    record_inventory_apply(resumen)
+    current_app.logger.info("Inventario físico %s aplicado: %s", inventario_id, resumen)
+    return jsonify({"id": inventario.id, "estado": enum_value(inventario.estado), **resumen})
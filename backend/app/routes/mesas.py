@@ -1,10 +1,19 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
+from sqlalchemy.orm.exc import StaleDataError
 
 from app.auth_utils import roles_required
 from app.extensions import db
 from app.models import Mesa, MesaEstadoEnum, Pedido, PedidoEstadoEnum, RoleEnum
-from app.routes.utils import enum_value, error_response, parse_enum
+from app.routes.utils import (
+    conflict_response,
+    enum_value,
+    error_response,
+    if_match_fails,
+    parse_enum,
+    precondition_failed_response,
+    with_etag,
+)
 
 
 mesas_bp = Blueprint("mesas", __name__, url_prefix="/mesas")
@@ -16,7 +25,7 @@ mesas_bp = Blueprint("mesas", __name__, url_prefix="/mesas")
 def list_mesas():
     mesas = db.session.query(Mesa).order_by(Mesa.numero.asc()).all()
     return jsonify([
-        {"id": m.id, "numero": m.numero, "estado": enum_value(m.estado)}
+        {"id": m.id, "numero": m.numero, "estado": enum_value(m.estado), "version": m.version}
         for m in mesas
     ])
 
@@ -40,7 +49,8 @@ def create_mesa():
     mesa = Mesa(numero=int(numero), estado=estado)
     db.session.add(mesa)
     db.session.commit()
-    return jsonify({"id": mesa.id, "numero": mesa.numero, "estado": enum_value(mesa.estado)}), 201
+    response = jsonify({"id": mesa.id, "numero": mesa.numero, "estado": enum_value(mesa.estado), "version": mesa.version})
+    return with_etag(response, mesa.version), 201
 
 
 @mesas_bp.patch("/<int:mesa_id>")
@@ -50,6 +60,8 @@ def update_mesa(mesa_id):
     mesa = db.session.get(Mesa, mesa_id)
     if not mesa:
         return error_response("Mesa no encontrada", 404)
+    if if_match_fails(mesa.version):
+        return precondition_failed_response(mesa.version)
 
     data = request.get_json() or {}
     if "estado" in data:
@@ -73,5 +85,10 @@ def update_mesa(mesa_id):
     if "numero" in data:
         mesa.numero = int(data["numero"])
 
-    db.session.commit()
-    return jsonify({"id": mesa.id, "numero": mesa.numero, "estado": enum_value(mesa.estado)})
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return conflict_response()
+    response = jsonify({"id": mesa.id, "numero": mesa.numero, "estado": enum_value(mesa.estado), "version": mesa.version})
+    return with_etag(response, mesa.version)
@@ -1,18 +1,51 @@
+import math
 from datetime import datetime, time
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt, jwt_required
+from sqlalchemy.orm.exc import StaleDataError
 
 from app.auth_utils import roles_required
 from app.extensions import db
-from app.models import Mesa, MesaEstadoEnum, Pedido, PedidoDetalle, PedidoEstadoEnum, RoleEnum, User
-from app.routes.utils import enum_value, error_response, parse_enum
-from app.services.order_service import OrderError, add_item_to_order
+from app.idempotency import idempotent
+from app.metrics import record_order_transition
+from app.models import Pedido, PedidoDetalle, PedidoEstadoEnum, RoleEnum, User
+from app.routes.utils import (
+    conflict_response,
+    enum_value,
+    error_response,
+    if_match_fails,
+    parse_enum,
+    precondition_failed_response,
+    with_etag,
+)
+from app.services.order_service import (
+    OrderError,
+    add_item_to_order,
+    add_items_to_order,
+    claim_mesa,
+    line_subtotal,
+    recalculate_order_total,
+    release_mesa,
+    release_order_reservations,
+    sync_order_reservations,
+)
 
 
 pedidos_bp = Blueprint("pedidos", __name__, url_prefix="/pedidos")
 
 
+def _detalle_json(detalle):
+    return {
+        "id": detalle.id,
+        "pedido_id": detalle.pedido_id,
+        "platillo_id": detalle.platillo_id,
+        "cantidad": detalle.cantidad,
+        "precio_unitario": detalle.precio_unitario,
+        "subtotal": detalle.subtotal,
+    }
+
+
 @pedidos_bp.get("")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN, RoleEnum.MESERO, RoleEnum.COCINA, RoleEnum.CAJERO)
@@ -52,6 +85,7 @@ def list_pedidos():
                 "user_id": p.user_id,
                 "estado": enum_value(p.estado),
                 "total": p.total,
+                "version": p.version,
                 "created_at": p.created_at.isoformat(),
                 "detalles": [
                     {
@@ -72,6 +106,7 @@ def list_pedidos():
 @pedidos_bp.post("")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN, RoleEnum.MESERO)
+@idempotent
 def create_pedido():
     data = request.get_json() or {}
     mesa_id = data.get("mesa_id")
@@ -82,23 +117,33 @@ def create_pedido():
 
     try:
         with db.session.begin_nested():
-            mesa = db.session.get(Mesa, int(mesa_id))
             user = db.session.get(User, int(user_id))
-            if not mesa:
-                raise ValueError("Mesa no encontrada")
             if not user:
                 raise ValueError("Usuario no encontrado")
-            if mesa.estado == MesaEstadoEnum.OCUPADA:
-                raise ValueError("Mesa ocupada")
+            claim_mesa(int(mesa_id))
 
             pedido = Pedido(mesa_id=int(mesa_id), user_id=int(user_id), estado=PedidoEstadoEnum.ABIERTO, total=0.0)
-            mesa.estado = MesaEstadoEnum.OCUPADA
             db.session.add(pedido)
+        db.session.commit()
     except ValueError as exc:
         db.session.rollback()
         return error_response(str(exc), 404 if "no encontrada" in str(exc) or "no encontrado" in str(exc) else 400)
+    except StaleDataError:
+        db.session.rollback()
+        return conflict_response()
 
-    return jsonify({"id": pedido.id, "mesa_id": pedido.mesa_id, "user_id": pedido.user_id, "estado": enum_value(pedido.estado), "total": pedido.total}), 201
+    record_order_transition(None, pedido.estado)
+    response = jsonify(
+        {
+            "id": pedido.id,
+            "mesa_id": pedido.mesa_id,
+            "user_id": pedido.user_id,
+            "estado": enum_value(pedido.estado),
+            "total": pedido.total,
+            "version": pedido.version,
+        }
+    )
+    return with_etag(response, pedido.version), 201
 
 
 @pedidos_bp.post("/<int:pedido_id>/items")
@@ -110,28 +155,84 @@ def add_item(pedido_id):
     cantidad = data.get("cantidad")
     if not platillo_id or cantidad is None:
         return error_response("platillo_id y cantidad son requeridos")
+    try:
+        platillo_id, cantidad = int(platillo_id), float(cantidad)
+    except (TypeError, ValueError):
+        return error_response("platillo_id y cantidad deben ser numéricos")
+    if not math.isfinite(cantidad):
+        return error_response("cantidad inválida")
+
+    pedido = db.session.get(Pedido, pedido_id)
+    if pedido and if_match_fails(pedido.version):
+        return precondition_failed_response(pedido.version)
 
     try:
         with db.session.begin_nested():
-            detalle = add_item_to_order(pedido_id=pedido_id, platillo_id=int(platillo_id), cantidad=float(cantidad))
+            detalle = add_item_to_order(pedido_id=pedido_id, platillo_id=platillo_id, cantidad=cantidad)
+        db.session.commit()
     except OrderError as exc:
         db.session.rollback()
         return error_response(str(exc))
+    except StaleDataError:
+        db.session.rollback()
+        return conflict_response()
 
     pedido = db.session.get(Pedido, detalle.pedido_id)
-    return jsonify(
+    response = jsonify(
         {
-            "detalle": {
-                "id": detalle.id,
-                "pedido_id": detalle.pedido_id,
-                "platillo_id": detalle.platillo_id,
-                "cantidad": detalle.cantidad,
-                "precio_unitario": detalle.precio_unitario,
-                "subtotal": detalle.subtotal,
-            },
+            "detalle": _detalle_json(detalle),
             "pedido_total": pedido.total,
+            "pedido_version": pedido.version,
         }
-    ), 201
+    )
+    return with_etag(response, pedido.version), 201
+
+
+@pedidos_bp.post("/<int:pedido_id>/items/batch")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN, RoleEnum.MESERO)
+def add_items_batch(pedido_id):
+    data = request.get_json() or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return error_response("items debe ser una lista no vacía")
+
+    lineas = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("platillo_id") or item.get("cantidad") is None:
+            return error_response("Cada item requiere platillo_id y cantidad")
+        try:
+            platillo_id, cantidad = int(item["platillo_id"]), float(item["cantidad"])
+        except (TypeError, ValueError):
+            return error_response("platillo_id y cantidad deben ser numéricos")
+        if not math.isfinite(cantidad):
+            return error_response("cantidad inválida")
+        lineas.append((platillo_id, cantidad))
+
+    pedido = db.session.get(Pedido, pedido_id)
+    if pedido and if_match_fails(pedido.version):
+        return precondition_failed_response(pedido.version)
+
+    try:
+        with db.session.begin_nested():
+            detalles = add_items_to_order(pedido_id=pedido_id, lineas=lineas)
+        db.session.commit()
+    except OrderError as exc:
+        db.session.rollback()
+        return error_response(str(exc))
+    except StaleDataError:
+        db.session.rollback()
+        return conflict_response()
+
+    pedido = db.session.get(Pedido, pedido_id)
+    response = jsonify(
+        {
+            "detalles": [_detalle_json(detalle) for detalle in detalles],
+            "pedido_total": pedido.total,
+            "pedido_version": pedido.version,
+        }
+    )
+    return with_etag(response, pedido.version), 201
 
 
 @pedidos_bp.patch("/<int:pedido_id>/items/<int:detalle_id>")
@@ -146,6 +247,8 @@ def update_item(pedido_id, detalle_id):
     pedido = db.session.get(Pedido, pedido_id)
     if not pedido:
         return error_response("Pedido no encontrado", 404)
+    if if_match_fails(pedido.version):
+        return precondition_failed_response(pedido.version)
     if pedido.estado != PedidoEstadoEnum.ABIERTO:
         return error_response("Solo se pueden editar items en pedidos ABIERTO")
 
@@ -157,28 +260,32 @@ def update_item(pedido_id, detalle_id):
         cantidad_val = float(cantidad)
     except (TypeError, ValueError):
         return error_response("cantidad inválida")
+    if not math.isfinite(cantidad_val):
+        return error_response("cantidad inválida")
     if cantidad_val <= 0:
         return error_response("cantidad debe ser mayor a 0")
 
-    old_subtotal = float(detalle.subtotal)
     detalle.cantidad = cantidad_val
-    detalle.subtotal = float(detalle.precio_unitario) * cantidad_val
-    pedido.total = float(pedido.total) - old_subtotal + float(detalle.subtotal)
-    db.session.commit()
+    detalle.subtotal = line_subtotal(cantidad_val, detalle.precio_unitario)
+    try:
+        recalculate_order_total(pedido)
+        sync_order_reservations(pedido)
+        db.session.commit()
+    except OrderError as exc:
+        db.session.rollback()
+        return error_response(str(exc))
+    except StaleDataError:
+        db.session.rollback()
+        return conflict_response()
 
-    return jsonify(
+    response = jsonify(
         {
-            "detalle": {
-                "id": detalle.id,
-                "pedido_id": detalle.pedido_id,
-                "platillo_id": detalle.platillo_id,
-                "cantidad": detalle.cantidad,
-                "precio_unitario": detalle.precio_unitario,
-                "subtotal": detalle.subtotal,
-            },
+            "detalle": _detalle_json(detalle),
             "pedido_total": pedido.total,
+            "pedido_version": pedido.version,
         }
     )
+    return with_etag(response, pedido.version)
 
 
 @pedidos_bp.delete("/<int:pedido_id>/items/<int:detalle_id>")
@@ -188,6 +295,8 @@ def delete_item(pedido_id, detalle_id):
     pedido = db.session.get(Pedido, pedido_id)
     if not pedido:
         return error_response("Pedido no encontrado", 404)
+    if if_match_fails(pedido.version):
+        return precondition_failed_response(pedido.version)
     if pedido.estado != PedidoEstadoEnum.ABIERTO:
         return error_response("Solo se pueden eliminar items en pedidos ABIERTO")
 
@@ -195,11 +304,17 @@ def delete_item(pedido_id, detalle_id):
     if not detalle or detalle.pedido_id != pedido_id:
         return error_response("Detalle no encontrado", 404)
 
-    pedido.total = max(0.0, float(pedido.total) - float(detalle.subtotal))
     db.session.delete(detalle)
-    db.session.commit()
+    try:
+        recalculate_order_total(pedido)
+        sync_order_reservations(pedido)
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return conflict_response()
 
-    return jsonify({"pedido_id": pedido.id, "pedido_total": pedido.total})
+    response = jsonify({"pedido_id": pedido.id, "pedido_total": pedido.total, "pedido_version": pedido.version})
+    return with_etag(response, pedido.version)
 
 
 @pedidos_bp.patch("/<int:pedido_id>/estado")
@@ -212,6 +327,8 @@ def update_estado(pedido_id):
     pedido = db.session.get(Pedido, pedido_id)
     if not pedido:
         return error_response("Pedido no encontrado", 404)
+    if if_match_fails(pedido.version):
+        return precondition_failed_response(pedido.version)
 
     try:
         nuevo_estado = parse_enum(PedidoEstadoEnum, estado_raw, "estado")
@@ -238,13 +355,22 @@ def update_estado(pedido_id):
     if nuevo_estado not in allowed_transitions.get(pedido.estado, set()):
         return error_response(f"Transición inválida de {pedido.estado.value} a {nuevo_estado.value}", 400)
 
+    estado_anterior = pedido.estado
     pedido.estado = nuevo_estado
-    db.session.commit()
-
-    if nuevo_estado == PedidoEstadoEnum.CANCELADO:
-        mesa = db.session.get(Mesa, pedido.mesa_id)
-        if mesa:
-            mesa.estado = MesaEstadoEnum.LIBRE
-            db.session.commit()
+    try:
+        if nuevo_estado == PedidoEstadoEnum.PREPARACION:
+            sync_order_reservations(pedido)
+        if nuevo_estado == PedidoEstadoEnum.CANCELADO:
+            release_order_reservations(pedido)
+            release_mesa(pedido.mesa_id)
+        db.session.commit()
+    except OrderError as exc:
+        db.session.rollback()
+        return error_response(str(exc))
+    except StaleDataError:
+        db.session.rollback()
+        return conflict_response()
+    record_order_transition(estado_anterior, nuevo_estado)
 
-    return jsonify({"id": pedido.id, "estado": enum_value(pedido.estado)})
+    response = jsonify({"id": pedido.id, "estado": enum_value(pedido.estado), "version": pedido.version})
+    return with_etag(response, pedido.version)
@@ -4,7 +4,14 @@ from flask_jwt_extended import jwt_required
 from app.auth_utils import roles_required
 from app.extensions import db
 from app.models import Platillo, PlatilloIngrediente, Producto, RoleEnum
+from app.money import money, quantity
 from app.routes.utils import error_response
+from app.services.recipe_service import (
+    dish_availability,
+    invalidate_recipe_index,
+    margin_report,
+    refresh_platillos,
+)
 
 
 platillos_bp = Blueprint("platillos", __name__, url_prefix="/platillos")
@@ -24,7 +31,7 @@ def _validate_ingredientes_payload(ingredientes):
 
         try:
             producto_id_int = int(producto_id)
-            cantidad_val = float(cantidad_por_unidad)
+            cantidad_val = quantity(float(cantidad_por_unidad))
         except (TypeError, ValueError) as exc:
             raise ValueError("producto_id y cantidad_por_unidad deben ser numéricos") from exc
 
@@ -45,6 +52,19 @@ def _validate_ingredientes_payload(ingredientes):
     return parsed
 
 
+def _platillo_json(platillo):
+    # costo_receta lo escribe un UPDATE en SQL: se recarga para no devolver el valor previo.
+    db.session.refresh(platillo)
+    return {
+        "id": platillo.id,
+        "nombre": platillo.nombre,
+        "precio": platillo.precio,
+        "activo": platillo.activo,
+        "costo_receta": platillo.costo_receta,
+        "porciones_disponibles": platillo.porciones_disponibles,
+    }
+
+
 @platillos_bp.get("")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN, RoleEnum.CAJERO, RoleEnum.MESERO, RoleEnum.COCINA)
@@ -58,6 +78,8 @@ def list_platillos():
                 "nombre": p.nombre,
                 "precio": p.precio,
                 "activo": p.activo,
+                "costo_receta": p.costo_receta,
+                "porciones_disponibles": p.porciones_disponibles,
                 "ingredientes": [
                     {
                         "id": i.id,
@@ -71,6 +93,27 @@ def list_platillos():
     return jsonify(result)
 
 
+@platillos_bp.get("/margenes")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def list_margenes():
+    incluir_inactivos = request.args.get("incluir_inactivos", "").lower() in ("1", "true", "si")
+    return jsonify(margin_report(solo_activos=not incluir_inactivos))
+
+
+@platillos_bp.get("/disponibilidad")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN, RoleEnum.CAJERO, RoleEnum.MESERO, RoleEnum.COCINA)
+def list_disponibilidad():
+    producto_id = request.args.get("producto_id")
+    if producto_id is not None:
+        try:
+            producto_id = int(producto_id)
+        except ValueError:
+            return error_response("producto_id inválido")
+    return jsonify(dish_availability(producto_id=producto_id))
+
+
 @platillos_bp.post("")
 @jwt_required()
 @roles_required(RoleEnum.ADMIN, RoleEnum.COCINA)
@@ -84,7 +127,7 @@ def create_platillo():
         return error_response("nombre y precio son requeridos")
 
     try:
-        precio_val = float(precio)
+        precio_val = money(float(precio))
     except (TypeError, ValueError):
         return error_response("precio inválido")
     if precio_val <= 0:
@@ -106,12 +149,16 @@ def create_platillo():
                             cantidad_por_unidad=item["cantidad_por_unidad"],
                         )
                     )
+                db.session.flush()
+                refresh_platillos(platillo_ids=[platillo.id])
     except ValueError as exc:
         db.session.rollback()
         return error_response(str(exc))
 
     db.session.commit()
-    return jsonify({"id": platillo.id, "nombre": platillo.nombre, "precio": platillo.precio, "activo": platillo.activo}), 201
+    if ingredientes is not None:
+        invalidate_recipe_index()
+    return jsonify(_platillo_json(platillo)), 201
 
 
 @platillos_bp.post("/<int:platillo_id>/ingredientes")
@@ -138,14 +185,20 @@ def add_ingredientes(platillo_id):
                 )
                 db.session.add(ing)
                 created.append(ing)
+            db.session.flush()
+            refresh_platillos(platillo_ids=[platillo_id])
     except ValueError as exc:
         db.session.rollback()
         return error_response(str(exc))
 
     db.session.commit()
+    invalidate_recipe_index()
+    db.session.refresh(platillo)
     return jsonify(
         {
             "platillo_id": platillo_id,
+            "costo_receta": platillo.costo_receta,
+            "porciones_disponibles": platillo.porciones_disponibles,
             "ingredientes": [
                 {
                     "id": i.id,
@@ -171,7 +224,7 @@ def update_platillo(platillo_id):
         platillo.nombre = data["nombre"]
     if "precio" in data:
         try:
-            precio_val = float(data["precio"])
+            precio_val = money(float(data["precio"]))
         except (TypeError, ValueError):
             return error_response("precio inválido")
         if precio_val <= 0:
@@ -192,9 +245,13 @@ def update_platillo(platillo_id):
                             cantidad_por_unidad=item["cantidad_por_unidad"],
                         )
                     )
+                db.session.flush()
+                refresh_platillos(platillo_ids=[platillo_id])
         except ValueError as exc:
             db.session.rollback()
             return error_response(str(exc))
 
     db.session.commit()
-    return jsonify({"id": platillo.id, "nombre": platillo.nombre, "precio": platillo.precio, "activo": platillo.activo})
+    if "ingredientes" in data:
+        invalidate_recipe_index()
+    return jsonify(_platillo_json(platillo))
@@ -0,0 +1,41 @@
+from flask import Blueprint, Response, jsonify, request
+from flask_jwt_extended import jwt_required
+
+from app.auth_utils import roles_required
+from app.models import RoleEnum
+from app.profiling import list_profiles, profiling_enabled, render_profile
+from app.routes.utils import error_response
+
+
+profiling_bp = Blueprint("profiling", __name__, url_prefix="/api/admin/profiles")
+
+
+@profiling_bp.get("")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def get_profiles():
+    if not profiling_enabled():
+        return error_response("Profiling deshabilitado", 404)
+    return jsonify({"profiles": list_profiles()})
+
+
+@profiling_bp.get("/<profile_id>")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def get_profile(profile_id):
+    if not profiling_enabled():
+        return error_response("Profiling deshabilitado", 404)
+
+    try:
+        limit = int(request.args.get("limit", 40))
+    except ValueError:
+        return error_response("limit inválido")
+
+    try:
+        report = render_profile(profile_id, sort=request.args.get("sort", "cumulative"), limit=limit)
+    except LookupError as exc:
+        return error_response(str(exc), 404)
+    except ValueError as exc:
+        return error_response(str(exc))
+
+    return Response(report, mimetype="text/plain")
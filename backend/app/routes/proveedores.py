@@ -0,0 +1,26 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required
+
+from app.auth_utils import roles_required
+from app.models import RoleEnum
+from app.routes.utils import MAX_PAGE_SIZE, error_response
+from app.services.supplier_service import search_proveedores
+
+
+proveedores_bp = Blueprint("proveedores", __name__, url_prefix="/proveedores")
+
+
+@proveedores_bp.get("")
+@jwt_required()
+@roles_required(RoleEnum.ADMIN)
+def list_proveedores():
+    """Busca proveedores por prefijo de cualquiera de sus palabras (`?q=dist cen`), para autocompletar."""
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return error_response("limit debe ser numérico")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return error_response(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+
+    proveedores = search_proveedores(request.args.get("q"), limit)
+    return jsonify([{"id": p.id, "nombre": p.nombre} for p in proveedores])
@@ -1,6 +1,13 @@
+import base64
+from datetime import datetime
 from enum import Enum
 
-from flask import jsonify
+from flask import jsonify, request
+from sqlalchemy import and_, or_
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
 
 
 def error_response(message, status=400):
@@ -21,3 +28,77 @@ def enum_value(value):
     if isinstance(value, Enum):
         return value.value
     return value
+
+
+def with_etag(response, version):
+    response.headers["ETag"] = f'"{version}"'
+    return response
+
+
+def if_match_fails(current_version):
+    raw = (request.headers.get("If-Match") or "").strip()
+    if not raw or raw == "*":
+        return False
+    expected = {value.strip().removeprefix("W/").strip('"') for value in raw.split(",")}
+    return str(current_version) not in expected
+
+
+def precondition_failed_response(current_version):
+    response, status = error_response("El recurso cambió desde tu última lectura (If-Match no coincide)", 412)
+    return with_etag(response, current_version), status
+
+
+def conflict_response():
+    return error_response("El recurso fue modificado por otro usuario, recarga e intenta de nuevo", 409)
+
+
+def include_detalles():
+    return request.args.get("detalles", "1").strip().lower() not in ("0", "false", "no")
+
+
+def _encode_cursor(fecha, row_id):
+    return base64.urlsafe_b64encode(f"{fecha.isoformat()}|{row_id}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(raw):
+    try:
+        fecha, row_id = base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)).decode().split("|")
+        return datetime.fromisoformat(fecha), int(row_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("cursor inválido") from exc
+
+
+def keyset_paginate(query, fecha_col, id_col):
+    """Ordena por (fecha, id) descendente y, si se pide `limit` o `cursor`, devuelve una sola página.
+
+    La página siguiente arranca después de la última fila vista (`fecha < x OR fecha = x AND id < y`),
+    así el costo no crece con la página como con OFFSET. Retorna (filas, siguiente_cursor); el cursor
+    es None en la última página o cuando no se pidió paginar.
+    """
+    limit_raw = request.args.get("limit")
+    cursor_raw = request.args.get("cursor")
+    query = query.order_by(fecha_col.desc(), id_col.desc())
+    if not limit_raw and not cursor_raw:
+        return query.all(), None
+
+    try:
+        limit = int(limit_raw) if limit_raw else DEFAULT_PAGE_SIZE
+    except ValueError as exc:
+        raise ValueError("limit debe ser numérico") from exc
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+    if cursor_raw:
+        fecha, row_id = _decode_cursor(cursor_raw)
+        query = query.filter(or_(fecha_col < fecha, and_(fecha_col == fecha, id_col < row_id)))
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _encode_cursor(getattr(rows[-1], fecha_col.key), rows[-1].id)
+
+
+def with_next_cursor(response, cursor):
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+    return response
@@ -4,7 +4,9 @@ from werkzeug.security import generate_password_hash
 
 from app.extensions import db
 from app.models import Mesa, MesaEstadoEnum, MovimientoInventario, Platillo, PlatilloIngrediente, Producto, RoleEnum, User
+from app.money import quantity
 from app.services.inventory_service import register_purchase
+from app.services.recipe_service import refresh_platillos
 
 
 SEED_USERS = [
@@ -146,6 +148,7 @@ def seed_initial_data():
                 created["ingredientes"] += 1
 
     db.session.flush()
+    refresh_platillos()
 
     # Verifica consistencia mínima de kardex para productos seed.
     for spec in SEED_PRODUCTS:
@@ -158,7 +161,7 @@ def seed_initial_data():
             .order_by(MovimientoInventario.created_at.desc(), MovimientoInventario.id.desc())
             .first()
         )
-        if mov and round(float(producto.stock_actual), 6) != round(float(mov.saldo_cantidad), 6):
+        if mov and quantity(producto.stock_actual) != quantity(mov.saldo_cantidad):
             raise ValueError(f"Inconsistencia de stock para producto {producto.nombre}")
 
     return created
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import func
+from sqlalchemy import case, func
 
 from app.extensions import db
 from app.models import (
@@ -9,11 +9,11 @@ from app.models import (
     CierreCaja,
     Cobro,
     CobroMetodoEnum,
-    MesaEstadoEnum,
     Pedido,
     PedidoEstadoEnum,
 )
-from app.services.order_service import OrderError, consume_inventory_for_order
+from app.money import money
+from app.services.order_service import OrderError, consume_inventory_for_order, release_mesa
 
 
 class CashError(ValueError):
@@ -35,7 +35,7 @@ def open_cashbox(user_id, monto_inicial):
     if get_open_cashbox():
         raise CashError("Ya existe una caja abierta")
 
-    apertura = AperturaCaja(user_id=user_id, monto_inicial=float(monto_inicial))
+    apertura = AperturaCaja(user_id=user_id, monto_inicial=money(monto_inicial))
     db.session.add(apertura)
     return apertura
 
@@ -67,10 +67,9 @@ def register_payment(pedido_id, metodo):
         pedido_id=pedido.id,
         apertura_caja_id=apertura.id,
         metodo=metodo,
-        monto=float(pedido.total),
+        monto=money(pedido.total),
     )
-    if pedido.mesa:
-        pedido.mesa.estado = MesaEstadoEnum.LIBRE
+    release_mesa(pedido.mesa_id)
     db.session.add(cobro)
     return cobro
 
@@ -94,30 +93,28 @@ def close_cashbox(apertura_id):
     if pendientes > 0:
         raise CashError("No se puede cerrar caja con pedidos no cobrados en el período")
 
-    total_efectivo = (
-        db.session.query(func.coalesce(func.sum(Cobro.monto), 0.0))
-        .filter(Cobro.apertura_caja_id == apertura.id, Cobro.metodo == CobroMetodoEnum.EFECTIVO)
-        .scalar()
-    )
-    total_tarjeta = (
-        db.session.query(func.coalesce(func.sum(Cobro.monto), 0.0))
-        .filter(Cobro.apertura_caja_id == apertura.id, Cobro.metodo == CobroMetodoEnum.TARJETA)
-        .scalar()
-    )
-    total_transferencia = (
-        db.session.query(func.coalesce(func.sum(Cobro.monto), 0.0))
-        .filter(Cobro.apertura_caja_id == apertura.id, Cobro.metodo == CobroMetodoEnum.TRANSFERENCIA)
-        .scalar()
-    )
+    # Un solo recorrido de los cobros de la apertura; los montos se suman en SQL sin pasar por float.
+    def total_metodo(metodo):
+        return func.coalesce(func.sum(case((Cobro.metodo == metodo, Cobro.monto), else_=0)), 0)
 
-    total_ventas = float(total_efectivo) + float(total_tarjeta) + float(total_transferencia)
+    totales = (
+        db.session.query(
+            func.coalesce(func.sum(Cobro.monto), 0),
+            total_metodo(CobroMetodoEnum.EFECTIVO),
+            total_metodo(CobroMetodoEnum.TARJETA),
+            total_metodo(CobroMetodoEnum.TRANSFERENCIA),
+        )
+        .filter(Cobro.apertura_caja_id == apertura.id)
+        .one()
+    )
+    total_ventas, total_efectivo, total_tarjeta, total_transferencia = (money(total) for total in totales)
 
     cierre = CierreCaja(
         apertura_caja_id=apertura.id,
-        total_ventas=float(total_ventas),
-        total_efectivo=float(total_efectivo),
-        total_tarjeta=float(total_tarjeta),
-        total_transferencia=float(total_transferencia),
+        total_ventas=total_ventas,
+        total_efectivo=total_efectivo,
+        total_tarjeta=total_tarjeta,
+        total_transferencia=total_transferencia,
         closed_at=datetime.utcnow(),
     )
     apertura.estado = CajaEstadoEnum.CERRADA
@@ -1,45 +1,122 @@
+import time
+
+from sqlalchemy import bindparam, func, insert, select, update
+
 from app.extensions import db
-from app.models import MovimientoInventario, MovimientoTipoEnum, Producto
+from app.models import AlertaStock, AlertaStockTipoEnum, MovimientoInventario, MovimientoTipoEnum, Producto
+from app.money import money, quantity
+from app.services.recipe_service import mark_producto_changed
 
 
 class InventoryError(ValueError):
     pass
 
 
-def _round(value):
-    return round(float(value), 6)
-
-
 def create_movement(producto, tipo, referencia_tipo, referencia_id, cantidad, costo_unitario, saldo, costo_promedio):
     movimiento = MovimientoInventario(
         producto_id=producto.id,
         tipo=tipo,
         referencia_tipo=referencia_tipo,
         referencia_id=referencia_id,
-        cantidad=_round(cantidad),
-        costo_unitario=_round(costo_unitario),
-        saldo_cantidad=_round(saldo),
-        costo_promedio_resultante=_round(costo_promedio),
+        cantidad=quantity(cantidad),
+        costo_unitario=quantity(costo_unitario),
+        saldo_cantidad=quantity(saldo),
+        costo_promedio_resultante=quantity(costo_promedio),
     )
     db.session.add(movimiento)
 
 
-def register_purchase(producto_id, cantidad, costo_compra, referencia_tipo, referencia_id):
-    if cantidad <= 0 or costo_compra < 0:
-        raise InventoryError("Cantidad y costo de compra inválidos")
+def _update_stock(producto_id, values, *conditions, reload=True):
+    """Actualiza el producto con un UPDATE condicional y devuelve la fila ya actualizada.
+
+    El cálculo se hace en SQL sobre el valor vigente de la fila, así dos workers no pueden leer el
+    mismo stock y sobrescribirse: el segundo UPDATE espera el lock de la fila y ve el saldo del primero.
+    Retorna None si la fila no cumple las condiciones. Con `reload=False` no vuelve a leer la fila y
+    retorna True, para quien no necesita los saldos resultantes.
+    """
+    result = db.session.execute(
+        update(Producto)
+        .where(Producto.id == producto_id, Producto.activo.is_(True), *conditions)
+        .ordered_values(*values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return None
+    if not reload:
+        return True
+    return db.session.get(Producto, producto_id, populate_existing=True)
+
+
+def weighted_average_cost(stock, costo_promedio, cantidad, costo_compra):
+    """Costo promedio ponderado después de comprar `cantidad` a `costo_compra`.
 
+    Es la única fórmula del kardex: la usan `register_purchase`, el recálculo del kardex y el
+    generador de datos de carga, así todos redondean igual. Sin stock previo (o con stock negativo)
+    el promedio anterior no pesa y queda el costo de la compra.
+    """
+    stock = quantity(stock)
+    cantidad = quantity(cantidad)
+    costo_compra = quantity(costo_compra)
+    if stock <= 0:
+        return costo_compra
+    return quantity((stock * quantity(costo_promedio) + cantidad * costo_compra) / (stock + cantidad))
+
+
+def _low_stock_expr(nuevo_stock):
+    """Valor de `bajo_stock` con el stock `nuevo_stock`, calculado en SQL sobre la fila.
+
+    Debe ir antes que `stock_actual` en el UPDATE: en MySQL las asignaciones se evalúan en orden y
+    `nuevo_stock` se expresa sobre el stock anterior.
+    """
+    return (Producto.stock_minimo > 0) & (func.round(nuevo_stock, 6) < Producto.stock_minimo)
+
+
+def below_minimum(stock, stock_minimo):
+    minimo = quantity(stock_minimo)
+    return minimo > 0 and quantity(stock) < minimo
+
+
+def stock_alert_values(producto_id, bajo_stock, stock_actual, stock_minimo):
+    return {
+        "producto_id": producto_id,
+        "tipo": AlertaStockTipoEnum.BAJO_STOCK if bajo_stock else AlertaStockTipoEnum.REPUESTO,
+        "stock_actual": quantity(stock_actual),
+        "stock_minimo": quantity(stock_minimo),
+    }
+
+
+def _record_stock_alert(producto, estaba_bajo):
+    """Registra una alerta si `producto.bajo_stock` cambió respecto de `estaba_bajo`."""
+    if bool(producto.bajo_stock) == estaba_bajo:
+        return
+    alerta = stock_alert_values(producto.id, producto.bajo_stock, producto.stock_actual, producto.stock_minimo)
+    db.session.add(AlertaStock(**alerta))
+
+
+def _get_active_producto_or_raise(producto_id):
     producto = db.session.get(Producto, producto_id)
     if not producto or not producto.activo:
         raise InventoryError("Producto no encontrado o inactivo")
+    return producto
 
-    stock_actual = float(producto.stock_actual)
-    costo_promedio_actual = float(producto.costo_promedio)
 
-    nuevo_stock = stock_actual + float(cantidad)
-    nuevo_promedio = ((stock_actual * costo_promedio_actual) + (float(cantidad) * float(costo_compra))) / nuevo_stock
+def register_purchase(producto_id, cantidad, costo_compra, referencia_tipo, referencia_id):
+    if cantidad <= 0 or costo_compra < 0:
+        raise InventoryError("Cantidad y costo de compra inválidos")
 
-    producto.stock_actual = _round(nuevo_stock)
-    producto.costo_promedio = _round(nuevo_promedio)
+    cantidad = quantity(cantidad)
+    costo_compra = quantity(costo_compra)
+    nuevo_stock = Producto.stock_actual + cantidad
+    producto = _update_stock(producto_id, [(Producto.bajo_stock, _low_stock_expr(nuevo_stock)), (Producto.stock_actual, nuevo_stock)])
+    if producto is None:
+        _get_active_producto_or_raise(producto_id)
+        raise InventoryError("No se pudo actualizar el producto")
+
+    # El UPDATE anterior ya tomó el lock de la fila, así que el stock previo es el que sumó la base. El
+    # promedio se calcula con la misma función que el recálculo del kardex, no con aritmética del motor.
+    producto.costo_promedio = weighted_average_cost(
+        quantity(producto.stock_actual) - cantidad, producto.costo_promedio, cantidad, costo_compra
+    )
 
     create_movement(
         producto=producto,
@@ -48,74 +125,417 @@ def register_purchase(producto_id, cantidad, costo_compra, referencia_tipo, refe
         referencia_id=referencia_id,
         cantidad=cantidad,
         costo_unitario=costo_compra,
-        saldo=nuevo_stock,
-        costo_promedio=nuevo_promedio,
+        saldo=producto.stock_actual,
+        costo_promedio=producto.costo_promedio,
     )
+    _record_stock_alert(producto, below_minimum(quantity(producto.stock_actual) - cantidad, producto.stock_minimo))
+    # La compra mueve stock y costo promedio: los platillos que lo usan se recalculan antes del commit.
+    mark_producto_changed(producto_id, costo=True)
 
     return producto
 
 
-def register_output(producto_id, cantidad, tipo, referencia_tipo, referencia_id):
+def register_output(producto_id, cantidad, tipo, referencia_tipo, referencia_id, desde_reserva=False):
+    """Registra una salida de stock. Con `desde_reserva` la cantidad sale también de `stock_reservado`."""
     if cantidad <= 0:
         raise InventoryError("Cantidad inválida")
     if tipo not in (MovimientoTipoEnum.VENTA, MovimientoTipoEnum.MERMA, MovimientoTipoEnum.AJUSTE_NEG):
         raise InventoryError("Tipo de salida inválido")
 
-    producto = db.session.get(Producto, producto_id)
-    if not producto or not producto.activo:
-        raise InventoryError("Producto no encontrado o inactivo")
-
-    stock_actual = float(producto.stock_actual)
-    if stock_actual - float(cantidad) < 0:
+    cantidad = quantity(cantidad)
+    nuevo_stock = Producto.stock_actual - cantidad
+    values = [(Producto.bajo_stock, _low_stock_expr(nuevo_stock)), (Producto.stock_actual, nuevo_stock)]
+    if desde_reserva:
+        values.append((Producto.stock_reservado, Producto.stock_reservado - cantidad))
+    # ROUND solo importa en SQLite, que guarda Numeric como REAL; en MariaDB la resta ya es exacta.
+    producto = _update_stock(producto_id, values, func.round(nuevo_stock, 6) >= 0)
+    if producto is None:
+        producto = _get_active_producto_or_raise(producto_id)
         raise InventoryError(f"Stock insuficiente para {producto.nombre}")
 
-    nuevo_stock = stock_actual - float(cantidad)
-    costo_unitario = float(producto.costo_promedio)
-
-    producto.stock_actual = _round(nuevo_stock)
-
     create_movement(
         producto=producto,
         tipo=tipo,
         referencia_tipo=referencia_tipo,
         referencia_id=referencia_id,
-        cantidad=-abs(float(cantidad)),
-        costo_unitario=costo_unitario,
-        saldo=nuevo_stock,
+        cantidad=-cantidad,
+        costo_unitario=producto.costo_promedio,
+        saldo=producto.stock_actual,
         costo_promedio=producto.costo_promedio,
     )
+    _record_stock_alert(producto, below_minimum(quantity(producto.stock_actual) + cantidad, producto.stock_minimo))
+    mark_producto_changed(producto_id)
 
     return producto
 
 
-def register_positive_adjustment(producto_id, cantidad, referencia_tipo, referencia_id):
-    if cantidad <= 0:
-        raise InventoryError("Cantidad inválida")
+def register_outputs_batch(cantidades, tipo, referencia_tipo, referencia_id, desde_reserva=False):
+    """Registra varias salidas de una vez (p. ej. el cobro de un pedido); `cantidades` es producto_id -> cantidad.
 
-    producto = db.session.get(Producto, producto_id)
-    if not producto or not producto.activo:
+    Igual que `register_output` para cada producto, pero bloquea y lee todos los productos en una
+    consulta (en orden de ID) y escribe stock, movimientos y alertas con un UPDATE y un INSERT en
+    lote. Si una salida no alcanza no se registra ninguna.
+    """
+    if tipo not in (MovimientoTipoEnum.VENTA, MovimientoTipoEnum.MERMA, MovimientoTipoEnum.AJUSTE_NEG):
+        raise InventoryError("Tipo de salida inválido")
+    cantidades = {producto_id: quantity(cantidad) for producto_id, cantidad in cantidades.items()}
+    if any(cantidad <= 0 for cantidad in cantidades.values()):
+        raise InventoryError("Cantidad inválida")
+    if not cantidades:
+        return
+
+    productos = db.session.execute(
+        select(
+            Producto.id,
+            Producto.nombre,
+            Producto.activo,
+            Producto.stock_actual,
+            Producto.costo_promedio,
+            Producto.stock_minimo,
+        )
+        .where(Producto.id.in_(cantidades))
+        .order_by(Producto.id.asc())
+        .with_for_update()
+    ).all()
+    if len(productos) != len(cantidades) or not all(row.activo for row in productos):
         raise InventoryError("Producto no encontrado o inactivo")
 
-    stock_actual = float(producto.stock_actual)
-    nuevo_stock = stock_actual + float(cantidad)
-    costo_unitario = float(producto.costo_promedio)
+    updates = []
+    movimientos = []
+    alertas = []
+    for row in productos:
+        cantidad = cantidades[row.id]
+        stock = quantity(row.stock_actual)
+        saldo = stock - cantidad
+        if saldo < 0:
+            raise InventoryError(f"Stock insuficiente para {row.nombre}")
+        costo = quantity(row.costo_promedio)
+        updates.append({"b_id": row.id, "b_cantidad": cantidad})
+        movimientos.append(
+            {
+                "producto_id": row.id,
+                "tipo": tipo,
+                "referencia_tipo": referencia_tipo,
+                "referencia_id": referencia_id,
+                "cantidad": -cantidad,
+                "costo_unitario": costo,
+                "saldo_cantidad": saldo,
+                "costo_promedio_resultante": costo,
+            }
+        )
+        queda_bajo = below_minimum(saldo, row.stock_minimo)
+        if queda_bajo != below_minimum(stock, row.stock_minimo):
+            alertas.append(stock_alert_values(row.id, queda_bajo, saldo, row.stock_minimo))
+
+    tabla = Producto.__table__
+    nuevo_stock = tabla.c.stock_actual - bindparam("b_cantidad")
+    values = [(tabla.c.bajo_stock, _low_stock_expr(nuevo_stock)), (tabla.c.stock_actual, nuevo_stock)]
+    if desde_reserva:
+        values.append((tabla.c.stock_reservado, tabla.c.stock_reservado - bindparam("b_cantidad")))
+    db.session.execute(tabla.update().where(tabla.c.id == bindparam("b_id")).ordered_values(*values), updates)
+    db.session.execute(insert(MovimientoInventario), movimientos)
+    if alertas:
+        db.session.execute(insert(AlertaStock), alertas)
+    for row in productos:
+        mark_producto_changed(row.id)
+
+
+def register_positive_adjustment(producto_id, cantidad, referencia_tipo, referencia_id):
+    if cantidad <= 0:
+        raise InventoryError("Cantidad inválida")
 
-    producto.stock_actual = _round(nuevo_stock)
+    cantidad = quantity(cantidad)
+    nuevo_stock = Producto.stock_actual + cantidad
+    producto = _update_stock(producto_id, [(Producto.bajo_stock, _low_stock_expr(nuevo_stock)), (Producto.stock_actual, nuevo_stock)])
+    if producto is None:
+        _get_active_producto_or_raise(producto_id)
+        raise InventoryError("No se pudo actualizar el producto")
 
     create_movement(
         producto=producto,
         tipo=MovimientoTipoEnum.AJUSTE_POS,
         referencia_tipo=referencia_tipo,
         referencia_id=referencia_id,
-        cantidad=abs(float(cantidad)),
-        costo_unitario=costo_unitario,
-        saldo=nuevo_stock,
+        cantidad=cantidad,
+        costo_unitario=producto.costo_promedio,
+        saldo=producto.stock_actual,
         costo_promedio=producto.costo_promedio,
     )
+    _record_stock_alert(producto, below_minimum(quantity(producto.stock_actual) - cantidad, producto.stock_minimo))
+    mark_producto_changed(producto_id)
 
     return producto
 
 
+def reserve_stock(producto_id, cantidad):
+    """Aparta stock para un pedido sin moverlo del kardex.
+
+    El UPDATE condicional solo reserva si `stock_actual - stock_reservado` alcanza, así dos pedidos
+    no pueden reservar la misma existencia. El stock disponible de un producto es siempre esa resta.
+    """
+    if cantidad <= 0:
+        raise InventoryError("Cantidad inválida")
+
+    cantidad = quantity(cantidad)
+    disponible = Producto.stock_actual - Producto.stock_reservado - cantidad
+    reservado = _update_stock(
+        producto_id,
+        [(Producto.stock_reservado, Producto.stock_reservado + cantidad)],
+        func.round(disponible, 6) >= 0,
+        reload=False,
+    )
+    if reservado is None:
+        producto = _get_active_producto_or_raise(producto_id)
+        raise InventoryError(f"Stock insuficiente para {producto.nombre}")
+    mark_producto_changed(producto_id)
+
+
+def release_stock(producto_id, cantidad):
+    """Devuelve stock reservado; a diferencia de reservar, funciona aunque el producto esté inactivo."""
+    if cantidad <= 0:
+        raise InventoryError("Cantidad inválida")
+
+    db.session.execute(
+        update(Producto)
+        .where(Producto.id == producto_id)
+        .values(stock_reservado=Producto.stock_reservado - quantity(cantidad))
+        .execution_options(synchronize_session=False)
+    )
+    mark_producto_changed(producto_id)
+
+
+def reserve_stock_batch(cantidades):
+    """Reserva varias cantidades de una vez; `cantidades` es un dict producto_id -> cantidad.
+
+    Bloquea y lee los productos en una consulta, en orden de ID, para validar el disponible de todos
+    (y nombrar el que no alcanza), y después suma las reservas con un solo UPDATE condicional en lote
+    (executemany), con la misma condición que `reserve_stock`. Si uno no alcanza no se reserva ninguno.
+    """
+    cantidades = {producto_id: quantity(cantidad) for producto_id, cantidad in cantidades.items()}
+    if any(cantidad <= 0 for cantidad in cantidades.values()):
+        raise InventoryError("Cantidad inválida")
+    if not cantidades:
+        return
+
+    productos = db.session.execute(
+        select(Producto.id, Producto.nombre, Producto.activo, Producto.stock_actual, Producto.stock_reservado)
+        .where(Producto.id.in_(cantidades))
+        .order_by(Producto.id.asc())
+        .with_for_update()
+    ).all()
+    if len(productos) != len(cantidades) or not all(row.activo for row in productos):
+        raise InventoryError("Producto no encontrado o inactivo")
+    for row in productos:
+        if quantity(row.stock_actual) - quantity(row.stock_reservado) < cantidades[row.id]:
+            raise InventoryError(f"Stock insuficiente para {row.nombre}")
+
+    tabla = Producto.__table__
+    disponible = tabla.c.stock_actual - tabla.c.stock_reservado - bindparam("b_cantidad")
+    result = db.session.execute(
+        tabla.update()
+        .where(tabla.c.id == bindparam("b_id"), tabla.c.activo.is_(True), func.round(disponible, 6) >= 0)
+        .values(stock_reservado=tabla.c.stock_reservado + bindparam("b_cantidad")),
+        [{"b_id": row.id, "b_cantidad": cantidades[row.id]} for row in productos],
+    )
+    if result.rowcount != len(productos):
+        raise InventoryError("No se pudo reservar el stock")
+    for row in productos:
+        mark_producto_changed(row.id)
+
+
+def release_stock_batch(cantidades):
+    """Devuelve varias reservas con un solo UPDATE en lote, como `release_stock` para cada producto."""
+    filas = [{"b_id": producto_id, "b_cantidad": quantity(cantidad)} for producto_id, cantidad in sorted(cantidades.items())]
+    if any(fila["b_cantidad"] <= 0 for fila in filas):
+        raise InventoryError("Cantidad inválida")
+    if not filas:
+        return
+
+    tabla = Producto.__table__
+    db.session.execute(
+        tabla.update()
+        .where(tabla.c.id == bindparam("b_id"))
+        .values(stock_reservado=tabla.c.stock_reservado - bindparam("b_cantidad")),
+        filas,
+    )
+    for fila in filas:
+        mark_producto_changed(fila["b_id"])
+
+
+def register_bulk_adjustments(cantidades, referencia_tipo, referencia_id, conteo=False):
+    """Aplica muchos ajustes de stock de una vez (p. ej. un inventario físico completo).
+
+    `cantidades` es un dict producto_id -> cantidad. Por defecto cada cantidad es la diferencia a
+    aplicar (positiva o negativa); con `conteo=True` es el stock contado y la diferencia se calcula
+    contra el stock vigente de la fila bloqueada, no contra una foto tomada antes.
+
+    Carga y bloquea todos los productos en una consulta, calcula saldos en memoria y escribe con un
+    UPDATE y un INSERT en lote (executemany), en vez de una lectura, un UPDATE y un INSERT por
+    producto. Los productos se bloquean en orden de ID, igual que en los cobros. Si un ajuste no es
+    válido no se aplica ninguno. Retorna un resumen con los ajustes aplicados, el stock de sistema
+    usado por producto y el tiempo de cada fase en milisegundos.
+    """
+    tiempos = {}
+    inicio = time.perf_counter()
+    cantidades = {producto_id: quantity(cantidad) for producto_id, cantidad in cantidades.items()}
+    if not conteo:
+        cantidades = {producto_id: cantidad for producto_id, cantidad in cantidades.items() if cantidad != 0}
+    productos = (
+        db.session.query(Producto)
+        .filter(Producto.id.in_(cantidades))
+        .order_by(Producto.id.asc())
+        .with_for_update()
+        .all()
+        if cantidades
+        else []
+    )
+    tiempos["carga"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    if len(productos) != len(cantidades):
+        raise InventoryError("Producto no encontrado o inactivo")
+
+    stock_sistema = {}
+    updates = []
+    movimientos = []
+    alertas = []
+    for producto in productos:
+        if not producto.activo:
+            raise InventoryError("Producto no encontrado o inactivo")
+        stock_sistema[producto.id] = quantity(producto.stock_actual)
+        cantidad = cantidades[producto.id]
+        if conteo:
+            cantidad -= stock_sistema[producto.id]
+        if cantidad == 0:
+            continue
+        saldo = stock_sistema[producto.id] + cantidad
+        if saldo < 0:
+            raise InventoryError(f"Stock insuficiente para {producto.nombre}")
+        costo = quantity(producto.costo_promedio)
+        updates.append({"b_id": producto.id, "b_cantidad": cantidad})
+        queda_bajo = below_minimum(saldo, producto.stock_minimo)
+        if queda_bajo != below_minimum(stock_sistema[producto.id], producto.stock_minimo):
+            alertas.append(stock_alert_values(producto.id, queda_bajo, saldo, producto.stock_minimo))
+        movimientos.append(
+            {
+                "producto_id": producto.id,
+                "tipo": MovimientoTipoEnum.AJUSTE_POS if cantidad > 0 else MovimientoTipoEnum.AJUSTE_NEG,
+                "referencia_tipo": referencia_tipo,
+                "referencia_id": referencia_id,
+                "cantidad": cantidad,
+                "costo_unitario": costo,
+                "saldo_cantidad": saldo,
+                "costo_promedio_resultante": costo,
+            }
+        )
+    tiempos["calculo"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    if updates:
+        tabla = Producto.__table__
+        # Suma relativa, como en _update_stock: el saldo final lo calcula la base sobre la fila bloqueada.
+        nuevo_stock = tabla.c.stock_actual + bindparam("b_cantidad")
+        db.session.execute(
+            tabla.update()
+            .where(tabla.c.id == bindparam("b_id"))
+            .ordered_values((tabla.c.bajo_stock, _low_stock_expr(nuevo_stock)), (tabla.c.stock_actual, nuevo_stock)),
+            updates,
+        )
+        db.session.execute(insert(MovimientoInventario), movimientos)
+        if alertas:
+            db.session.execute(insert(AlertaStock), alertas)
+        for producto in productos:
+            db.session.expire(producto, ["stock_actual", "bajo_stock"])
+        for fila in updates:
+            mark_producto_changed(fila["b_id"])
+    tiempos["escritura"] = time.perf_counter() - inicio
+
+    return {
+        "ajustes_positivos": sum(1 for mov in movimientos if mov["cantidad"] > 0),
+        "ajustes_negativos": sum(1 for mov in movimientos if mov["cantidad"] < 0),
+        "alertas": len(alertas),
+        "stock_sistema": stock_sistema,
+        "tiempos_ms": {fase: round(segundos * 1000, 3) for fase, segundos in tiempos.items()},
+    }
+
+
+def set_stock_minimo(producto_id, stock_minimo):
+    """Cambia el punto de reorden de un producto y recalcula `bajo_stock` contra su stock vigente.
+
+    Bloquea la fila como un movimiento de stock; si el producto entra o sale del mínimo por el cambio
+    se registra la alerta correspondiente.
+    """
+    if stock_minimo < 0:
+        raise InventoryError("stock_minimo no puede ser negativo")
+
+    producto = (
+        db.session.query(Producto)
+        .filter(Producto.id == producto_id)
+        .populate_existing()
+        .with_for_update()
+        .one_or_none()
+    )
+    if not producto:
+        raise InventoryError("Producto no encontrado")
+
+    estaba_bajo = bool(producto.bajo_stock)
+    producto.stock_minimo = quantity(stock_minimo)
+    producto.bajo_stock = below_minimum(producto.stock_actual, producto.stock_minimo)
+    _record_stock_alert(producto, estaba_bajo)
+    return producto
+
+
+def low_stock_products():
+    """Productos activos con stock bajo su mínimo; filtra por el índice de `bajo_stock`, sin recorrer el catálogo."""
+    query = (
+        select(Producto.id, Producto.nombre, Producto.unidad, Producto.stock_actual, Producto.stock_minimo)
+        .where(Producto.bajo_stock.is_(True), Producto.activo.is_(True))
+        .order_by(Producto.nombre.asc())
+    )
+    return [
+        {
+            "id": row.id,
+            "nombre": row.nombre,
+            "unidad": row.unidad,
+            "stock_actual": quantity(row.stock_actual),
+            "stock_minimo": quantity(row.stock_minimo),
+            "faltante": quantity(row.stock_minimo) - quantity(row.stock_actual),
+        }
+        for row in db.session.execute(query)
+    ]
+
+
+def stock_alerts(despues_de=0, limite=50, hasta=None):
+    """Alertas de stock con ID mayor a `despues_de`, en orden; el cliente sigue desde `ultimo_id`.
+
+    El ID se asigna al insertar, no al confirmar: una transacción más lenta puede confirmar una alerta
+    con ID menor al último ya entregado. Con `hasta` solo se entregan las creadas antes de ese
+    momento, así las transacciones aún abiertas alcanzan a confirmar antes de que el cursor las pase.
+    """
+    query = (
+        select(AlertaStock, Producto.nombre)
+        .join(Producto, Producto.id == AlertaStock.producto_id)
+        .where(AlertaStock.id > despues_de)
+        .order_by(AlertaStock.id.asc())
+        .limit(limite)
+    )
+    if hasta is not None:
+        query = query.where(AlertaStock.created_at <= hasta)
+    alertas = [
+        {
+            "id": alerta.id,
+            "producto_id": alerta.producto_id,
+            "nombre": nombre,
+            "tipo": alerta.tipo.value,
+            "stock_actual": quantity(alerta.stock_actual),
+            "stock_minimo": quantity(alerta.stock_minimo),
+            "created_at": alerta.created_at.isoformat(),
+        }
+        for alerta, nombre in db.session.execute(query)
+    ]
+    return {"alertas": alertas, "ultimo_id": alertas[-1]["id"] if alertas else despues_de}
+
+
 def assert_stock_matches_last_movement(producto_id):
     producto = db.session.get(Producto, producto_id)
     if not producto:
@@ -131,6 +551,181 @@ def assert_stock_matches_last_movement(producto_id):
     if not ultimo:
         return True
 
-    if _round(producto.stock_actual) != _round(ultimo.saldo_cantidad):
+    if quantity(producto.stock_actual) != quantity(ultimo.saldo_cantidad):
         raise InventoryError("Inconsistencia entre stock actual y último movimiento")
     return True
+
+
+def verify_kardex(limite=100, yield_per=5000):
+    """Verifica el kardex de todos los productos en una sola pasada.
+
+    Recorre producto LEFT JOIN movimiento_inventario ordenado por producto y por el orden del kardex
+    (created_at, id), leyendo de a `yield_per` filas, así la memoria no depende del tamaño de la
+    tabla. Por producto comprueba que cada saldo sea el anterior más la cantidad del movimiento, que
+    ningún saldo sea negativo y que `stock_actual` coincida con el último saldo (o sea cero si no hay
+    movimientos). Tras un salto en la cadena sigue desde el saldo registrado, así el error no se
+    arrastra al resto del kardex (un saldo alterado aparece en su movimiento y en el siguiente).
+    Guarda como máximo `limite` inconsistencias, pero las cuenta todas.
+    """
+    query = (
+        select(
+            Producto.id,
+            Producto.stock_actual,
+            MovimientoInventario.id,
+            MovimientoInventario.cantidad,
+            MovimientoInventario.saldo_cantidad,
+        )
+        .select_from(Producto)
+        .outerjoin(MovimientoInventario, MovimientoInventario.producto_id == Producto.id)
+        .order_by(Producto.id.asc(), MovimientoInventario.created_at.asc(), MovimientoInventario.id.asc())
+    )
+    resumen = {"productos": 0, "movimientos": 0, "productos_con_error": 0, "total_inconsistencias": 0}
+    inconsistencias = []
+    productos_con_error = set()
+
+    def reportar(producto_id, tipo, movimiento_id, esperado, registrado):
+        resumen["total_inconsistencias"] += 1
+        productos_con_error.add(producto_id)
+        if len(inconsistencias) < limite:
+            inconsistencias.append(
+                {
+                    "producto_id": producto_id,
+                    "tipo": tipo,
+                    "movimiento_id": movimiento_id,
+                    "esperado": quantity(esperado),
+                    "registrado": quantity(registrado),
+                }
+            )
+
+    # Ciclo caliente: tuplas y variables locales. Las columnas Numeric ya llegan como Decimal con
+    # escala 6, así que la suma es exacta sin pasar cada valor por quantity().
+    cero = quantity(0)
+    producto_actual = None
+    stock = saldo = cero
+    ultimo_id = None
+    movimientos = 0
+    result = db.session.connection().execution_options(stream_results=True).execute(query)
+    for filas in result.partitions(yield_per):
+        for producto_id, stock_actual, movimiento_id, cantidad, saldo_cantidad in filas:
+            if producto_id != producto_actual:
+                if producto_actual is not None and saldo != stock:
+                    reportar(producto_actual, "stock", ultimo_id, saldo, stock)
+                producto_actual = producto_id
+                stock = stock_actual if stock_actual is not None else cero
+                saldo = cero
+                ultimo_id = None
+                resumen["productos"] += 1
+            if movimiento_id is None:
+                continue
+
+            movimientos += 1
+            if saldo + cantidad != saldo_cantidad:
+                reportar(producto_id, "cadena", movimiento_id, saldo + cantidad, saldo_cantidad)
+            if saldo_cantidad < 0:
+                reportar(producto_id, "saldo_negativo", movimiento_id, cero, saldo_cantidad)
+            saldo = saldo_cantidad
+            ultimo_id = movimiento_id
+    if producto_actual is not None and saldo != stock:
+        reportar(producto_actual, "stock", ultimo_id, saldo, stock)
+
+    resumen["movimientos"] = movimientos
+    resumen["productos_con_error"] = len(productos_con_error)
+    return {**resumen, "ok": resumen["total_inconsistencias"] == 0, "inconsistencias": inconsistencias}
+
+
+VALUATION_GROUPS = ("producto", "unidad")
+
+
+def last_movements(*conditions):
+    """Subconsulta con el último movimiento de cada producto (en el orden del kardex) que cumple las condiciones.
+
+    Columnas: producto_id, stock (saldo_cantidad), costo (costo_promedio_resultante) y orden; solo
+    las filas con `orden == 1` son el último movimiento.
+    """
+    orden = func.row_number().over(
+        partition_by=MovimientoInventario.producto_id,
+        order_by=(MovimientoInventario.created_at.desc(), MovimientoInventario.id.desc()),
+    )
+    return (
+        select(
+            MovimientoInventario.producto_id,
+            MovimientoInventario.saldo_cantidad.label("stock"),
+            MovimientoInventario.costo_promedio_resultante.label("costo"),
+            orden.label("orden"),
+        )
+        .where(*conditions)
+        .subquery()
+    )
+
+
+def _valuation_source(corte):
+    if corte is None:
+        return select(
+            Producto.id.label("producto_id"),
+            Producto.nombre,
+            Producto.unidad,
+            Producto.stock_actual.label("stock"),
+            Producto.costo_promedio.label("costo"),
+        ).subquery()
+
+    ultimos = last_movements(MovimientoInventario.created_at <= corte)
+    return (
+        select(ultimos.c.producto_id, Producto.nombre, Producto.unidad, ultimos.c.stock, ultimos.c.costo)
+        .join(Producto, Producto.id == ultimos.c.producto_id)
+        .where(ultimos.c.orden == 1)
+        .subquery()
+    )
+
+
+def valuation_report(agrupacion="producto", corte=None):
+    """Valor del inventario (stock × costo promedio) por producto o por unidad, agregado en SQL.
+
+    Sin `corte` usa el stock y costo actuales de `producto`. Con `corte` (datetime) usa el saldo y el
+    costo promedio resultante del último movimiento de cada producto hasta esa fecha, elegido con
+    ROW_NUMBER() en una sola consulta; los productos sin movimientos hasta entonces no aparecen.
+    """
+    if agrupacion not in VALUATION_GROUPS:
+        raise ValueError("agrupacion inválida. Valores permitidos: " + ", ".join(VALUATION_GROUPS))
+
+    origen = _valuation_source(corte)
+    valor = origen.c.stock * origen.c.costo
+    if agrupacion == "producto":
+        query = select(origen, valor.label("valor")).order_by(valor.desc(), origen.c.producto_id.asc())
+    else:
+        query = (
+            select(
+                origen.c.unidad,
+                func.count(origen.c.producto_id).label("productos"),
+                func.sum(origen.c.stock).label("stock"),
+                func.sum(valor).label("valor"),
+            )
+            .group_by(origen.c.unidad)
+            .order_by(origen.c.unidad.asc())
+        )
+
+    items = []
+    total = money(0)
+    productos = 0
+    for row in db.session.execute(query):
+        if agrupacion == "producto":
+            item = {
+                "producto_id": row.producto_id,
+                "nombre": row.nombre,
+                "unidad": row.unidad,
+                "stock": quantity(row.stock),
+                "costo_promedio": quantity(row.costo),
+            }
+            productos += 1
+        else:
+            item = {"unidad": row.unidad, "productos": row.productos, "stock": quantity(row.stock)}
+            productos += row.productos
+        item["valor"] = money(row.valor)
+        total += item["valor"]
+        items.append(item)
+
+    return {
+        "agrupacion": agrupacion,
+        "corte": corte.isoformat() if corte else None,
+        "items": items,
+        "total": {"productos": productos, "valor": total},
+    }
@@ -0,0 +1,177 @@
+from sqlalchemy import bindparam, insert, select, tuple_
+
+from app.extensions import db
+from app.models import AlertaStock, MovimientoInventario, MovimientoTipoEnum, Producto
+from app.money import quantity
+from app.services.inventory_service import below_minimum, last_movements, stock_alert_values, weighted_average_cost
+from app.services.recipe_service import mark_producto_changed
+
+
+def _lock_productos(producto_id):
+    query = db.session.query(Producto.id, Producto.stock_actual, Producto.costo_promedio, Producto.stock_minimo).order_by(
+        Producto.id.asc()
+    )
+    if producto_id is not None:
+        query = query.filter(Producto.id == producto_id)
+    # Todas las escrituras de stock pasan primero por la fila de producto: con el lock tomado no
+    # aparecen movimientos nuevos mientras se recalcula.
+    return {
+        row.id: (quantity(row.stock_actual), quantity(row.costo_promedio), quantity(row.stock_minimo))
+        for row in query.with_for_update()
+    }
+
+
+def _initial_states(desde, producto_id):
+    """Saldo y costo promedio de cada producto justo antes de `desde`, según su último movimiento previo."""
+    if desde is None:
+        return {}
+    conditions = [MovimientoInventario.created_at < desde]
+    if producto_id is not None:
+        conditions.append(MovimientoInventario.producto_id == producto_id)
+    ultimos = last_movements(*conditions)
+    filas = db.session.execute(select(ultimos.c.producto_id, ultimos.c.stock, ultimos.c.costo).where(ultimos.c.orden == 1))
+    return {pid: (quantity(stock), quantity(costo)) for pid, stock, costo in filas}
+
+
+def _movement_chunks(desde, producto_id, batch_size):
+    """Movimientos en orden de kardex, en lotes acotados por keyset sobre (producto_id, created_at, id).
+
+    Cada lote es una consulta aparte y se consume completa; así se puede escribir entre lotes en la
+    misma conexión (un cursor de servidor en MariaDB la dejaría ocupada hasta terminar de leer).
+    """
+    mov = MovimientoInventario
+    base = select(
+        mov.id, mov.producto_id, mov.created_at, mov.tipo, mov.cantidad, mov.costo_unitario,
+        mov.saldo_cantidad, mov.costo_promedio_resultante,
+    ).order_by(mov.producto_id.asc(), mov.created_at.asc(), mov.id.asc())
+    if desde is not None:
+        base = base.where(mov.created_at >= desde)
+    if producto_id is not None:
+        base = base.where(mov.producto_id == producto_id)
+
+    ultimo = None
+    while True:
+        query = base
+        if ultimo is not None:
+            pid, fecha, mov_id = ultimo
+            query = query.where(tuple_(mov.producto_id, mov.created_at, mov.id) > tuple_(pid, fecha, mov_id))
+        filas = db.session.connection().execute(query.limit(batch_size)).all()
+        if not filas:
+            return
+        yield filas
+        ultimo = (filas[-1].producto_id, filas[-1].created_at, filas[-1].id)
+
+
+def replay_kardex(producto_id=None, desde=None, dry_run=False, batch_size=5000, limite=100):
+    """Recalcula saldos y costo promedio ponderado del kardex a partir de `desde` (o desde el inicio).
+
+    Parte del último movimiento anterior a `desde` de cada producto y vuelve a derivar, movimiento a
+    movimiento, `saldo_cantidad`, `costo_promedio_resultante` y el `costo_unitario` de las salidas y
+    ajustes (que se valorizan al promedio vigente); el costo de las compras es el dato de origen y no
+    se toca. Sirve para propagar la corrección de una compra a todo lo posterior.
+
+    Lee los movimientos en lotes de `batch_size` y escribe las filas que cambian con un UPDATE en lote
+    por cada lote leído; al final deja `stock_actual` y `costo_promedio` del producto iguales al último
+    saldo (y `bajo_stock` con él, registrando la alerta si cruza el mínimo). Con `dry_run` no escribe
+    nada y solo informa las diferencias (hasta `limite`). Los saldos que quedan negativos se informan
+    pero no se corrigen: requieren revisar los movimientos.
+    """
+    productos = _lock_productos(producto_id)
+    estados = _initial_states(desde, producto_id)
+    resumen = {"productos": 0, "movimientos": 0, "movimientos_corregidos": 0, "productos_corregidos": 0, "saldos_negativos": 0}
+    cambios = []
+    negativos = []
+    finales = {}
+    corregidos = set()
+
+    tabla = MovimientoInventario.__table__
+    update_movimiento = (
+        tabla.update()
+        .where(tabla.c.id == bindparam("b_id"))
+        .values(
+            saldo_cantidad=bindparam("b_saldo"),
+            costo_promedio_resultante=bindparam("b_costo"),
+            costo_unitario=bindparam("b_costo_unitario"),
+        )
+    )
+
+    # Ciclo caliente: las columnas Numeric ya llegan como Decimal con escala 6, así que sumas y
+    # comparaciones son exactas; solo el promedio de una compra necesita redondearse.
+    cero = quantity(0)
+    actual = None
+    saldo = costo = cero
+    for filas in _movement_chunks(desde, producto_id, batch_size):
+        lote = []
+        for mov_id, pid, _, tipo, cantidad, costo_registrado, saldo_registrado, promedio_registrado in filas:
+            if pid != actual:
+                if actual is not None:
+                    finales[actual] = (saldo, costo)
+                actual = pid
+                saldo, costo = estados.get(actual, (cero, cero))
+                resumen["productos"] += 1
+
+            costo_unitario = costo_registrado
+            nuevo_saldo = saldo + cantidad
+            if tipo == MovimientoTipoEnum.COMPRA:
+                costo = weighted_average_cost(saldo, costo, cantidad, costo_unitario)
+            else:
+                costo_unitario = costo
+            saldo = nuevo_saldo
+            resumen["movimientos"] += 1
+
+            if saldo < 0:
+                resumen["saldos_negativos"] += 1
+                if len(negativos) < limite:
+                    negativos.append({"producto_id": actual, "movimiento_id": mov_id, "saldo_cantidad": saldo})
+
+            if saldo == saldo_registrado and costo == promedio_registrado and costo_unitario == costo_registrado:
+                continue
+            resumen["movimientos_corregidos"] += 1
+            corregidos.add(actual)
+            lote.append({"b_id": mov_id, "b_saldo": saldo, "b_costo": costo, "b_costo_unitario": costo_unitario})
+            if len(cambios) < limite:
+                cambio = {"producto_id": actual, "movimiento_id": mov_id}
+                for campo, anterior, nuevo in (
+                    ("saldo_cantidad", saldo_registrado, saldo),
+                    ("costo_promedio_resultante", promedio_registrado, costo),
+                    ("costo_unitario", costo_registrado, costo_unitario),
+                ):
+                    if anterior != nuevo:
+                        cambio[campo] = {"antes": quantity(anterior), "despues": quantity(nuevo)}
+                cambios.append(cambio)
+
+        if lote and not dry_run:
+            db.session.execute(update_movimiento, lote)
+    if actual is not None:
+        finales[actual] = (saldo, costo)
+
+    productos_actualizados = []
+    alertas = []
+    for pid, (saldo_final, costo_final) in finales.items():
+        if pid not in productos:
+            continue
+        stock_previo, costo_previo, minimo = productos[pid]
+        if (stock_previo, costo_previo) == (saldo_final, costo_final):
+            continue
+        corregidos.add(pid)
+        bajo_stock = below_minimum(saldo_final, minimo)
+        productos_actualizados.append({"b_id": pid, "b_stock": saldo_final, "b_costo": costo_final, "b_bajo": bajo_stock})
+        if bajo_stock != below_minimum(stock_previo, minimo):
+            alertas.append(stock_alert_values(pid, bajo_stock, saldo_final, minimo))
+    if productos_actualizados and not dry_run:
+        tabla_producto = Producto.__table__
+        db.session.execute(
+            tabla_producto.update()
+            .where(tabla_producto.c.id == bindparam("b_id"))
+            .values(stock_actual=bindparam("b_stock"), costo_promedio=bindparam("b_costo"), bajo_stock=bindparam("b_bajo")),
+            productos_actualizados,
+        )
+        if alertas:
+            db.session.execute(insert(AlertaStock), alertas)
+        db.session.expire_all()
+    if not dry_run:
+        for pid in corregidos:
+            mark_producto_changed(pid, costo=True)
+
+    resumen["productos_corregidos"] = len(corregidos)
+    return {**resumen, "dry_run": dry_run, "cambios": cambios, "negativos": negativos}
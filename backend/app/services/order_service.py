@@ -1,59 +1,283 @@
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+
 from app.extensions import db
-from app.models import Pedido, PedidoDetalle, PedidoEstadoEnum, Platillo, PlatilloIngrediente, MovimientoTipoEnum
-from app.services.inventory_service import InventoryError, register_output
+from app.money import money, quantity, to_decimal
+from app.models import (
+    Mesa,
+    MesaEstadoEnum,
+    Pedido,
+    PedidoDetalle,
+    PedidoEstadoEnum,
+    Platillo,
+    PlatilloIngrediente,
+    MovimientoTipoEnum,
+    ReservaInventario,
+)
+from app.services.inventory_service import (
+    InventoryError,
+    register_outputs_batch,
+    release_stock_batch,
+    reserve_stock_batch,
+)
 
 
 class OrderError(ValueError):
     pass
 
 
+def _set_mesa_estado(mesa_id, nuevo_estado, *conditions):
+    result = db.session.execute(
+        update(Mesa)
+        .where(Mesa.id == mesa_id, *conditions)
+        .values(estado=nuevo_estado, version=Mesa.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return None
+    return db.session.get(Mesa, mesa_id, populate_existing=True)
+
+
+def claim_mesa(mesa_id):
+    """Marca la mesa como OCUPADA solo si estaba LIBRE, en un único UPDATE condicional.
+
+    Dos meseros que abren pedido en la misma mesa compiten por la misma fila: el primero la ocupa y
+    el segundo actualiza cero filas y recibe "Mesa ocupada".
+    """
+    mesa = _set_mesa_estado(mesa_id, MesaEstadoEnum.OCUPADA, Mesa.estado != MesaEstadoEnum.OCUPADA)
+    if mesa:
+        return mesa
+    if db.session.get(Mesa, mesa_id) is None:
+        raise OrderError("Mesa no encontrada")
+    raise OrderError("Mesa ocupada")
+
+
+def release_mesa(mesa_id):
+    return _set_mesa_estado(mesa_id, MesaEstadoEnum.LIBRE, Mesa.estado != MesaEstadoEnum.LIBRE)
+
+
 def add_item_to_order(pedido_id, platillo_id, cantidad):
-    if cantidad <= 0:
+    return add_items_to_order(pedido_id, [(platillo_id, cantidad)])[0]
+
+
+def add_items_to_order(pedido_id, lineas):
+    """Agrega varias líneas al pedido con una sola carga de platillos y un solo recálculo del total.
+
+    `lineas` es una lista de tuplas (platillo_id, cantidad). Si una línea es inválida no se agrega
+    ninguna. Las filas de `pedido_detalle` se insertan juntas en el mismo flush y después se
+    reservan los ingredientes que faltan; sin stock suficiente se rechaza todo el lote.
+    """
+    if not lineas:
+        raise OrderError("Debe enviar al menos un item")
+    if any(cantidad <= 0 for _, cantidad in lineas):
         raise OrderError("Cantidad inválida")
 
     pedido = db.session.get(Pedido, pedido_id)
-    platillo = db.session.get(Platillo, platillo_id)
-
     if not pedido:
         raise OrderError("Pedido no encontrado")
     if pedido.estado in (PedidoEstadoEnum.COBRADO, PedidoEstadoEnum.CANCELADO):
         raise OrderError("No se puede modificar un pedido finalizado")
-    if not platillo or not platillo.activo:
-        raise OrderError("Platillo no encontrado o inactivo")
 
-    subtotal = float(cantidad) * float(platillo.precio)
+    platillo_ids = {platillo_id for platillo_id, _ in lineas}
+    platillos = {
+        platillo.id: platillo
+        for platillo in db.session.query(Platillo).filter(Platillo.id.in_(platillo_ids), Platillo.activo.is_(True))
+    }
+    pedidas = {}
+    for platillo_id, cantidad in lineas:
+        if platillo_id not in platillos:
+            raise OrderError(f"Platillo {platillo_id} no encontrado o inactivo")
+        pedidas[platillo_id] = pedidas.get(platillo_id, 0) + to_decimal(cantidad)
 
-    detalle = PedidoDetalle(
-        pedido_id=pedido.id,
-        platillo_id=platillo.id,
-        cantidad=float(cantidad),
-        precio_unitario=float(platillo.precio),
-        subtotal=subtotal,
+    # Corte temprano con las porciones que permite el stock; el descuento real se valida al cobrar.
+    for platillo_id, cantidad in pedidas.items():
+        porciones = platillos[platillo_id].porciones_disponibles
+        if porciones is not None and cantidad > porciones:
+            nombre = platillos[platillo_id].nombre
+            if porciones <= 0:
+                raise OrderError(f"Platillo {nombre} agotado")
+            raise OrderError(f"Solo quedan {porciones} porciones de {nombre}")
+
+    detalles = [
+        PedidoDetalle(
+            pedido_id=pedido.id,
+            platillo_id=platillo_id,
+            cantidad=quantity(cantidad),
+            precio_unitario=money(platillos[platillo_id].precio),
+            subtotal=line_subtotal(cantidad, platillos[platillo_id].precio),
+        )
+        for platillo_id, cantidad in lineas
+    ]
+    db.session.add_all(detalles)
+
+    # El total se escribe antes de reservar: la fila versionada de `pedido` se bloquea antes que las de
+    # `producto`, en el mismo orden que el cobro.
+    recalculate_order_total(pedido)
+    db.session.flush()
+    sync_order_reservations(pedido)
+    return detalles
+
+
+def line_subtotal(cantidad, precio_unitario):
+    return money(to_decimal(cantidad) * to_decimal(precio_unitario))
+
+
+def _order_total_expr(pedido_id):
+    return (
+        select(func.coalesce(func.sum(PedidoDetalle.subtotal), 0))
+        .where(PedidoDetalle.pedido_id == pedido_id)
+        .scalar_subquery()
     )
-    db.session.add(detalle)
 
-    pedido.total = float(pedido.total) + subtotal
-    return detalle
+
+def recalculate_order_total(pedido):
+    """Recalcula el total del pedido sumando sus líneas en la base de datos.
+
+    El total ya no se ajusta sumando y restando floats: se obtiene de una sola consulta agregada
+    sobre `pedido_detalle` (el autoflush incluye las líneas agregadas, editadas o borradas en la
+    sesión) y se guarda redondeado a centavos.
+    """
+    pedido.total = money(db.session.execute(select(_order_total_expr(pedido.id))).scalar_one())
+    return pedido.total
+
+
+def repair_order_totals(dry_run=False, chunk_size=5000):
+    """Corrige en bloque los pedidos cuyo total no coincide con la suma de sus líneas.
+
+    Trabaja por rangos de ID para no bloquear toda la tabla en una sola sentencia. Retorna un resumen
+    con los pedidos revisados, los corregidos y cuántos de ellos ya estaban cobrados.
+    """
+    esperado = _order_total_expr(Pedido.id)
+    desfasado = func.round(Pedido.total, 2) != func.round(esperado, 2)
+    resumen = {"revisados": 0, "corregidos": 0, "cobrados_corregidos": 0, "diferencia": money(0)}
+
+    max_id = db.session.execute(select(func.max(Pedido.id))).scalar() or 0
+    for desde in range(1, max_id + 1, chunk_size):
+        rango = Pedido.id.between(desde, desde + chunk_size - 1)
+        resumen["revisados"] += db.session.execute(select(func.count()).select_from(Pedido).where(rango)).scalar_one()
+        filas = db.session.execute(
+            select(
+                func.count(Pedido.id),
+                func.coalesce(func.sum(esperado - Pedido.total), 0),
+                func.coalesce(func.sum(case((Pedido.estado == PedidoEstadoEnum.COBRADO, 1), else_=0)), 0),
+            ).where(rango, desfasado)
+        ).one()
+        if not filas[0]:
+            continue
+        resumen["corregidos"] += filas[0]
+        resumen["diferencia"] += money(filas[1])
+        resumen["cobrados_corregidos"] += int(filas[2])
+        if not dry_run:
+            db.session.execute(
+                update(Pedido)
+                .where(rango, desfasado)
+                .values(total=esperado, version=Pedido.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+    return resumen
 
 
-def _consume_recipe_for_detail(detalle, pedido_id):
-    ingredientes = (
-        db.session.query(PlatilloIngrediente)
-        .filter(PlatilloIngrediente.platillo_id == detalle.platillo_id)
-        .all()
+def _required_inventory_for_order(pedido_id):
+    """Cantidad de cada producto que consume el pedido completo, agregada en una sola consulta."""
+    filas = db.session.execute(
+        select(
+            PlatilloIngrediente.producto_id,
+            func.sum(PedidoDetalle.cantidad * PlatilloIngrediente.cantidad_por_unidad),
+        )
+        .join(PlatilloIngrediente, PlatilloIngrediente.platillo_id == PedidoDetalle.platillo_id)
+        .where(PedidoDetalle.pedido_id == pedido_id)
+        .group_by(PlatilloIngrediente.producto_id)
     )
-    if not ingredientes:
-        raise OrderError(f"El platillo ID {detalle.platillo_id} no tiene receta")
-
-    for ingrediente in ingredientes:
-        cantidad_salida = float(detalle.cantidad) * float(ingrediente.cantidad_por_unidad)
-        register_output(
-            producto_id=ingrediente.producto_id,
-            cantidad=cantidad_salida,
-            tipo=MovimientoTipoEnum.VENTA,
-            referencia_tipo="PEDIDO",
-            referencia_id=pedido_id,
+    return {producto_id: quantity(total) for producto_id, total in filas if total}
+
+
+def _assert_order_recipes(pedido_id):
+    sin_receta = db.session.execute(
+        select(PedidoDetalle.platillo_id)
+        .where(
+            PedidoDetalle.pedido_id == pedido_id,
+            ~select(PlatilloIngrediente.id).where(PlatilloIngrediente.platillo_id == PedidoDetalle.platillo_id).exists(),
         )
+        .limit(1)
+    ).scalar()
+    if sin_receta is not None:
+        raise OrderError(f"El platillo ID {sin_receta} no tiene receta")
+
+
+def _order_reservations(pedido_id):
+    """Reservas del pedido como dict producto_id -> cantidad."""
+    filas = db.session.execute(
+        select(ReservaInventario.producto_id, ReservaInventario.cantidad).where(ReservaInventario.pedido_id == pedido_id)
+    )
+    return {producto_id: quantity(cantidad) for producto_id, cantidad in filas}
+
+
+def _delete_order_reservations(pedido_id, producto_ids=None):
+    stmt = delete(ReservaInventario).where(ReservaInventario.pedido_id == pedido_id)
+    if producto_ids is not None:
+        stmt = stmt.where(ReservaInventario.producto_id.in_(producto_ids))
+    db.session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def sync_order_reservations(pedido, requerido=None, reservas=None):
+    """Ajusta las reservas del pedido a lo que hoy piden sus líneas.
+
+    Reserva o devuelve solo la diferencia por producto, con un UPDATE en lote para lo que se reserva
+    y otro para lo que se devuelve; los productos se bloquean en orden de ID. Las filas de
+    `reserva_inventario` también se escriben en lote. Quien ya leyó lo requerido y las reservas puede
+    pasarlos para no repetir las consultas. Los platillos sin receta no reservan nada; el cobro los
+    rechaza.
+    """
+    if requerido is None:
+        requerido = _required_inventory_for_order(pedido.id)
+    if reservas is None:
+        reservas = _order_reservations(pedido.id)
+
+    aumentos = {}
+    devoluciones = {}
+    nuevas = []
+    cambiadas = []
+    borradas = []
+    for producto_id in sorted(set(requerido) | set(reservas)):
+        nuevo = requerido.get(producto_id, quantity(0))
+        anterior = reservas.get(producto_id)
+        diferencia = nuevo - (anterior if anterior is not None else quantity(0))
+        if diferencia > 0:
+            aumentos[producto_id] = diferencia
+        elif diferencia < 0:
+            devoluciones[producto_id] = -diferencia
+        else:
+            continue
+
+        if anterior is None:
+            nuevas.append({"pedido_id": pedido.id, "producto_id": producto_id, "cantidad": nuevo})
+        elif nuevo > 0:
+            cambiadas.append({"b_producto_id": producto_id, "b_cantidad": nuevo})
+        else:
+            borradas.append(producto_id)
+
+    try:
+        reserve_stock_batch(aumentos)
+    except InventoryError as exc:
+        raise OrderError(str(exc)) from exc
+    release_stock_batch(devoluciones)
+
+    if nuevas:
+        db.session.execute(insert(ReservaInventario), nuevas)
+    if cambiadas:
+        tabla = ReservaInventario.__table__
+        db.session.execute(
+            tabla.update()
+            .where(tabla.c.pedido_id == pedido.id, tabla.c.producto_id == bindparam("b_producto_id"))
+            .values(cantidad=bindparam("b_cantidad")),
+            cambiadas,
+        )
+    if borradas:
+        _delete_order_reservations(pedido.id, borradas)
+
+
+def release_order_reservations(pedido):
+    release_stock_batch(_order_reservations(pedido.id))
+    _delete_order_reservations(pedido.id)
 
 
 def consume_inventory_for_order(pedido_id):
@@ -69,11 +293,23 @@ def consume_inventory_for_order(pedido_id):
     if pedido.estado == PedidoEstadoEnum.COBRADO:
         return pedido
 
+    _assert_order_recipes(pedido.id)
+    # Como al agregar items, primero la fila versionada de `pedido` y después las de `producto`.
+    pedido.estado = PedidoEstadoEnum.COBRADO
+    db.session.flush()
+
+    # Lo normal es que las reservas ya cubran las líneas; solo los pedidos previos a las reservas (o
+    # con reservas desfasadas) se ponen al día antes de cobrar.
+    requerido = _required_inventory_for_order(pedido.id)
+    reservas = _order_reservations(pedido.id)
+    if reservas != requerido:
+        sync_order_reservations(pedido, requerido, reservas)
+
+    # Cada reserva se convierte en un movimiento VENTA, todas en un solo lote.
     try:
-        for detalle in pedido.detalles:
-            _consume_recipe_for_detail(detalle, pedido.id)
+        register_outputs_batch(requerido, MovimientoTipoEnum.VENTA, "PEDIDO", pedido.id, desde_reserva=True)
     except InventoryError as exc:
         raise OrderError(str(exc)) from exc
+    _delete_order_reservations(pedido.id)
 
-    pedido.estado = PedidoEstadoEnum.COBRADO
     return pedido
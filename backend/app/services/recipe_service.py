@@ -0,0 +1,257 @@
+import threading
+
+from flask import current_app
+from sqlalchemy import case, event, func, select, update
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import Platillo, PlatilloIngrediente, Producto
+from app.money import money, quantity
+
+
+def _recipe_cost_expr():
+    """Costo de una porción: suma de cantidad_por_unidad × costo_promedio, correlacionada con la fila de platillo."""
+    return (
+        select(func.coalesce(func.sum(PlatilloIngrediente.cantidad_por_unidad * Producto.costo_promedio), 0))
+        .select_from(PlatilloIngrediente)
+        .join(Producto, Producto.id == PlatilloIngrediente.producto_id)
+        .where(PlatilloIngrediente.platillo_id == Platillo.id)
+        .scalar_subquery()
+    )
+
+
+def _dish_portions_expr():
+    """Porciones que permite el stock: el mínimo, entre los ingredientes, de stock / cantidad_por_unidad.
+
+    Usa el stock disponible (lo no reservado por otros pedidos); un producto inactivo o sobre-reservado
+    cuenta como sin stock. Sin receta el resultado es NULL (sin límite).
+    """
+    disponible = Producto.stock_actual - Producto.stock_reservado
+    stock = case((Producto.activo.is_(True) & (disponible > 0), disponible), else_=0)
+    return (
+        select(func.min(func.floor(func.round(stock / PlatilloIngrediente.cantidad_por_unidad, 6))))
+        .select_from(PlatilloIngrediente)
+        .join(Producto, Producto.id == PlatilloIngrediente.producto_id)
+        .where(PlatilloIngrediente.platillo_id == Platillo.id)
+        .scalar_subquery()
+    )
+
+
+def _refresh(values, platillo_ids, producto_ids):
+    stmt = update(Platillo).values(**values)
+    if platillo_ids is not None:
+        if not platillo_ids:
+            return 0
+        stmt = stmt.where(Platillo.id.in_(platillo_ids))
+    if producto_ids is not None:
+        if not producto_ids:
+            return 0
+        stmt = stmt.where(
+            Platillo.id.in_(
+                select(PlatilloIngrediente.platillo_id).where(PlatilloIngrediente.producto_id.in_(producto_ids))
+            )
+        )
+    result = db.session.execute(stmt.execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+def refresh_recipe_costs(platillo_ids=None, producto_ids=None):
+    """Recalcula `Platillo.costo_receta` en un único UPDATE correlacionado.
+
+    Solo toca los platillos afectados: los indicados en `platillo_ids`, o los que usan alguno de
+    `producto_ids` cuando cambia su costo promedio. Sin filtros recalcula todo el menú. El costo se
+    obtiene de las líneas de receta en la base (no sumando diferencias), así que no acumula error
+    entre compras. Retorna la cantidad de platillos actualizados.
+    """
+    return _refresh({"costo_receta": func.round(_recipe_cost_expr(), 6)}, platillo_ids, producto_ids)
+
+
+def refresh_dish_availability(platillo_ids=None, producto_ids=None):
+    """Recalcula `Platillo.porciones_disponibles` de los platillos afectados, igual que `refresh_recipe_costs`."""
+    return _refresh({"porciones_disponibles": _dish_portions_expr()}, platillo_ids, producto_ids)
+
+
+def refresh_platillos(platillo_ids=None):
+    """Recalcula costo de receta y porciones disponibles; se usa al cambiar una receta o al cargar datos."""
+    actualizados = refresh_recipe_costs(platillo_ids=platillo_ids)
+    refresh_dish_availability(platillo_ids=platillo_ids)
+    return actualizados
+
+
+PENDING_KEY = "platillos_pendientes"
+
+
+def mark_producto_changed(producto_id, costo=False):
+    """Anota que cambió el stock (y, si `costo`, el costo promedio) de un producto en esta transacción.
+
+    Los platillos que lo usan se recalculan una sola vez justo antes del commit. Así una compra o un
+    cobro con varios productos toma primero todos los locks de `producto` (en el orden de siempre) y
+    recién al final los de `platillo`, en lugar de intercalarlos en cada movimiento.
+    """
+    pendientes = db.session.info.setdefault(PENDING_KEY, {"stock": set(), "costo": set()})
+    pendientes["stock"].add(producto_id)
+    if costo:
+        pendientes["costo"].add(producto_id)
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_pending_platillos(session):
+    pendientes = session.info.pop(PENDING_KEY, None)
+    if not pendientes:
+        return
+    if pendientes["costo"]:
+        refresh_recipe_costs(producto_ids=sorted(pendientes["costo"]))
+    refresh_dish_availability(producto_ids=sorted(pendientes["stock"]))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_pending_platillos(session, transaction):
+    # Un rollback de la transacción raíz descarta lo anotado; los savepoints no lo tocan.
+    if transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
+
+
+def margin_report(solo_activos=True):
+    """Margen teórico de cada platillo (precio - costo_receta), en una sola consulta sobre `platillo`."""
+    margen = Platillo.precio - Platillo.costo_receta
+    margen_pct = case((Platillo.precio > 0, margen * 100 / Platillo.precio), else_=0)
+    query = select(
+        Platillo.id,
+        Platillo.nombre,
+        Platillo.precio,
+        Platillo.costo_receta,
+        Platillo.activo,
+        margen.label("margen"),
+        margen_pct.label("margen_pct"),
+    ).order_by(margen_pct.asc(), Platillo.id.asc())
+    if solo_activos:
+        query = query.where(Platillo.activo.is_(True))
+
+    platillos = []
+    for row in db.session.execute(query):
+        platillos.append(
+            {
+                "id": row.id,
+                "nombre": row.nombre,
+                "precio": money(row.precio),
+                "costo_receta": quantity(row.costo_receta),
+                "activo": row.activo,
+                "margen": money(row.margen),
+                "margen_pct": money(row.margen_pct),
+            }
+        )
+
+    ventas = sum((p["precio"] for p in platillos), money(0))
+    costo = sum((p["costo_receta"] for p in platillos), quantity(0))
+    return {
+        "platillos": platillos,
+        "resumen": {
+            "platillos": len(platillos),
+            "margen_promedio_pct": money((ventas - costo) * 100 / ventas) if ventas else money(0),
+            "sin_margen": sum(1 for p in platillos if p["margen"] <= 0),
+        },
+    }
+
+
+class RecipeIndex:
+    """Recetas en memoria en ambos sentidos: producto -> platillos que lo usan y platillo -> ingredientes."""
+
+    def __init__(self, fingerprint, rows):
+        self.fingerprint = fingerprint
+        self.por_producto = {}
+        self.por_platillo = {}
+        for platillo_id, producto_id, cantidad in rows:
+            cantidad = quantity(cantidad)
+            self.por_producto.setdefault(producto_id, []).append((platillo_id, cantidad))
+            self.por_platillo.setdefault(platillo_id, []).append((producto_id, cantidad))
+
+    def platillos_de(self, producto_id):
+        return self.por_producto.get(producto_id, [])
+
+    def ingredientes_de(self, platillo_id):
+        return self.por_platillo.get(platillo_id, [])
+
+
+_index_lock = threading.Lock()
+
+
+def _recipe_fingerprint():
+    # Las recetas se reemplazan borrando e insertando líneas: cualquier edición cambia alguno de estos valores.
+    return tuple(
+        db.session.execute(
+            select(
+                func.count(PlatilloIngrediente.id),
+                func.max(PlatilloIngrediente.id),
+                func.sum(PlatilloIngrediente.cantidad_por_unidad),
+            )
+        ).one()
+    )
+
+
+def get_recipe_index():
+    """Devuelve el índice de recetas del proceso, reconstruyéndolo si las recetas cambiaron.
+
+    Cada llamada cuesta una consulta agregada sobre `platillo_ingrediente`; así otros workers se
+    enteran de ediciones hechas fuera de este proceso sin volver a leer todas las recetas.
+    """
+    fingerprint = _recipe_fingerprint()
+    index = current_app.extensions.get("recipe_index")
+    if index is not None and index.fingerprint == fingerprint:
+        return index
+
+    with _index_lock:
+        index = current_app.extensions.get("recipe_index")
+        if index is None or index.fingerprint != fingerprint:
+            rows = db.session.execute(
+                select(
+                    PlatilloIngrediente.platillo_id,
+                    PlatilloIngrediente.producto_id,
+                    PlatilloIngrediente.cantidad_por_unidad,
+                )
+            ).all()
+            index = RecipeIndex(fingerprint, rows)
+            current_app.extensions["recipe_index"] = index
+    return index
+
+
+def invalidate_recipe_index():
+    current_app.extensions.pop("recipe_index", None)
+
+
+def dish_availability(producto_id=None):
+    """Porciones que el stock disponible permite preparar de cada platillo activo.
+
+    Lee platillos activos y stock de productos en dos consultas y calcula todo el menú en una sola
+    pasada sobre el índice. Con `producto_id` solo incluye los platillos que usan ese producto.
+    Un platillo sin receta no tiene límite (`porciones_disponibles` es None).
+    """
+    index = get_recipe_index()
+    query = select(Platillo.id, Platillo.nombre).where(Platillo.activo.is_(True)).order_by(Platillo.nombre.asc())
+    if producto_id is not None:
+        query = query.where(Platillo.id.in_([platillo_id for platillo_id, _ in index.platillos_de(producto_id)]))
+    platillos = db.session.execute(query).all()
+
+    stock = {}
+    for row in db.session.execute(select(Producto.id, Producto.stock_actual, Producto.stock_reservado, Producto.activo)):
+        disponible = quantity(row.stock_actual) - quantity(row.stock_reservado)
+        stock[row.id] = disponible if row.activo and disponible > 0 else quantity(0)
+
+    result = []
+    for platillo in platillos:
+        porciones = None
+        limitante = None
+        for ingrediente_id, cantidad in index.ingredientes_de(platillo.id):
+            alcanza = int(quantity(stock.get(ingrediente_id, 0)) // cantidad)
+            if porciones is None or alcanza < porciones:
+                porciones = alcanza
+                limitante = ingrediente_id
+        result.append(
+            {
+                "id": platillo.id,
+                "nombre": platillo.nombre,
+                "porciones_disponibles": porciones,
+                "producto_limitante_id": limitante,
+                "disponible": porciones is None or porciones > 0,
+            }
+        )
+    return result
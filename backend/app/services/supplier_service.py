@@ -0,0 +1,86 @@
+import re
+import unicodedata
+
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import Compra, Proveedor, ProveedorTermino
+
+
+def normalize_nombre(nombre):
+    """Minúsculas, sin tildes ni signos y con espacios simples: "Lácteos  del Valle" -> "lacteos del valle".
+
+    Solo se quitan las marcas diacríticas: las letras de otros alfabetos ("Пекарня") se conservan.
+    """
+    texto = unicodedata.normalize("NFKD", nombre or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).casefold()
+    # Un nombre hecho solo de signos ("***") se conserva tal cual para no fusionarlo con otro.
+    return " ".join(re.sub(r"[\W_]+", " ", texto).split()) or " ".join(texto.split())
+
+
+def _terminos(normalizado):
+    return sorted(set(normalizado.split()))
+
+
+def _prefix_range(columna, prefijo):
+    # Rango [prefijo, prefijo siguiente): usa el índice igual en MariaDB y SQLite, a diferencia de
+    # LIKE 'x%' que en SQLite depende de la collation de la columna.
+    siguiente = prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+    return and_(columna >= prefijo, columna < siguiente)
+
+
+def get_or_create_proveedor(nombre):
+    """Devuelve el proveedor cuyo nombre normalizado coincide, creándolo con sus términos si no existe."""
+    normalizado = normalize_nombre(nombre)
+    if not normalizado:
+        raise ValueError("proveedor inválido")
+
+    proveedor = db.session.query(Proveedor).filter(Proveedor.nombre_normalizado == normalizado).first()
+    if proveedor is not None:
+        return proveedor
+
+    try:
+        with db.session.begin_nested():
+            proveedor = Proveedor(nombre=" ".join(nombre.split()), nombre_normalizado=normalizado)
+            proveedor.terminos = [ProveedorTermino(termino=termino) for termino in _terminos(normalizado)]
+            db.session.add(proveedor)
+    except IntegrityError:
+        # Otra compra creó el mismo proveedor entre la consulta y el INSERT. La lectura con bloqueo ve
+        # la fila ya confirmada; una lectura normal en REPEATABLE READ usaría la foto de la consulta
+        # anterior y no la encontraría.
+        proveedor = (
+            db.session.query(Proveedor)
+            .filter(Proveedor.nombre_normalizado == normalizado)
+            .with_for_update()
+            .one()
+        )
+    return proveedor
+
+
+def matching_proveedor_ids(texto):
+    """Subconsulta con los proveedores que tienen, para cada palabra de `texto`, un término que empieza con ella.
+
+    "dist cen" encuentra "Distribuidora Central"; cada palabra es un rango sobre el índice de
+    `proveedor_termino.termino`, sin recorrer las compras ni los nombres completos.
+    """
+    palabras = _terminos(normalize_nombre(texto))
+    query = select(Proveedor.id)
+    for palabra in palabras:
+        query = query.where(
+            Proveedor.id.in_(select(ProveedorTermino.proveedor_id).where(_prefix_range(ProveedorTermino.termino, palabra)))
+        )
+    return query
+
+
+def search_proveedores(texto=None, limit=20):
+    query = db.session.query(Proveedor)
+    if texto and normalize_nombre(texto):
+        query = query.filter(Proveedor.id.in_(matching_proveedor_ids(texto)))
+    return query.order_by(Proveedor.nombre_normalizado.asc()).limit(limit).all()
+
+
+def filter_compras_by_proveedor(query, texto):
+    if not normalize_nombre(texto):
+        return query
+    return query.filter(Compra.proveedor_id.in_(matching_proveedor_ids(texto)))
@@ -0,0 +1,162 @@
+import threading
+
+from flask import current_app
+from sqlalchemy import and_, case, extract, func, select
+
+from app.extensions import db
+from app.models import (
+    InventarioFisico,
+    InventarioFisicoDet,
+    InventarioFisicoEstadoEnum,
+    MovimientoInventario,
+    Producto,
+)
+from app.money import money, quantity
+
+
+AGRUPACIONES = ("mes", "anio")
+CACHE_SIZE = 128
+
+_cache_lock = threading.Lock()
+
+
+def _periodo_expr(agrupacion):
+    # EXTRACT funciona igual en MariaDB y SQLite; el período se guarda como AAAAMM o AAAA.
+    anio = extract("year", InventarioFisico.fecha)
+    if agrupacion == "anio":
+        return anio
+    return anio * 100 + extract("month", InventarioFisico.fecha)
+
+
+def _format_periodo(periodo, agrupacion):
+    periodo = int(periodo)
+    if agrupacion == "anio":
+        return str(periodo)
+    return f"{periodo // 100:04d}-{periodo % 100:02d}"
+
+
+def _closed_fingerprint():
+    # Un inventario aplicado ya no cambia: solo aparecen nuevos, así que basta con contar y el máximo ID.
+    return tuple(
+        db.session.execute(
+            select(func.count(InventarioFisico.id), func.max(InventarioFisico.id)).where(
+                InventarioFisico.estado == InventarioFisicoEstadoEnum.APLICADO
+            )
+        ).one()
+    )
+
+
+def _variance_rows(agrupacion, desde, hasta, producto_id):
+    diferencia = InventarioFisicoDet.diferencia
+    periodo = _periodo_expr(agrupacion).label("periodo")
+    por_periodo = (
+        select(
+            InventarioFisicoDet.producto_id,
+            periodo,
+            func.count(func.distinct(InventarioFisico.id)).label("conteos"),
+            func.sum(case((diferencia < 0, -diferencia), else_=0)).label("faltante"),
+            func.sum(case((diferencia > 0, diferencia), else_=0)).label("sobrante"),
+            func.sum(diferencia).label("neto"),
+            func.coalesce(func.sum(MovimientoInventario.cantidad * MovimientoInventario.costo_unitario), 0).label("valor"),
+        )
+        .select_from(InventarioFisicoDet)
+        .join(InventarioFisico, InventarioFisico.id == InventarioFisicoDet.inventario_fisico_id)
+        .outerjoin(
+            MovimientoInventario,
+            and_(
+                MovimientoInventario.referencia_tipo == "INVENTARIO_FISICO",
+                MovimientoInventario.referencia_id == InventarioFisico.id,
+                MovimientoInventario.producto_id == InventarioFisicoDet.producto_id,
+            ),
+        )
+        .where(InventarioFisico.estado == InventarioFisicoEstadoEnum.APLICADO)
+        .group_by(InventarioFisicoDet.producto_id, periodo)
+    )
+    if desde is not None:
+        por_periodo = por_periodo.where(InventarioFisico.fecha >= desde)
+    if hasta is not None:
+        por_periodo = por_periodo.where(InventarioFisico.fecha <= hasta)
+    if producto_id is not None:
+        por_periodo = por_periodo.where(InventarioFisicoDet.producto_id == producto_id)
+    por_periodo = por_periodo.subquery()
+
+    ventana = {"partition_by": por_periodo.c.producto_id, "order_by": por_periodo.c.periodo}
+    query = select(
+        por_periodo,
+        func.sum(por_periodo.c.neto).over(**ventana).label("neto_acumulado"),
+        func.sum(por_periodo.c.valor).over(**ventana).label("valor_acumulado"),
+        func.lag(por_periodo.c.neto).over(**ventana).label("neto_anterior"),
+    ).order_by(por_periodo.c.producto_id, por_periodo.c.periodo)
+    return db.session.execute(query).all()
+
+
+def _build_report(agrupacion, desde, hasta, producto_id):
+    productos = {}
+    for row in _variance_rows(agrupacion, desde, hasta, producto_id):
+        neto = quantity(row.neto)
+        anterior = quantity(row.neto_anterior) if row.neto_anterior is not None else None
+        item = productos.setdefault(
+            row.producto_id,
+            {"producto_id": row.producto_id, "faltante": quantity(0), "sobrante": quantity(0), "valor": money(0), "periodos": []},
+        )
+        item["periodos"].append(
+            {
+                "periodo": _format_periodo(row.periodo, agrupacion),
+                "conteos": row.conteos,
+                "faltante": quantity(row.faltante),
+                "sobrante": quantity(row.sobrante),
+                "neto": neto,
+                "valor": money(row.valor),
+                "neto_acumulado": quantity(row.neto_acumulado),
+                "valor_acumulado": money(row.valor_acumulado),
+                "variacion": neto - anterior if anterior is not None else None,
+            }
+        )
+        item["faltante"] += quantity(row.faltante)
+        item["sobrante"] += quantity(row.sobrante)
+        item["valor"] += money(row.valor)
+
+    # Primero los productos con más merma valorizada (valor más negativo).
+    return sorted(productos.values(), key=lambda item: (item["valor"], item["producto_id"]))
+
+
+def variance_report(agrupacion="mes", desde=None, hasta=None, producto_id=None):
+    """Diferencias de inventarios físicos aplicados, por producto y período (mes o año).
+
+    La agregación, el acumulado y la variación contra el período anterior se calculan en SQL con
+    funciones de ventana. `valor` usa el costo de los movimientos de ajuste, es decir el costo
+    promedio vigente al aplicar cada conteo. Como un inventario aplicado no cambia, el resultado se
+    guarda en memoria por filtros y se descarta solo cuando se aplica otro inventario; los nombres
+    de producto se leen aparte en cada llamada para no servir un nombre viejo.
+    """
+    if agrupacion not in AGRUPACIONES:
+        raise ValueError("agrupacion inválida. Valores permitidos: " + ", ".join(AGRUPACIONES))
+
+    fingerprint = _closed_fingerprint()
+    key = (agrupacion, desde, hasta, producto_id)
+    with _cache_lock:
+        cache = current_app.extensions.get("variance_cache")
+        if cache is None or cache["fingerprint"] != fingerprint:
+            cache = {"fingerprint": fingerprint, "reportes": {}}
+            current_app.extensions["variance_cache"] = cache
+        productos = cache["reportes"].get(key)
+
+    if productos is None:
+        productos = _build_report(agrupacion, desde, hasta, producto_id)
+        with _cache_lock:
+            if cache["fingerprint"] == fingerprint:
+                if len(cache["reportes"]) >= CACHE_SIZE:
+                    cache["reportes"].clear()
+                cache["reportes"][key] = productos
+
+    ids = [item["producto_id"] for item in productos]
+    nombres = dict(db.session.query(Producto.id, Producto.nombre).filter(Producto.id.in_(ids))) if ids else {}
+    return {
+        "agrupacion": agrupacion,
+        "productos": [{**item, "nombre": nombres.get(item["producto_id"])} for item in productos],
+        "resumen": {
+            "productos": len(productos),
+            "faltante_valor": sum((item["valor"] for item in productos if item["valor"] < 0), money(0)),
+            "sobrante_valor": sum((item["valor"] for item in productos if item["valor"] > 0), money(0)),
+        },
+    }
@@ -0,0 +1,266 @@
+"""Benchmark reproducible de las rutas críticas del backend.
+
+Uso:
+
+    cd backend
+    python -m benchmarks.bench_hot_paths --scale small
+    python -m benchmarks.bench_hot_paths --scale small --update-baseline
+
+Genera datos con `generate_load_data`, ejecuta los escenarios contra la API con el cliente de
+pruebas de Flask y compara el p95 de cada escenario con `benchmarks/baseline.json`.
+Sale con código 1 si algún escenario empeora más allá de la tolerancia.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app import create_app
+from app.extensions import db
+from app.load_data import LOAD_PASSWORD, generate_load_data
+from app.models import Mesa, MesaEstadoEnum, Platillo, Producto, RoleEnum, User
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+SCALES = {
+    "small": {"productos": 200, "platillos": 60, "mesas": 40, "pedidos": 5000, "dias": 30, "compras": 60},
+    "medium": {"productos": 2000, "platillos": 300, "mesas": 80, "pedidos": 100000, "dias": 180, "compras": 900},
+    "large": {"productos": 5000, "platillos": 600, "mesas": 120, "pedidos": 300000, "dias": 365, "compras": 2000},
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+
+    def timed(self, name, fn, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples.setdefault(name, []).append(time.perf_counter() - started)
+        return result
+
+    def summary(self):
+        report = {}
+        for name, values in sorted(self.samples.items()):
+            total = sum(values)
+            report[name] = {
+                "n": len(values),
+                "ops_per_s": round(len(values) / total, 2) if total else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+                "max_ms": round(max(values) * 1000, 3),
+            }
+        return report
+
+
+def _check(resp, expected=(200, 201)):
+    if resp.status_code not in expected:
+        raise RuntimeError(f"{resp.request.method} {resp.request.path} -> {resp.status_code}: {resp.get_data(as_text=True)}")
+    return resp.get_json()
+
+
+class BenchContext:
+    def __init__(self, app, seed):
+        self.app = app
+        self.client = app.test_client()
+        self.rng = random.Random(seed)
+
+        with app.app_context():
+            users = {}
+            for user in db.session.query(User).filter(User.username.like("load_%")).order_by(User.id.asc()):
+                users.setdefault(user.role, user)
+            self.mesero_id = users[RoleEnum.MESERO].id
+            self.cajero_id = users[RoleEnum.CAJERO].id
+            self.mesa_ids = [m.id for m in db.session.query(Mesa).filter(Mesa.estado == MesaEstadoEnum.LIBRE)]
+            self.platillo_ids = [p.id for p in db.session.query(Platillo).filter(Platillo.activo.is_(True))]
+            self.producto_ids = [p.id for p in db.session.query(Producto.id)]
+            self.headers = {role: self._login(user.username) for role, user in users.items()}
+
+    def _login(self, username):
+        data = _check(self.client.post("/auth/login", json={"username": username, "password": LOAD_PASSWORD}))
+        return {"Authorization": f"Bearer {data['access_token']}"}
+
+
+def run_order_rounds(ctx, recorder, iterations, items_per_order=3):
+    """Ciclo completo de pedidos dentro de aperturas de caja, cerrando caja al final de cada ronda."""
+    client = ctx.client
+    mesero_h = ctx.headers[RoleEnum.MESERO]
+    cocina_h = ctx.headers[RoleEnum.COCINA]
+    cajero_h = ctx.headers[RoleEnum.CAJERO]
+    per_round = max(1, min(iterations, 20))
+
+    done = 0
+    while done < iterations:
+        apertura = _check(client.post("/caja/apertura", json={"user_id": ctx.cajero_id, "monto_inicial": 100}, headers=cajero_h))
+        for _ in range(min(per_round, iterations - done)):
+            started = time.perf_counter()
+            mesa_id = ctx.rng.choice(ctx.mesa_ids)
+            pedido = recorder.timed(
+                "pedido.create",
+                lambda: _check(client.post("/pedidos", json={"mesa_id": mesa_id, "user_id": ctx.mesero_id}, headers=mesero_h)),
+            )
+            for _ in range(items_per_order):
+                payload = {"platillo_id": ctx.rng.choice(ctx.platillo_ids), "cantidad": ctx.rng.randint(1, 2)}
+                recorder.timed(
+                    "pedido.add_item",
+                    lambda: _check(client.post(f"/pedidos/{pedido['id']}/items", json=payload, headers=mesero_h)),
+                )
+            for estado, headers in (("PREPARACION", mesero_h), ("SERVIDO", cocina_h)):
+                recorder.timed(
+                    "pedido.update_estado",
+                    lambda: _check(client.patch(f"/pedidos/{pedido['id']}/estado", json={"estado": estado}, headers=headers)),
+                )
+            recorder.timed(
+                "caja.cobro",
+                lambda: _check(client.post("/caja/cobro", json={"pedido_id": pedido["id"], "metodo": "EFECTIVO"}, headers=cajero_h)),
+            )
+            recorder.samples.setdefault("pedido.lifecycle", []).append(time.perf_counter() - started)
+            done += 1
+
+        recorder.timed(
+            "caja.close_cashbox",
+            lambda: _check(client.post("/caja/cierre", json={"apertura_caja_id": apertura["id"]}, headers=cajero_h)),
+        )
+
+
+def run_kardex(ctx, recorder, iterations):
+    admin_h = ctx.headers[RoleEnum.ADMIN]
+    for _ in range(iterations):
+        producto_id = ctx.rng.choice(ctx.producto_ids)
+        recorder.timed("inventario.get_kardex", lambda: _check(ctx.client.get(f"/kardex/{producto_id}", headers=admin_h)))
+
+
+def run_listings(ctx, recorder, iterations):
+    admin_h = ctx.headers[RoleEnum.ADMIN]
+    ayer = (datetime.utcnow() - timedelta(days=1)).date().isoformat()
+    endpoints = {
+        "listado.productos": "/productos",
+        "listado.platillos": "/platillos",
+        "listado.mesas": "/mesas",
+        "listado.pedidos_abiertos": "/pedidos?estado=ABIERTO",
+        "listado.pedidos_ultimo_dia": f"/pedidos?date_from={ayer}",
+        "listado.compras": "/compras",
+        "listado.inventarios_fisicos": "/inventarios-fisicos",
+    }
+    for _ in range(iterations):
+        for name, path in endpoints.items():
+            recorder.timed(name, lambda: _check(ctx.client.get(path, headers=admin_h)))
+
+
+def compare_with_baseline(report, baseline, tolerance, min_delta_ms):
+    regressions = []
+    for name, stats in report.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        limit = reference["p95_ms"] * (1 + tolerance)
+        if stats["p95_ms"] > limit and stats["p95_ms"] - reference["p95_ms"] > min_delta_ms:
+            regressions.append((name, reference["p95_ms"], stats["p95_ms"]))
+    return regressions
+
+
+def print_report(report, out=sys.stdout):
+    header = f"{'escenario':32} {'n':>6} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}"
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    for name, stats in report.items():
+        print(
+            f"{name:32} {stats['n']:>6} {stats['ops_per_s']:>10} {stats['p50_ms']:>10} "
+            f"{stats['p95_ms']:>10} {stats['p99_ms']:>10} {stats['max_ms']:>10}",
+            file=out,
+        )
+
+
+def build_app(database_url):
+    class BenchConfig:
+        TESTING = True
+        SECRET_KEY = "bench-secret"
+        JWT_SECRET_KEY = "bench-jwt-secret"
+        JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=8)
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        SQLALCHEMY_DATABASE_URI = database_url
+        METRICS_ENABLED = False
+
+    return create_app(BenchConfig)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de rutas críticas del backend")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--iterations", type=int, default=200, help="Ciclos de pedido y lecturas de kardex.")
+    parser.add_argument("--listing-iterations", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=None, help="Por defecto usa un SQLite temporal.")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Aumento relativo de p95 permitido.")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignora regresiones menores a esto.")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--json", dest="json_path", default=None, help="Guarda el reporte en JSON.")
+    args = parser.parse_args(argv)
+
+    db_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, db_path = tempfile.mkstemp(prefix="garrobito_bench_", suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{db_path}"
+
+    try:
+        app = build_app(database_url)
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            with db.session.begin():
+                counts = generate_load_data(seed=args.seed, **SCALES[args.scale])
+            print(f"Datos generados en {time.perf_counter() - started:.1f}s: {counts}")
+
+        ctx = BenchContext(app, args.seed)
+        recorder = Recorder()
+        run_order_rounds(ctx, recorder, args.iterations)
+        run_kardex(ctx, recorder, args.iterations)
+        run_listings(ctx, recorder, args.listing_iterations)
+        report = recorder.summary()
+    finally:
+        if db_path:
+            os.unlink(db_path)
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump({"scale": args.scale, "report": report}, fh, indent=2, sort_keys=True)
+
+    baseline_all = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline_all = json.load(fh)
+
+    if args.update_baseline:
+        baseline_all[args.scale] = report
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(baseline_all, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"Baseline actualizado para escala {args.scale}")
+        return 0
+
+    regressions = compare_with_baseline(report, baseline_all.get(args.scale, {}), args.tolerance, args.min_delta_ms)
+    for name, before, after in regressions:
+        print(f"REGRESIÓN {name}: p95 {before} ms -> {after} ms")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Benchmark de contención sobre mesas: muchos meseros abriendo pedido en las mismas mesas a la vez.
+
+Uso:
+
+    cd backend
+    python -m benchmarks.bench_mesa_contention --threads 16 --mesas 4 --rounds 50
+
+En cada ronda todos los hilos esperan en una barrera y luego intentan `POST /pedidos` sobre un
+conjunto pequeño de mesas. Al terminar la ronda cada mesa debe tener exactamente un pedido activo;
+después se cancelan los pedidos para liberar las mesas y empieza la siguiente ronda.
+Sale con código 1 si alguna mesa quedó con más de un pedido activo o si hubo errores inesperados.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from app.extensions import db
+from app.models import Mesa, MesaEstadoEnum, Pedido, PedidoEstadoEnum, RoleEnum, User
+from benchmarks.bench_hot_paths import Recorder, print_report
+
+
+BENCH_PASSWORD = "bench123"
+
+
+def build_app(database_url):
+    class BenchConfig:
+        TESTING = True
+        SECRET_KEY = "bench-secret"
+        JWT_SECRET_KEY = "bench-jwt-secret"
+        JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=8)
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        SQLALCHEMY_DATABASE_URI = database_url
+        METRICS_ENABLED = False
+
+    if database_url.startswith("sqlite"):
+        # SQLite serializa las escrituras; los hilos esperan el lock en vez de fallar.
+        BenchConfig.SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"timeout": 30}}
+    return create_app(BenchConfig)
+
+
+def _seed(app, threads, mesas):
+    with app.app_context():
+        with db.session.begin():
+            users = [
+                User(
+                    username=f"bench_mesero_{index}",
+                    password_hash=generate_password_hash(BENCH_PASSWORD),
+                    role=RoleEnum.MESERO,
+                    is_active=True,
+                )
+                for index in range(threads)
+            ]
+            db.session.add_all(users)
+            db.session.add_all(Mesa(numero=9000 + index, estado=MesaEstadoEnum.LIBRE) for index in range(mesas))
+        mesa_ids = [m.id for m in db.session.query(Mesa).filter(Mesa.numero >= 9000).order_by(Mesa.id.asc())]
+        return [(u.id, u.username) for u in users], mesa_ids
+
+
+def _login(client, username):
+    resp = client.post("/auth/login", json={"username": username, "password": BENCH_PASSWORD})
+    if resp.status_code != 200:
+        raise RuntimeError(f"login {username} -> {resp.status_code}")
+    return {"Authorization": f"Bearer {resp.get_json()['access_token']}"}
+
+
+def _active_by_mesa(app, mesa_ids):
+    with app.app_context():
+        activos = {mesa_id: [] for mesa_id in mesa_ids}
+        for pedido in db.session.query(Pedido).filter(
+            Pedido.mesa_id.in_(mesa_ids),
+            Pedido.estado.notin_([PedidoEstadoEnum.CANCELADO, PedidoEstadoEnum.COBRADO]),
+        ):
+            activos[pedido.mesa_id].append(pedido.id)
+        db.session.remove()
+        return activos
+
+
+def run(app, users, mesa_ids, rounds, seed):
+    barrier = threading.Barrier(len(users))
+    recorders = [Recorder() for _ in users]
+    outcomes = {"creado": 0, "ocupada": 0, "conflicto": 0, "error": 0}
+    outcomes_lock = threading.Lock()
+    violations = []
+
+    def claim(client, headers, mesa_id, user_id, recorder):
+        try:
+            resp = recorder.timed(
+                "mesa.claim",
+                client.post,
+                "/pedidos",
+                json={"mesa_id": mesa_id, "user_id": user_id},
+                headers=headers,
+            )
+        except Exception as exc:
+            # Con TESTING=True las excepciones no manejadas (p. ej. "database is locked") llegan aquí.
+            print(f"ERROR mesa {mesa_id}: {str(exc).splitlines()[0]}", file=sys.stderr)
+            return "error"
+        if resp.status_code == 201:
+            return "creado"
+        if resp.status_code == 400 and "ocupada" in (resp.get_json() or {}).get("error", "").lower():
+            return "ocupada"
+        if resp.status_code == 409:
+            return "conflicto"
+        return "error"
+
+    def worker(index, user_id, username):
+        client = app.test_client()
+        headers = _login(client, username)
+        rng = random.Random(seed + index)
+        for _ in range(rounds):
+            barrier.wait()
+            outcome = claim(client, headers, rng.choice(mesa_ids), user_id, recorders[index])
+            with outcomes_lock:
+                outcomes[outcome] += 1
+
+            # El hilo 0 verifica el invariante y libera las mesas mientras los demás esperan.
+            if barrier.wait() == 0:
+                for mesa_id_check, pedidos in _active_by_mesa(app, mesa_ids).items():
+                    if len(pedidos) > 1:
+                        violations.append((mesa_id_check, pedidos))
+                    for pedido_id in pedidos:
+                        client.patch(f"/pedidos/{pedido_id}/estado", json={"estado": "CANCELADO"}, headers=headers)
+            barrier.wait()
+
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(index, user_id, username))
+        for index, (user_id, username) in enumerate(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    merged = Recorder()
+    for recorder in recorders:
+        for name, values in recorder.samples.items():
+            merged.samples.setdefault(name, []).extend(values)
+    return merged.summary(), outcomes, violations, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Contención de meseros sobre las mismas mesas")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--mesas", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=None, help="Por defecto usa un SQLite temporal.")
+    args = parser.parse_args(argv)
+
+    db_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, db_path = tempfile.mkstemp(prefix="garrobito_bench_mesas_", suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{db_path}"
+
+    try:
+        app = build_app(database_url)
+        with app.app_context():
+            db.create_all()
+        users, mesa_ids = _seed(app, args.threads, args.mesas)
+        report, outcomes, violations, elapsed = run(app, users, mesa_ids, args.rounds, args.seed)
+    finally:
+        if db_path:
+            os.unlink(db_path)
+
+    print_report(report)
+    print(f"Intentos: {sum(outcomes.values())} en {elapsed:.1f}s -> {outcomes}")
+    for mesa_id, pedidos in violations:
+        print(f"VIOLACIÓN mesa {mesa_id}: pedidos activos {pedidos}")
+    return 1 if violations or outcomes["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,3 +22,13 @@ class Config:
     JENKINS_JOB_NAME = os.getenv("JENKINS_JOB_NAME", "garrobito-deploy").strip()
     JENKINS_VERIFY_SSL = _as_bool(os.getenv("JENKINS_VERIFY_SSL"), default=True)
     DEPLOY_API_KEY = os.getenv("DEPLOY_API_KEY", "").strip()
+    METRICS_ENABLED = _as_bool(os.getenv("METRICS_ENABLED"), default=True)
+    METRICS_API_KEY = os.getenv("METRICS_API_KEY", "").strip()
+    PROFILING_ENABLED = _as_bool(os.getenv("PROFILING_ENABLED"), default=False)
+    PROFILING_DIR = os.getenv("PROFILING_DIR", "").strip()
+    PROFILING_MAX_CONCURRENT = int(os.getenv("PROFILING_MAX_CONCURRENT", "1"))
+    PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "50"))
+    IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+    IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "1024"))
+    STOCK_ALERTS_DELAY_SECONDS = float(os.getenv("STOCK_ALERTS_DELAY_SECONDS", "10"))
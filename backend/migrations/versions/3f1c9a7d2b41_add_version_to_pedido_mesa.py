@@ -0,0 +1,32 @@
+"""add version to pedido and mesa
+
+Revision ID: 3f1c9a7d2b41
+Revises: 628561ba9379
+Create Date: 2026-10-19 10:12:41.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b41'
+down_revision = '628561ba9379'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('mesa', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    with op.batch_alter_table('pedido', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('pedido', schema=None) as batch_op:
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('mesa', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,44 @@
+"""store pedido totals as numeric cents
+
+Revision ID: 8b2e4d6f1a93
+Revises: 3f1c9a7d2b41
+Create Date: 2026-10-19 11:02:17.884310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a93'
+down_revision = '3f1c9a7d2b41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pedido_detalle', schema=None) as batch_op:
+        batch_op.alter_column('subtotal',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+
+    with op.batch_alter_table('pedido', schema=None) as batch_op:
+        batch_op.alter_column('total',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('pedido', schema=None) as batch_op:
+        batch_op.alter_column('total',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('pedido_detalle', schema=None) as batch_op:
+        batch_op.alter_column('subtotal',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
@@ -0,0 +1,26 @@
+"""index movimiento_inventario in kardex order
+
+Revision ID: a7d3e9c15f42
+Revises: f4a8b2d60c19
+Create Date: 2026-10-19 20:12:48.517330
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e9c15f42'
+down_revision = 'f4a8b2d60c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('movimiento_inventario', schema=None) as batch_op:
+        batch_op.create_index('ix_movimiento_inventario_producto_kardex', ['producto_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('movimiento_inventario', schema=None) as batch_op:
+        batch_op.drop_index('ix_movimiento_inventario_producto_kardex')
@@ -0,0 +1,37 @@
+"""add costo_receta to platillo
+
+Revision ID: a9d4c2e7f310
+Revises: e5d83b17c6a0
+Create Date: 2026-10-19 13:05:12.208431
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4c2e7f310'
+down_revision = 'e5d83b17c6a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('platillo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('costo_receta', sa.Numeric(precision=14, scale=6), server_default='0', nullable=False))
+
+    op.execute(
+        """
+        UPDATE platillo SET costo_receta = ROUND((
+            SELECT COALESCE(SUM(pi.cantidad_por_unidad * p.costo_promedio), 0)
+            FROM platillo_ingrediente pi
+            JOIN producto p ON p.id = pi.producto_id
+            WHERE pi.platillo_id = platillo.id
+        ), 6)
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('platillo', schema=None) as batch_op:
+        batch_op.drop_column('costo_receta')
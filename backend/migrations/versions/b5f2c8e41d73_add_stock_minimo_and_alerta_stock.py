@@ -0,0 +1,48 @@
+"""add producto.stock_minimo, producto.bajo_stock and alerta_stock
+
+Revision ID: b5f2c8e41d73
+Revises: a7d3e9c15f42
+Create Date: 2026-10-19 21:34:06.918245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5f2c8e41d73'
+down_revision = 'a7d3e9c15f42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stock_minimo', sa.Numeric(precision=14, scale=6), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('bajo_stock', sa.Boolean(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_producto_bajo_stock'), ['bajo_stock'], unique=False)
+
+    op.create_table('alerta_stock',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('producto_id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.Enum('BAJO_STOCK', 'REPUESTO', name='alertastocktipoenum'), nullable=False),
+    sa.Column('stock_actual', sa.Numeric(precision=14, scale=6), nullable=False),
+    sa.Column('stock_minimo', sa.Numeric(precision=14, scale=6), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['producto_id'], ['producto.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('alerta_stock', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_alerta_stock_producto_id'), ['producto_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('alerta_stock', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_alerta_stock_producto_id'))
+
+    op.drop_table('alerta_stock')
+
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_producto_bajo_stock'))
+        batch_op.drop_column('bajo_stock')
+        batch_op.drop_column('stock_minimo')
@@ -0,0 +1,37 @@
+"""add porciones_disponibles to platillo
+
+Revision ID: b6e1f8a2c954
+Revises: a9d4c2e7f310
+Create Date: 2026-10-19 14:22:07.915604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1f8a2c954'
+down_revision = 'a9d4c2e7f310'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('platillo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('porciones_disponibles', sa.Integer(), nullable=True))
+
+    op.execute(
+        """
+        UPDATE platillo SET porciones_disponibles = (
+            SELECT MIN(FLOOR(ROUND(CASE WHEN p.activo = 1 THEN p.stock_actual ELSE 0 END / pi.cantidad_por_unidad, 6)))
+            FROM platillo_ingrediente pi
+            JOIN producto p ON p.id = pi.producto_id
+            WHERE pi.platillo_id = platillo.id
+        )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('platillo', schema=None) as batch_op:
+        batch_op.drop_column('porciones_disponibles')
@@ -0,0 +1,40 @@
+"""add reserva_inventario and producto.stock_reservado
+
+Revision ID: c3a7e5d19f02
+Revises: b6e1f8a2c954
+Create Date: 2026-10-19 15:40:51.337102
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a7e5d19f02'
+down_revision = 'b6e1f8a2c954'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stock_reservado', sa.Numeric(precision=14, scale=6), server_default='0', nullable=False))
+
+    op.create_table('reserva_inventario',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('pedido_id', sa.Integer(), nullable=False),
+    sa.Column('producto_id', sa.Integer(), nullable=False),
+    sa.Column('cantidad', sa.Numeric(precision=14, scale=6), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['pedido_id'], ['pedido.id'], ),
+    sa.ForeignKeyConstraint(['producto_id'], ['producto.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('pedido_id', 'producto_id', name='uq_reserva_inventario_pedido_producto')
+    )
+
+
+def downgrade():
+    op.drop_table('reserva_inventario')
+
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.drop_column('stock_reservado')
@@ -0,0 +1,250 @@
+"""numeric money and quantity columns
+
+Revision ID: c47a1e90d5b2
+Revises: 8b2e4d6f1a93
+Create Date: 2026-10-19 11:48:05.137942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a1e90d5b2'
+down_revision = '8b2e4d6f1a93'
+branch_labels = None
+depends_on = None
+
+
+# Montos en Numeric(12, 2); cantidades, stock y costos unitarios en Numeric(14, 6).
+# MariaDB redondea los DOUBLE existentes a la escala nueva al alterar la columna.
+def upgrade():
+    with op.batch_alter_table('pedido_detalle', schema=None) as batch_op:
+        batch_op.alter_column('cantidad',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+        batch_op.alter_column('precio_unitario',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+
+    with op.batch_alter_table('platillo', schema=None) as batch_op:
+        batch_op.alter_column('precio',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+
+    with op.batch_alter_table('platillo_ingrediente', schema=None) as batch_op:
+        batch_op.alter_column('cantidad_por_unidad',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.alter_column('stock_actual',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+        batch_op.alter_column('costo_promedio',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+
+    with op.batch_alter_table('movimiento_inventario', schema=None) as batch_op:
+        batch_op.alter_column('cantidad',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+        batch_op.alter_column('costo_unitario',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+        batch_op.alter_column('saldo_cantidad',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+        batch_op.alter_column('costo_promedio_resultante',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+
+    with op.batch_alter_table('compra', schema=None) as batch_op:
+        batch_op.alter_column('total',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+
+    with op.batch_alter_table('detalle_compra', schema=None) as batch_op:
+        batch_op.alter_column('cantidad',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+        batch_op.alter_column('costo_unitario',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+        batch_op.alter_column('subtotal',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+
+    with op.batch_alter_table('inventario_fisico_det', schema=None) as batch_op:
+        batch_op.alter_column('conteo',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+        batch_op.alter_column('stock_sistema',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+        batch_op.alter_column('diferencia',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=14, scale=6),
+               existing_nullable=False)
+
+    with op.batch_alter_table('apertura_caja', schema=None) as batch_op:
+        batch_op.alter_column('monto_inicial',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+
+    with op.batch_alter_table('cobro', schema=None) as batch_op:
+        batch_op.alter_column('monto',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+
+    with op.batch_alter_table('cierre_caja', schema=None) as batch_op:
+        batch_op.alter_column('total_ventas',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+        batch_op.alter_column('total_efectivo',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+        batch_op.alter_column('total_tarjeta',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+        batch_op.alter_column('total_transferencia',
+               existing_type=sa.Float(),
+               type_=sa.Numeric(precision=12, scale=2),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cierre_caja', schema=None) as batch_op:
+        batch_op.alter_column('total_ventas',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('total_efectivo',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('total_tarjeta',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('total_transferencia',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('cobro', schema=None) as batch_op:
+        batch_op.alter_column('monto',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('apertura_caja', schema=None) as batch_op:
+        batch_op.alter_column('monto_inicial',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('inventario_fisico_det', schema=None) as batch_op:
+        batch_op.alter_column('conteo',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('stock_sistema',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('diferencia',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('detalle_compra', schema=None) as batch_op:
+        batch_op.alter_column('cantidad',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('costo_unitario',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('subtotal',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('compra', schema=None) as batch_op:
+        batch_op.alter_column('total',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('movimiento_inventario', schema=None) as batch_op:
+        batch_op.alter_column('cantidad',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('costo_unitario',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('saldo_cantidad',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('costo_promedio_resultante',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.alter_column('stock_actual',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('costo_promedio',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('platillo_ingrediente', schema=None) as batch_op:
+        batch_op.alter_column('cantidad_por_unidad',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('platillo', schema=None) as batch_op:
+        batch_op.alter_column('precio',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
+
+    with op.batch_alter_table('pedido_detalle', schema=None) as batch_op:
+        batch_op.alter_column('cantidad',
+               existing_type=sa.Numeric(precision=14, scale=6),
+               type_=sa.Float(),
+               existing_nullable=False)
+        batch_op.alter_column('precio_unitario',
+               existing_type=sa.Numeric(precision=12, scale=2),
+               type_=sa.Float(),
+               existing_nullable=False)
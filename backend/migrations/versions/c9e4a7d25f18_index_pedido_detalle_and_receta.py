@@ -0,0 +1,32 @@
+"""index pedido_detalle.pedido_id and platillo_ingrediente.platillo_id
+
+Revision ID: c9e4a7d25f18
+Revises: b5f2c8e41d73
+Create Date: 2026-10-19 23:05:41.207913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4a7d25f18'
+down_revision = 'b5f2c8e41d73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pedido_detalle', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pedido_detalle_pedido_id'), ['pedido_id'], unique=False)
+
+    with op.batch_alter_table('platillo_ingrediente', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_platillo_ingrediente_platillo_id'), ['platillo_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('platillo_ingrediente', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_platillo_ingrediente_platillo_id'))
+
+    with op.batch_alter_table('pedido_detalle', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pedido_detalle_pedido_id'))
@@ -0,0 +1,26 @@
+"""add idempotency_key.response_etag
+
+Revision ID: d3b8f1a06e29
+Revises: c9e4a7d25f18
+Create Date: 2026-10-20 10:14:27.530218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3b8f1a06e29'
+down_revision = 'c9e4a7d25f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('response_etag', sa.String(length=80), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.drop_column('response_etag')
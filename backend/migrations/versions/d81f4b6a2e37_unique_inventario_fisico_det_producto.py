@@ -0,0 +1,37 @@
+"""unique producto per inventario_fisico_det
+
+Revision ID: d81f4b6a2e37
+Revises: c3a7e5d19f02
+Create Date: 2026-10-19 17:02:44.120583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f4b6a2e37'
+down_revision = 'c3a7e5d19f02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Antes se aceptaban líneas repetidas por producto; se conserva la última de cada conteo.
+    op.execute(
+        """
+        DELETE FROM inventario_fisico_det
+        WHERE id NOT IN (
+            SELECT id FROM (
+                SELECT MAX(id) AS id FROM inventario_fisico_det GROUP BY inventario_fisico_id, producto_id
+            ) AS ultimas
+        )
+        """
+    )
+    with op.batch_alter_table('inventario_fisico_det', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_inventario_fisico_det_producto', ['inventario_fisico_id', 'producto_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('inventario_fisico_det', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_inventario_fisico_det_producto', type_='unique')
@@ -0,0 +1,26 @@
+"""index movimiento_inventario by referencia
+
+Revision ID: e2c9a4f71b08
+Revises: d81f4b6a2e37
+Create Date: 2026-10-19 18:21:07.403915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c9a4f71b08'
+down_revision = 'd81f4b6a2e37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('movimiento_inventario', schema=None) as batch_op:
+        batch_op.create_index('ix_movimiento_inventario_referencia', ['referencia_tipo', 'referencia_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('movimiento_inventario', schema=None) as batch_op:
+        batch_op.drop_index('ix_movimiento_inventario_referencia')
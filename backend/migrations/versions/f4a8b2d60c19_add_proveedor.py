@@ -0,0 +1,84 @@
+"""add proveedor, proveedor_termino and compra.proveedor_id
+
+Revision ID: f4a8b2d60c19
+Revises: e2c9a4f71b08
+Create Date: 2026-10-19 19:05:32.884106
+
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a8b2d60c19'
+down_revision = 'e2c9a4f71b08'
+branch_labels = None
+depends_on = None
+
+
+def _normalize(nombre):
+    # Copia de supplier_service.normalize_nombre: la migración no debe depender del código de la app.
+    texto = unicodedata.normalize("NFKD", nombre or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).casefold()
+    # Un nombre hecho solo de signos ("***") se conserva tal cual para no fusionarlo con otro.
+    return " ".join(re.sub(r"[\W_]+", " ", texto).split()) or " ".join(texto.split())
+
+
+def upgrade():
+    proveedor = op.create_table('proveedor',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=120), nullable=False),
+    sa.Column('nombre_normalizado', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('nombre_normalizado')
+    )
+    termino = op.create_table('proveedor_termino',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('proveedor_id', sa.Integer(), nullable=False),
+    sa.Column('termino', sa.String(length=120), nullable=False),
+    sa.ForeignKeyConstraint(['proveedor_id'], ['proveedor.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('proveedor_id', 'termino', name='uq_proveedor_termino')
+    )
+    with op.batch_alter_table('proveedor_termino', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_proveedor_termino_termino'), ['termino'], unique=False)
+
+    with op.batch_alter_table('compra', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('proveedor_id', sa.Integer(), nullable=True))
+
+    # Un proveedor por nombre normalizado; se conserva como nombre el primero que se registró.
+    conn = op.get_bind()
+    compra = sa.table('compra', sa.column('id', sa.Integer), sa.column('proveedor', sa.String), sa.column('proveedor_id', sa.Integer))
+    proveedores = {}
+    for (nombre,) in conn.execute(sa.select(compra.c.proveedor).group_by(compra.c.proveedor).order_by(sa.func.min(compra.c.id))):
+        normalizado = _normalize(nombre) or "sin proveedor"
+        proveedor_id = proveedores.get(normalizado)
+        if proveedor_id is None:
+            proveedor_id = conn.execute(
+                proveedor.insert().values(nombre=" ".join(nombre.split()) or "Sin proveedor", nombre_normalizado=normalizado)
+            ).inserted_primary_key[0]
+            proveedores[normalizado] = proveedor_id
+            terminos = sorted(set(normalizado.split()))
+            conn.execute(termino.insert(), [{"proveedor_id": proveedor_id, "termino": t} for t in terminos])
+        conn.execute(compra.update().where(compra.c.proveedor == nombre).values(proveedor_id=proveedor_id))
+
+    with op.batch_alter_table('compra', schema=None) as batch_op:
+        batch_op.alter_column('proveedor_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_index(batch_op.f('ix_compra_proveedor_id'), ['proveedor_id'], unique=False)
+        batch_op.create_foreign_key('fk_compra_proveedor_id_proveedor', 'proveedor', ['proveedor_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('compra', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_compra_proveedor_id_proveedor', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_compra_proveedor_id'))
+        batch_op.drop_column('proveedor_id')
+
+    with op.batch_alter_table('proveedor_termino', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_proveedor_termino_termino'))
+
+    op.drop_table('proveedor_termino')
+    op.drop_table('proveedor')
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from app.extensions import db
+from app.models import Compra, IdempotencyKey, MovimientoInventario, Pedido, RoleEnum, User
+
+
+class IdempotencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(prefix="garrobito_test_idempotency_", suffix=".db")
+
+        class TestConfig:
+            TESTING = True
+            SECRET_KEY = "test-secret"
+            JWT_SECRET_KEY = "test-jwt-secret"
+            SQLALCHEMY_TRACK_MODIFICATIONS = False
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.db_path}"
+
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def _create_user(self, username, password, role):
+        with self.app.app_context():
+            user = User(
+                username=username,
+                password_hash=generate_password_hash(password),
+                role=role,
+                is_active=True,
+            )
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+
+    def _login_headers(self, username, password):
+        resp = self.client.post("/auth/login", json={"username": username, "password": password})
+        self.assertEqual(resp.status_code, 200)
+        token = resp.get_json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_reintento_de_compra_no_duplica_movimientos(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        producto_id = self.client.post(
+            "/productos", json={"nombre": "Arroz", "unidad": "kg"}, headers=admin_h
+        ).get_json()["id"]
+        payload = {"proveedor": "Mercado", "detalles": [{"producto_id": producto_id, "cantidad": 5, "costo_unitario": 2}]}
+        headers = {**admin_h, "Idempotency-Key": "compra-001"}
+
+        primera = self.client.post("/compras", json=payload, headers=headers)
+        self.assertEqual(primera.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", primera.headers)
+
+        # Sin la LRU del proceso, el reintento se responde desde la tabla.
+        self.app.extensions.pop("idempotency_cache", None)
+        reintento = self.client.post("/compras", json=payload, headers=headers)
+        self.assertEqual(reintento.status_code, 201)
+        self.assertEqual(reintento.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(reintento.get_json(), primera.get_json())
+
+        otro_cuerpo = self.client.post(
+            "/compras",
+            json={**payload, "proveedor": "Otro"},
+            headers=headers,
+        )
+        self.assertEqual(otro_cuerpo.status_code, 422)
+
+        with self.app.app_context():
+            self.assertEqual(db.session.query(Compra).count(), 1)
+            self.assertEqual(db.session.query(MovimientoInventario).count(), 1)
+
+    def test_respuesta_con_error_libera_la_clave(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        mesero_id = self._create_user("mesero", "mesero123", RoleEnum.MESERO)
+        mesero_h = self._login_headers("mesero", "mesero123")
+        headers = {**mesero_h, "Idempotency-Key": "pedido-mesa-3"}
+
+        fallido = self.client.post("/pedidos", json={"mesa_id": 3, "user_id": mesero_id}, headers=headers)
+        self.assertEqual(fallido.status_code, 404)
+        with self.app.app_context():
+            self.assertEqual(db.session.query(IdempotencyKey).count(), 0)
+
+        mesa_id = self.client.post("/mesas", json={"numero": 3}, headers=mesero_h).get_json()["id"]
+        payload = {"mesa_id": mesa_id, "user_id": mesero_id}
+        creado = self.client.post("/pedidos", json=payload, headers=headers)
+        self.assertEqual(creado.status_code, 201)
+
+        reintento = self.client.post("/pedidos", json=payload, headers=headers)
+        self.assertEqual(reintento.status_code, 201)
+        self.assertEqual(reintento.get_json()["id"], creado.get_json()["id"])
+        self.assertEqual(reintento.headers["ETag"], creado.headers["ETag"])
+
+        self.app.extensions.pop("idempotency_cache", None)
+        desde_tabla = self.client.post("/pedidos", json=payload, headers=headers)
+        self.assertEqual(desde_tabla.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(desde_tabla.headers["ETag"], creado.headers["ETag"])
+
+        with self.app.app_context():
+            self.assertEqual(db.session.query(Pedido).count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
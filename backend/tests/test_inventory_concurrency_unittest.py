@@ -0,0 +1,157 @@
+import os
+import tempfile
+import threading
+import unittest
+from decimal import Decimal
+
+from app import create_app
+from app.extensions import db
+from app.models import Mesa, MesaEstadoEnum, MovimientoInventario, MovimientoTipoEnum, Producto
+from app.services.inventory_service import (
+    InventoryError,
+    assert_stock_matches_last_movement,
+    register_output,
+    register_purchase,
+    reserve_stock,
+)
+from app.services.order_service import OrderError, claim_mesa
+
+
+class InventoryConcurrencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(prefix="garrobito_test_concurrency_", suffix=".db")
+
+        class TestConfig:
+            TESTING = True
+            SECRET_KEY = "test-secret"
+            JWT_SECRET_KEY = "test-jwt-secret"
+            SQLALCHEMY_TRACK_MODIFICATIONS = False
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.db_path}"
+            SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"timeout": 30}}
+
+        self.app = create_app(TestConfig)
+
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def _create_producto(self, nombre, stock, costo):
+        with self.app.app_context():
+            with db.session.begin():
+                producto = Producto(nombre=nombre, unidad="kg", stock_actual=0.0, costo_promedio=0.0, activo=True)
+                db.session.add(producto)
+                db.session.flush()
+                register_purchase(producto.id, stock, costo, "TEST", 0)
+            return producto.id
+
+    def _run_threads(self, jobs):
+        barrier = threading.Barrier(len(jobs))
+        results = [None] * len(jobs)
+
+        def worker(index, job):
+            with self.app.app_context():
+                barrier.wait()
+                try:
+                    with db.session.begin():
+                        job(index)
+                    results[index] = True
+                except (InventoryError, OrderError):
+                    results[index] = False
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=worker, args=(index, job)) for index, job in enumerate(jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _assert_kardex_chain(self, producto_id):
+        with self.app.app_context():
+            assert_stock_matches_last_movement(producto_id)
+            movimientos = (
+                db.session.query(MovimientoInventario)
+                .filter(MovimientoInventario.producto_id == producto_id)
+                .order_by(MovimientoInventario.id.asc())
+                .all()
+            )
+            saldo = Decimal("0")
+            for mov in movimientos:
+                saldo += mov.cantidad
+                self.assertEqual(mov.saldo_cantidad, saldo)
+                self.assertGreaterEqual(mov.saldo_cantidad, 0)
+            return db.session.get(Producto, producto_id).stock_actual
+
+    def test_salidas_concurrentes_no_sobrevenden(self):
+        producto_id = self._create_producto("Harina", 50, 2)
+
+        results = self._run_threads(
+            [
+                lambda index: register_output(producto_id, 3, MovimientoTipoEnum.VENTA, "PEDIDO", index)
+                for _ in range(24)
+            ]
+        )
+
+        self.assertEqual(results.count(True), 16)
+        self.assertEqual(results.count(False), 8)
+        self.assertEqual(self._assert_kardex_chain(producto_id), 2.0)
+
+    def test_compras_y_salidas_concurrentes_mantienen_saldos(self):
+        producto_id = self._create_producto("Aceite", 10, 4)
+
+        def job(index):
+            if index % 2 == 0:
+                register_purchase(producto_id, 2, 6, "COMPRA", index)
+            else:
+                register_output(producto_id, 1, MovimientoTipoEnum.VENTA, "PEDIDO", index)
+
+        results = self._run_threads([job for _ in range(20)])
+
+        self.assertTrue(all(results))
+        self.assertEqual(self._assert_kardex_chain(producto_id), 20.0)
+        with self.app.app_context():
+            ultimo = (
+                db.session.query(MovimientoInventario)
+                .filter(MovimientoInventario.producto_id == producto_id)
+                .order_by(MovimientoInventario.id.desc())
+                .first()
+            )
+            self.assertAlmostEqual(ultimo.costo_promedio_resultante, db.session.get(Producto, producto_id).costo_promedio, places=6)
+
+    def test_reservas_concurrentes_no_exceden_el_stock(self):
+        producto_id = self._create_producto("Queso", 50, 3)
+
+        results = self._run_threads([lambda index: reserve_stock(producto_id, 5) for _ in range(14)])
+
+        self.assertEqual(results.count(True), 10)
+        with self.app.app_context():
+            producto = db.session.get(Producto, producto_id)
+            self.assertEqual(producto.stock_reservado, 50)
+            self.assertEqual(producto.stock_actual, 50)
+
+    def test_claim_mesa_concurrente_solo_una_gana(self):
+        with self.app.app_context():
+            mesa = Mesa(numero=1, estado=MesaEstadoEnum.LIBRE)
+            db.session.add(mesa)
+            db.session.commit()
+            mesa_id = mesa.id
+
+        results = self._run_threads([lambda index: claim_mesa(mesa_id) for _ in range(12)])
+
+        self.assertEqual(results.count(True), 1)
+        with self.app.app_context():
+            mesa = db.session.get(Mesa, mesa_id)
+            self.assertEqual(mesa.estado, MesaEstadoEnum.OCUPADA)
+            self.assertEqual(mesa.version, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
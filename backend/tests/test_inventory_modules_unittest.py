@@ -1,12 +1,32 @@
 import os
 import tempfile
+import threading
 import unittest
+from contextlib import contextmanager
+from datetime import datetime
 
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash
 
 from app import create_app
 from app.extensions import db
-from app.models import RoleEnum, User
+from app.load_data import generate_load_data
+from app.models import (
+    InventarioFisico,
+    InventarioFisicoEstadoEnum,
+    MovimientoInventario,
+    MovimientoTipoEnum,
+    PlatilloIngrediente,
+    Producto,
+    RoleEnum,
+    User,
+)
+from app.services.inventory_service import (
+    assert_stock_matches_last_movement,
+    register_bulk_adjustments,
+    register_output,
+)
+from app.services.kardex_service import replay_kardex
 
 
 class InventoryModulesTestCase(unittest.TestCase):
@@ -52,6 +72,27 @@ class InventoryModulesTestCase(unittest.TestCase):
         token = resp.get_json()["access_token"]
         return {"Authorization": f"Bearer {token}"}
 
+    @contextmanager
+    def _count_statements(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    def _list_statements(self, path, headers):
+        with self._count_statements() as statements:
+            resp = self.client.get(path, headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        return resp, len(statements)
+
     def test_compra_y_aplicacion_inventario_fisico(self):
         self._create_user("admin", "admin123", RoleEnum.ADMIN)
         admin_h = self._login_headers("admin", "admin123")
@@ -92,6 +133,569 @@ class InventoryModulesTestCase(unittest.TestCase):
         harina = next(p for p in productos if p["id"] == producto_id)
         self.assertEqual(harina["stock_actual"], 8.0)
 
+    def test_aplicacion_en_lote_de_inventario_fisico(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        ids = [
+            self.client.post(
+                "/productos",
+                json={"nombre": f"Producto {index}", "unidad": "kg", "stock_actual": 10, "costo_promedio": 2},
+                headers=admin_h,
+            ).get_json()["id"]
+            for index in range(4)
+        ]
+        conteos = [12.5, 7, 10, 0]
+
+        faltante = self.client.post(
+            "/inventarios-fisicos",
+            json={"tipo": "ANUAL", "detalles": [{"producto_id": ids[0], "conteo": 1}, {"producto_id": 999, "conteo": 1}]},
+            headers=admin_h,
+        )
+        self.assertEqual(faltante.status_code, 404)
+        self.assertIn("Producto 999", faltante.get_json()["error"])
+        self.assertEqual(self.client.get("/inventarios-fisicos", headers=admin_h).get_json(), [])
+
+        inv_id = self.client.post(
+            "/inventarios-fisicos",
+            json={"tipo": "ANUAL", "detalles": [{"producto_id": pid, "conteo": c} for pid, c in zip(ids, conteos)]},
+            headers=admin_h,
+        ).get_json()["id"]
+        aplicar = self.client.post(f"/inventarios-fisicos/{inv_id}/aplicar", headers=admin_h)
+        self.assertEqual(aplicar.status_code, 200)
+        self.assertEqual(aplicar.get_json()["ajustes_positivos"], 1)
+        self.assertEqual(aplicar.get_json()["ajustes_negativos"], 2)
+        self.assertEqual(set(aplicar.get_json()["tiempos_ms"]), {"carga", "calculo", "escritura"})
+
+        productos = {p["id"]: p for p in self.client.get("/productos", headers=admin_h).get_json()}
+        self.assertEqual([productos[pid]["stock_actual"] for pid in ids], conteos)
+        with self.app.app_context():
+            for pid in ids:
+                assert_stock_matches_last_movement(pid)
+            ajustes = (
+                db.session.query(MovimientoInventario)
+                .filter(MovimientoInventario.referencia_tipo == "INVENTARIO_FISICO", MovimientoInventario.referencia_id == inv_id)
+                .all()
+            )
+            self.assertEqual(sorted(float(m.cantidad) for m in ajustes), [-10.0, -3.0, 2.5])
+
+        # Una merma entre el conteo y la aplicación no desfasa el ajuste: la diferencia se recalcula.
+        inv_id = self.client.post(
+            "/inventarios-fisicos",
+            json={"tipo": "MENSUAL", "detalles": [{"producto_id": ids[0], "conteo": 15}, {"producto_id": ids[1], "conteo": 0}]},
+            headers=admin_h,
+        ).get_json()["id"]
+        with self.app.app_context():
+            register_output(ids[1], 5, MovimientoTipoEnum.MERMA, "TEST", 0)
+            db.session.commit()
+        aplicar = self.client.post(f"/inventarios-fisicos/{inv_id}/aplicar", headers=admin_h)
+        self.assertEqual(aplicar.status_code, 200)
+        productos = {p["id"]: p for p in self.client.get("/productos", headers=admin_h).get_json()}
+        self.assertEqual(productos[ids[0]]["stock_actual"], 15)
+        self.assertEqual(productos[ids[1]]["stock_actual"], 0)
+        detalle = {d["producto_id"]: d for d in self.client.get(f"/inventarios-fisicos/{inv_id}", headers=admin_h).get_json()["detalles"]}
+        self.assertEqual(detalle[ids[1]]["stock_sistema"], 2)
+        self.assertEqual(detalle[ids[1]]["diferencia"], -2)
+
+    def test_borrador_de_conteo_por_partes(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        ids = [
+            self.client.post(
+                "/productos",
+                json={"nombre": f"Insumo {index}", "unidad": "kg", "stock_actual": 10, "costo_promedio": 2},
+                headers=admin_h,
+            ).get_json()["id"]
+            for index in range(3)
+        ]
+
+        borrador = self.client.post("/inventarios-fisicos", json={"tipo": "MENSUAL"}, headers=admin_h)
+        self.assertEqual(borrador.status_code, 201)
+        inv_id = borrador.get_json()["id"]
+        vacio = self.client.post(f"/inventarios-fisicos/{inv_id}/aplicar", headers=admin_h)
+        self.assertEqual(vacio.status_code, 400)
+
+        lote = self.client.post(
+            f"/inventarios-fisicos/{inv_id}/detalles",
+            json={"detalles": [{"producto_id": ids[0], "conteo": 4}, {"producto_id": ids[1], "conteo": 6}]},
+            headers=admin_h,
+        )
+        self.assertEqual(lote.status_code, 200)
+        self.assertEqual((lote.get_json()["nuevas"], lote.get_json()["actualizadas"], lote.get_json()["lineas"]), (2, 0, 2))
+
+        # Reenviar el mismo lote reemplaza; en modo sumar se acumula sobre lo ya contado.
+        reenvio = self.client.post(
+            f"/inventarios-fisicos/{inv_id}/detalles",
+            json={"detalles": [{"producto_id": ids[0], "conteo": 4}, {"producto_id": ids[2], "conteo": 9}]},
+            headers=admin_h,
+        )
+        self.assertEqual((reenvio.get_json()["nuevas"], reenvio.get_json()["actualizadas"], reenvio.get_json()["lineas"]), (1, 1, 3))
+        suma = self.client.post(
+            f"/inventarios-fisicos/{inv_id}/detalles",
+            json={"modo": "sumar", "detalles": [{"producto_id": ids[1], "conteo": 1.5}]},
+            headers=admin_h,
+        )
+        self.assertEqual(suma.status_code, 200)
+
+        duplicado = self.client.post(
+            f"/inventarios-fisicos/{inv_id}/detalles",
+            json={"detalles": [{"producto_id": ids[0], "conteo": 1}, {"producto_id": ids[0], "conteo": 2}]},
+            headers=admin_h,
+        )
+        self.assertEqual(duplicado.status_code, 400)
+        faltante = self.client.post(
+            f"/inventarios-fisicos/{inv_id}/detalles", json={"detalles": [{"producto_id": 999, "conteo": 1}]}, headers=admin_h
+        )
+        self.assertEqual(faltante.status_code, 404)
+
+        self.assertEqual(self.client.delete(f"/inventarios-fisicos/{inv_id}/detalles/{ids[2]}", headers=admin_h).status_code, 200)
+        self.assertEqual(self.client.delete(f"/inventarios-fisicos/{inv_id}/detalles/{ids[2]}", headers=admin_h).status_code, 404)
+
+        detalle = self.client.get(f"/inventarios-fisicos/{inv_id}", headers=admin_h).get_json()
+        self.assertEqual({d["producto_id"]: d["conteo"] for d in detalle["detalles"]}, {ids[0]: 4, ids[1]: 7.5})
+
+        aplicar = self.client.post(f"/inventarios-fisicos/{inv_id}/aplicar", headers=admin_h)
+        self.assertEqual(aplicar.status_code, 200)
+        self.assertEqual((aplicar.get_json()["ajustes_positivos"], aplicar.get_json()["ajustes_negativos"]), (0, 2))
+        self.assertNotIn("stock_sistema", aplicar.get_json())
+        productos = {p["id"]: p for p in self.client.get("/productos", headers=admin_h).get_json()}
+        self.assertEqual([productos[pid]["stock_actual"] for pid in ids], [4, 7.5, 10])
+
+        cerrado = self.client.post(
+            f"/inventarios-fisicos/{inv_id}/detalles", json={"detalles": [{"producto_id": ids[2], "conteo": 1}]}, headers=admin_h
+        )
+        self.assertEqual(cerrado.status_code, 400)
+        self.assertEqual(self.client.post(f"/inventarios-fisicos/{inv_id}/aplicar", headers=admin_h).status_code, 400)
+
+    def test_segunda_aplicacion_concurrente_no_pisa_las_diferencias(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+        producto_id = self.client.post(
+            "/productos", json={"nombre": "Aceite", "unidad": "lt", "stock_actual": 10, "costo_promedio": 3}, headers=admin_h
+        ).get_json()["id"]
+        inv_id = self.client.post(
+            "/inventarios-fisicos", json={"tipo": "MENSUAL", "detalles": [{"producto_id": producto_id, "conteo": 7}]}, headers=admin_h
+        ).get_json()["id"]
+
+        # La segunda solicitud leyó el conteo como BORRADOR antes de que la primera confirmara.
+        with self.app.app_context():
+            leido = db.session.get(InventarioFisico, inv_id)
+            self.assertEqual(leido.estado, InventarioFisicoEstadoEnum.BORRADOR)
+            resultados = []
+            primera = threading.Thread(
+                target=lambda: resultados.append(self.client.post(f"/inventarios-fisicos/{inv_id}/aplicar", headers=admin_h))
+            )
+            primera.start()
+            primera.join()
+            self.assertEqual(resultados[0].status_code, 200)
+            segunda = self.client.post(f"/inventarios-fisicos/{inv_id}/aplicar", headers=admin_h)
+            self.assertEqual(segunda.status_code, 400)
+
+        detalle = self.client.get(f"/inventarios-fisicos/{inv_id}", headers=admin_h).get_json()["detalles"]
+        self.assertEqual([(d["stock_sistema"], d["diferencia"]) for d in detalle], [(10, -3)])
+        with self.app.app_context():
+            self.assertEqual(
+                db.session.query(MovimientoInventario).filter(MovimientoInventario.referencia_tipo == "INVENTARIO_FISICO").count(), 1
+            )
+
+    def test_varianza_por_producto_y_periodo(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        harina, sal = [
+            self.client.post(
+                "/productos",
+                json={"nombre": nombre, "unidad": "kg", "stock_actual": 10, "costo_promedio": 2},
+                headers=admin_h,
+            ).get_json()["id"]
+            for nombre in ("Harina", "Sal")
+        ]
+
+        def contar(fecha, conteos):
+            inv_id = self.client.post(
+                "/inventarios-fisicos",
+                json={"tipo": "MENSUAL", "fecha": fecha, "detalles": [{"producto_id": pid, "conteo": c} for pid, c in conteos]},
+                headers=admin_h,
+            ).get_json()["id"]
+            self.assertEqual(self.client.post(f"/inventarios-fisicos/{inv_id}/aplicar", headers=admin_h).status_code, 200)
+
+        contar("2026-01-15T10:00:00", [(harina, 8), (sal, 11)])
+        # Un borrador no cuenta para la varianza.
+        self.client.post(
+            "/inventarios-fisicos",
+            json={"tipo": "MENSUAL", "fecha": "2026-01-20T10:00:00", "detalles": [{"producto_id": harina, "conteo": 0}]},
+            headers=admin_h,
+        )
+
+        reporte = self.client.get("/inventarios-fisicos/varianza", headers=admin_h).get_json()
+        self.assertEqual([p["producto_id"] for p in reporte["productos"]], [harina, sal])
+        self.assertEqual(reporte["resumen"], {"productos": 2, "faltante_valor": -4.0, "sobrante_valor": 2.0})
+        self.assertEqual(self.client.get("/inventarios-fisicos/varianza", headers=admin_h).get_json(), reporte)
+
+        contar("2026-02-10T10:00:00", [(harina, 7)])
+        reporte = self.client.get("/inventarios-fisicos/varianza", headers=admin_h).get_json()
+        item = reporte["productos"][0]
+        self.assertEqual((item["nombre"], item["faltante"], item["valor"]), ("Harina", 3, -6))
+        self.assertEqual(
+            [(p["periodo"], p["neto"], p["neto_acumulado"], p["valor_acumulado"], p["variacion"]) for p in item["periodos"]],
+            [("2026-01", -2, -2, -4, None), ("2026-02", -1, -3, -6, 1)],
+        )
+
+        anual = self.client.get(
+            f"/inventarios-fisicos/varianza?agrupacion=anio&producto_id={harina}&date_from=2026-02-01", headers=admin_h
+        ).get_json()
+        self.assertEqual([(p["periodo"], p["faltante"], p["conteos"]) for p in anual["productos"][0]["periodos"]], [("2026", 1, 1)])
+        self.assertEqual(self.client.get("/inventarios-fisicos/varianza?agrupacion=dia", headers=admin_h).status_code, 400)
+
+    def test_listados_con_carga_acotada_y_paginacion(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+        producto_id = self.client.post("/productos", json={"nombre": "Arroz", "unidad": "kg"}, headers=admin_h).get_json()["id"]
+
+        def crear(cantidad, desde):
+            for index in range(desde, desde + cantidad):
+                fecha = f"2026-03-{index + 1:02d}T10:00:00"
+                detalle = [{"producto_id": producto_id, "cantidad": 1, "costo_unitario": 2}]
+                self.client.post("/compras", json={"proveedor": f"P{index}", "fecha": fecha, "detalles": detalle}, headers=admin_h)
+                self.client.post(
+                    "/inventarios-fisicos",
+                    json={"tipo": "MENSUAL", "fecha": fecha, "detalles": [{"producto_id": producto_id, "conteo": index}]},
+                    headers=admin_h,
+                )
+
+        crear(2, 0)
+        conteos = {path: self._list_statements(path, admin_h)[1] for path in ("/compras", "/inventarios-fisicos")}
+        crear(6, 2)
+        for path, antes in conteos.items():
+            resp, despues = self._list_statements(path, admin_h)
+            self.assertEqual(len(resp.get_json()), 8)
+            self.assertTrue(all(len(item["detalles"]) == 1 for item in resp.get_json()))
+            # Las líneas se cargan en una sola consulta extra, sin importar cuántos padres haya.
+            self.assertEqual(despues, antes)
+            sin_detalles, sentencias = self._list_statements(f"{path}?detalles=0", admin_h)
+            self.assertEqual(sentencias, antes - 1)
+            self.assertNotIn("detalles", sin_detalles.get_json()[0])
+
+            vistos = []
+            cursor = None
+            while True:
+                url = f"{path}?limit=3&detalles=0" + (f"&cursor={cursor}" if cursor else "")
+                pagina, sentencias = self._list_statements(url, admin_h)
+                self.assertEqual(sentencias, antes - 1)
+                vistos.extend(item["id"] for item in pagina.get_json())
+                cursor = pagina.headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+            self.assertEqual(vistos, [item["id"] for item in resp.get_json()])
+            self.assertEqual(len(pagina.get_json()), 2)
+
+        self.assertEqual(self.client.get("/compras?limit=0", headers=admin_h).status_code, 400)
+        self.assertEqual(self.client.get("/compras?cursor=xyz", headers=admin_h).status_code, 400)
+
+    def test_proveedores_normalizados_y_busqueda_por_prefijo(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+        producto_id = self.client.post("/productos", json={"nombre": "Leche", "unidad": "lt"}, headers=admin_h).get_json()["id"]
+        detalle = [{"producto_id": producto_id, "cantidad": 1, "costo_unitario": 1}]
+
+        nombres = ["Lácteos del Valle", "  LACTEOS   del valle ", "Distribuidora Central", "Carnes Selectas"]
+        compras = [
+            self.client.post("/compras", json={"proveedor": nombre, "detalles": detalle}, headers=admin_h).get_json()
+            for nombre in nombres
+        ]
+        self.assertEqual(compras[0]["proveedor_id"], compras[1]["proveedor_id"])
+        self.assertEqual(compras[1]["proveedor"], "  LACTEOS   del valle ")
+        self.assertEqual(len({c["proveedor_id"] for c in compras}), 3)
+
+        def buscar(q):
+            return [p["nombre"] for p in self.client.get(f"/proveedores?q={q}", headers=admin_h).get_json()]
+
+        self.assertEqual(buscar("lact"), ["Lácteos del Valle"])
+        self.assertEqual(buscar("VALL DEL"), ["Lácteos del Valle"])
+        self.assertEqual(buscar("cen dis"), ["Distribuidora Central"])
+        self.assertEqual(buscar("sel zzz"), [])
+        self.assertEqual(buscar(""), ["Carnes Selectas", "Distribuidora Central", "Lácteos del Valle"])
+
+        por_texto = self.client.get("/compras?proveedor=lácteos&detalles=0", headers=admin_h).get_json()
+        self.assertEqual(sorted(c["id"] for c in por_texto), sorted(c["id"] for c in compras[:2]))
+        por_id = self.client.get(f"/compras?proveedor_id={compras[2]['proveedor_id']}", headers=admin_h).get_json()
+        self.assertEqual([c["id"] for c in por_id], [compras[2]["id"]])
+
+        con_id = self.client.post("/compras", json={"proveedor_id": compras[3]["proveedor_id"], "detalles": detalle}, headers=admin_h)
+        self.assertEqual(con_id.status_code, 201)
+        self.assertEqual(con_id.get_json()["proveedor"], "Carnes Selectas")
+        self.assertEqual(self.client.post("/compras", json={"proveedor_id": 999, "detalles": detalle}, headers=admin_h).status_code, 404)
+        self.assertEqual(self.client.post("/compras", json={"proveedor": "   ", "detalles": detalle}, headers=admin_h).status_code, 400)
+
+        # Otros alfabetos y nombres hechos solo de signos no se fusionan entre sí.
+        otros = [
+            self.client.post("/compras", json={"proveedor": nombre, "detalles": detalle}, headers=admin_h)
+            for nombre in ("Пекарня", "ПЕКАРНЯ", "Молоко", "¿?", "***")
+        ]
+        self.assertEqual([r.status_code for r in otros], [201] * 5)
+        ids = [r.get_json()["proveedor_id"] for r in otros]
+        self.assertEqual(ids[0], ids[1])
+        self.assertEqual(len(set(ids)), 4)
+        self.assertEqual(buscar("пек"), ["Пекарня"])
+
+    def test_valorizacion_actual_y_a_fecha(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        arroz = self.client.post(
+            "/productos", json={"nombre": "Arroz", "unidad": "kg", "stock_actual": 10, "costo_promedio": 2}, headers=admin_h
+        ).get_json()["id"]
+        frijol = self.client.post(
+            "/productos", json={"nombre": "Frijol", "unidad": "kg", "stock_actual": 1, "costo_promedio": 3}, headers=admin_h
+        ).get_json()["id"]
+        aceite = self.client.post(
+            "/productos", json={"nombre": "Aceite", "unidad": "lt", "stock_actual": 5, "costo_promedio": 1}, headers=admin_h
+        ).get_json()["id"]
+        compra = self.client.post(
+            "/compras",
+            json={"proveedor": "Mercado", "detalles": [{"producto_id": arroz, "cantidad": 10, "costo_unitario": 4}]},
+            headers=admin_h,
+        )
+        self.assertEqual(compra.status_code, 201)
+
+        # El saldo inicial del arroz y del frijol es de enero y la compra de febrero; el aceite es de hoy.
+        with self.app.app_context():
+            for producto_id, tipo, fecha in (
+                (arroz, "PRODUCTO_INICIAL", datetime(2026, 1, 1)),
+                (frijol, "PRODUCTO_INICIAL", datetime(2026, 1, 10)),
+                (arroz, "COMPRA", datetime(2026, 2, 1)),
+            ):
+                db.session.query(MovimientoInventario).filter(
+                    MovimientoInventario.producto_id == producto_id, MovimientoInventario.referencia_tipo == tipo
+                ).update({"created_at": fecha}, synchronize_session=False)
+            db.session.commit()
+
+        actual = self.client.get("/inventario/valorizacion", headers=admin_h).get_json()
+        self.assertEqual([(i["producto_id"], i["valor"]) for i in actual["items"]], [(arroz, 60), (aceite, 5), (frijol, 3)])
+        self.assertEqual(actual["total"], {"productos": 3, "valor": 68})
+
+        por_unidad = self.client.get("/inventario/valorizacion?agrupacion=unidad", headers=admin_h).get_json()
+        self.assertEqual(
+            [(i["unidad"], i["productos"], i["stock"], i["valor"]) for i in por_unidad["items"]],
+            [("kg", 2, 21, 63), ("lt", 1, 5, 5)],
+        )
+
+        enero = self.client.get("/inventario/valorizacion?fecha=2026-01-15", headers=admin_h).get_json()
+        self.assertEqual(
+            [(i["producto_id"], i["stock"], i["costo_promedio"], i["valor"]) for i in enero["items"]],
+            [(arroz, 10, 2, 20), (frijol, 1, 3, 3)],
+        )
+        febrero = self.client.get("/inventario/valorizacion?fecha=2026-02-01&agrupacion=unidad", headers=admin_h).get_json()
+        self.assertEqual(febrero["total"], {"productos": 2, "valor": 63})
+
+        self.assertEqual(self.client.get("/inventario/valorizacion?fecha=ayer", headers=admin_h).status_code, 400)
+        self.assertEqual(self.client.get("/inventario/valorizacion?agrupacion=categoria", headers=admin_h).status_code, 400)
+
+    def test_verificacion_masiva_del_kardex(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        ids = [
+            self.client.post(
+                "/productos",
+                json={"nombre": f"Insumo {index}", "unidad": "kg", "stock_actual": 10 * index, "costo_promedio": 1},
+                headers=admin_h,
+            ).get_json()["id"]
+            for index in range(4)
+        ]
+        for pid in ids:
+            self.client.post(
+                "/compras",
+                json={"proveedor": "Mercado", "detalles": [{"producto_id": pid, "cantidad": 5, "costo_unitario": 2}]},
+                headers=admin_h,
+            )
+
+        limpio = self.client.get("/kardex/verificacion", headers=admin_h).get_json()
+        self.assertTrue(limpio["ok"])
+        self.assertEqual((limpio["productos"], limpio["movimientos"]), (4, 7))
+        self.assertEqual(self.app.test_cli_runner().invoke(args=["check-kardex"]).exit_code, 0)
+
+        with self.app.app_context():
+            compra_mov = (
+                db.session.query(MovimientoInventario)
+                .filter(MovimientoInventario.producto_id == ids[1], MovimientoInventario.referencia_tipo == "COMPRA")
+                .one()
+            )
+            compra_mov.saldo_cantidad = 99
+            db.session.query(Producto).filter(Producto.id == ids[2]).update({"stock_actual": 1})
+            db.session.query(Producto).filter(Producto.id == ids[0]).update({"stock_actual": 4})
+            db.session.commit()
+
+        errores = self.client.get("/kardex/verificacion?limite=2", headers=admin_h).get_json()
+        self.assertFalse(errores["ok"])
+        self.assertEqual((errores["productos_con_error"], errores["total_inconsistencias"]), (3, 4))
+        self.assertEqual(
+            [(e["producto_id"], e["tipo"]) for e in errores["inconsistencias"]], [(ids[0], "stock"), (ids[1], "cadena")]
+        )
+        self.assertEqual((errores["inconsistencias"][1]["esperado"], errores["inconsistencias"][1]["registrado"]), (15, 99))
+
+        resultado = self.app.test_cli_runner().invoke(args=["check-kardex"])
+        self.assertEqual(resultado.exit_code, 1)
+        self.assertIn("4 inconsistencias", resultado.output)
+
+    def test_recalculo_del_kardex_tras_corregir_una_compra(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        producto_id = self.client.post(
+            "/productos", json={"nombre": "Queso", "unidad": "kg", "stock_actual": 10, "costo_promedio": 2}, headers=admin_h
+        ).get_json()["id"]
+        otro_id = self.client.post(
+            "/productos", json={"nombre": "Pan", "unidad": "unidad", "stock_actual": 4, "costo_promedio": 1}, headers=admin_h
+        ).get_json()["id"]
+        self.client.post(
+            "/compras",
+            json={"proveedor": "Lácteos", "detalles": [{"producto_id": producto_id, "cantidad": 10, "costo_unitario": 4}]},
+            headers=admin_h,
+        )
+        with self.app.app_context():
+            register_output(producto_id, 5, MovimientoTipoEnum.MERMA, "TEST", 0)
+            db.session.commit()
+            # La compra se registró mal: eran 12 unidades a 6.
+            compra = (
+                db.session.query(MovimientoInventario)
+                .filter(MovimientoInventario.producto_id == producto_id, MovimientoInventario.referencia_tipo == "COMPRA")
+                .one()
+            )
+            compra.cantidad = 12
+            compra.costo_unitario = 6
+            desde = compra.created_at.isoformat()
+            db.session.commit()
+
+        self.assertFalse(self.client.get("/kardex/verificacion", headers=admin_h).get_json()["ok"])
+
+        simulacion = self.client.post("/kardex/recalcular", json={"dry_run": True, "desde": desde}, headers=admin_h).get_json()
+        self.assertEqual((simulacion["movimientos_corregidos"], simulacion["productos_corregidos"]), (2, 1))
+        self.assertEqual(simulacion["cambios"][0]["costo_promedio_resultante"], {"antes": 3, "despues": 4.181818})
+        self.assertEqual(simulacion["cambios"][1]["saldo_cantidad"], {"antes": 15, "despues": 17})
+        self.assertEqual(simulacion["cambios"][1]["costo_unitario"], {"antes": 3, "despues": 4.181818})
+        # Sin `dry_run` el endpoint también simula: escribir tiene que pedirse explícitamente.
+        por_defecto = self.client.post("/kardex/recalcular", json={"desde": desde}, headers=admin_h).get_json()
+        self.assertEqual(por_defecto["movimientos_corregidos"], 2)
+        productos = {p["id"]: p for p in self.client.get("/productos", headers=admin_h).get_json()}
+        self.assertEqual(productos[producto_id]["stock_actual"], 15)
+
+        recalculo = self.client.post(
+            "/kardex/recalcular", json={"producto_id": producto_id, "dry_run": False}, headers=admin_h
+        ).get_json()
+        self.assertEqual(recalculo["movimientos"], 3)
+        self.assertEqual(recalculo["movimientos_corregidos"], 2)
+        productos = {p["id"]: p for p in self.client.get("/productos", headers=admin_h).get_json()}
+        self.assertEqual((productos[producto_id]["stock_actual"], productos[producto_id]["costo_promedio"]), (17, 4.181818))
+        self.assertEqual((productos[otro_id]["stock_actual"], productos[otro_id]["costo_promedio"]), (4, 1))
+        self.assertTrue(self.client.get("/kardex/verificacion", headers=admin_h).get_json()["ok"])
+
+        resultado = self.app.test_cli_runner().invoke(args=["replay-kardex", "--dry-run"])
+        self.assertEqual(resultado.exit_code, 0)
+        self.assertIn("0 corregidos", resultado.output)
+        self.assertEqual(self.client.post("/kardex/recalcular", json={"producto_id": 999}, headers=admin_h).status_code, 404)
+        self.assertEqual(self.client.post("/kardex/recalcular", json={"desde": "ayer"}, headers=admin_h).status_code, 400)
+        for flag in ("false", 0, None):
+            self.assertEqual(self.client.post("/kardex/recalcular", json={"dry_run": flag}, headers=admin_h).status_code, 400)
+
+    def test_recalculo_de_un_kardex_sin_tocar_no_corrige_nada(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        # 17.4422805 cae justo en el medio: compra y recálculo deben redondear igual.
+        producto_id = self.client.post(
+            "/productos",
+            json={"nombre": "Azafrán", "unidad": "g", "stock_actual": 4, "costo_promedio": 17.442279},
+            headers=admin_h,
+        ).get_json()["id"]
+        for cantidad, costo in ((4, 17.442282), (3.5, 1.000001), (0.333333, 7.777777)):
+            self.client.post(
+                "/compras",
+                json={"proveedor": "Especias", "detalles": [{"producto_id": producto_id, "cantidad": cantidad, "costo_unitario": costo}]},
+                headers=admin_h,
+            )
+            with self.app.app_context():
+                register_output(producto_id, 1.25, MovimientoTipoEnum.MERMA, "TEST", 0)
+                db.session.commit()
+
+        kardex = self.client.get(f"/kardex/{producto_id}", headers=admin_h).get_json()["movimientos"]
+        self.assertEqual(kardex[1]["costo_promedio_resultante"], 17.442281)
+        recalculo = self.client.post("/kardex/recalcular", json={"dry_run": True}, headers=admin_h).get_json()
+        self.assertEqual(recalculo["movimientos"], 7)
+        self.assertEqual((recalculo["movimientos_corregidos"], recalculo["productos_corregidos"]), (0, 0))
+
+    def test_datos_de_carga_con_kardex_consistente(self):
+        with self.app.app_context():
+            generate_load_data(productos=20, platillos=8, mesas=2, pedidos=600, dias=5, compras=20, seed=8)
+            db.session.commit()
+            recalculo = replay_kardex(dry_run=True)
+        self.assertGreater(recalculo["movimientos"], 600)
+        self.assertEqual((recalculo["movimientos_corregidos"], recalculo["productos_corregidos"]), (0, 0))
+
+    def test_alertas_de_bajo_stock(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        leche_id = self.client.post(
+            "/productos",
+            json={"nombre": "Leche", "unidad": "lt", "stock_actual": 10, "costo_promedio": 1, "stock_minimo": 4},
+            headers=admin_h,
+        ).get_json()["id"]
+        sal_id = self.client.post(
+            "/productos", json={"nombre": "Sal", "unidad": "kg", "stock_minimo": 2}, headers=admin_h
+        ).get_json()["id"]
+        productos = {p["id"]: p for p in self.client.get("/productos", headers=admin_h).get_json()}
+        self.assertEqual((productos[leche_id]["stock_minimo"], productos[leche_id]["bajo_stock"]), (4, False))
+        self.assertTrue(productos[sal_id]["bajo_stock"])
+
+        with self.app.app_context():
+            register_output(leche_id, 7, MovimientoTipoEnum.VENTA, "TEST", 0)
+            register_output(leche_id, 1, MovimientoTipoEnum.MERMA, "TEST", 0)
+            db.session.commit()
+        bajo_stock = self.client.get("/inventario/bajo-stock", headers=admin_h).get_json()
+        self.assertEqual([(p["nombre"], p["stock_actual"], p["faltante"]) for p in bajo_stock], [("Leche", 2, 2), ("Sal", 0, 2)])
+
+        self.client.post(
+            "/compras",
+            json={"proveedor": "Lácteos", "detalles": [{"producto_id": leche_id, "cantidad": 5, "costo_unitario": 1}]},
+            headers=admin_h,
+        )
+        self.assertEqual(self.client.patch(f"/productos/{leche_id}", json={"stock_minimo": 8}, headers=admin_h).status_code, 200)
+        with self.app.app_context():
+            resumen = register_bulk_adjustments({leche_id: 9, sal_id: 5}, "TEST", 0, conteo=True)
+            db.session.commit()
+        self.assertEqual(resumen["alertas"], 2)
+        self.assertEqual(self.client.get("/inventario/bajo-stock", headers=admin_h).get_json(), [])
+
+        # Las alertas recién creadas esperan la ventana de confirmación antes de entregarse.
+        self.app.config["STOCK_ALERTS_DELAY_SECONDS"] = 60
+        self.assertEqual(self.client.get("/inventario/alertas", headers=admin_h).get_json(), {"alertas": [], "ultimo_id": 0})
+        self.app.config["STOCK_ALERTS_DELAY_SECONDS"] = 0
+        pagina = self.client.get("/inventario/alertas?limit=4", headers=admin_h).get_json()
+        self.assertEqual(
+            [(a["nombre"], a["tipo"], a["stock_actual"]) for a in pagina["alertas"]],
+            [("Sal", "BAJO_STOCK", 0), ("Leche", "BAJO_STOCK", 3), ("Leche", "REPUESTO", 7), ("Leche", "BAJO_STOCK", 7)],
+        )
+        siguiente = self.client.get(f"/inventario/alertas?despues_de={pagina['ultimo_id']}", headers=admin_h).get_json()
+        self.assertEqual([(a["nombre"], a["tipo"]) for a in siguiente["alertas"]], [("Leche", "REPUESTO"), ("Sal", "REPUESTO")])
+        vacia = self.client.get(f"/inventario/alertas?despues_de={siguiente['ultimo_id']}", headers=admin_h).get_json()
+        self.assertEqual((vacia["alertas"], vacia["ultimo_id"]), ([], siguiente["ultimo_id"]))
+
+        self.assertEqual(self.client.patch(f"/productos/{leche_id}", json={"stock_minimo": -1}, headers=admin_h).status_code, 400)
+        for invalido in ("abc", "nan", float("inf"), 1e30, 1e8):
+            creado = self.client.post(
+                "/productos", json={"nombre": "Azúcar", "unidad": "kg", "stock_minimo": invalido}, headers=admin_h
+            )
+            self.assertEqual(creado.status_code, 400)
+            editado = self.client.patch(f"/productos/{leche_id}", json={"stock_minimo": invalido}, headers=admin_h)
+            self.assertEqual(editado.status_code, 400)
+            self.assertIn("stock_minimo", editado.get_json()["error"])
+        productos = {p["id"]: p for p in self.client.get("/productos", headers=admin_h).get_json()}
+        self.assertEqual(len(productos), 2)
+        self.assertEqual(productos[leche_id]["stock_minimo"], 8)
+        self.assertEqual(self.client.get("/inventario/alertas?limit=0", headers=admin_h).status_code, 400)
+
     def test_filtros_y_toggle_activo(self):
         self._create_user("admin", "admin123", RoleEnum.ADMIN)
         mesero_id = self._create_user("mesero", "mesero123", RoleEnum.MESERO)
@@ -205,6 +809,115 @@ class InventoryModulesTestCase(unittest.TestCase):
         self.assertEqual(len(platillo_data["ingredientes"]), 1)
         self.assertEqual(platillo_data["ingredientes"][0]["cantidad_por_unidad"], 0.75)
 
+    def test_costo_receta_y_margenes(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        arroz_id = self.client.post(
+            "/productos",
+            json={"nombre": "Arroz", "unidad": "kg", "stock_actual": 10, "costo_promedio": 2},
+            headers=admin_h,
+        ).get_json()["id"]
+        pollo_id = self.client.post(
+            "/productos",
+            json={"nombre": "Pollo", "unidad": "kg", "stock_actual": 10, "costo_promedio": 6},
+            headers=admin_h,
+        ).get_json()["id"]
+
+        creado = self.client.post(
+            "/platillos",
+            json={
+                "nombre": "Arroz con Pollo",
+                "precio": 10,
+                "ingredientes": [
+                    {"producto_id": arroz_id, "cantidad_por_unidad": 0.5},
+                    {"producto_id": pollo_id, "cantidad_por_unidad": 0.25},
+                ],
+            },
+            headers=admin_h,
+        )
+        self.assertEqual(creado.status_code, 201)
+        self.assertEqual(creado.get_json()["costo_receta"], 2.5)
+        platillo_id = creado.get_json()["id"]
+        self.client.post("/platillos", json={"nombre": "Agua", "precio": 1}, headers=admin_h)
+
+        # Compra de pollo a 10: el promedio pasa a 8 y la receta sube 0.25 * 2.
+        compra = self.client.post(
+            "/compras",
+            json={"proveedor": "Mercado", "detalles": [{"producto_id": pollo_id, "cantidad": 10, "costo_unitario": 10}]},
+            headers=admin_h,
+        )
+        self.assertEqual(compra.status_code, 201)
+        listado = self.client.get("/platillos", headers=admin_h).get_json()
+        self.assertEqual(next(p for p in listado if p["id"] == platillo_id)["costo_receta"], 3.0)
+
+        receta = self.client.post(
+            f"/platillos/{platillo_id}/ingredientes",
+            json={"ingredientes": [{"producto_id": pollo_id, "cantidad_por_unidad": 0.5}]},
+            headers=admin_h,
+        )
+        self.assertEqual(receta.status_code, 201)
+        self.assertEqual(receta.get_json()["costo_receta"], 4.0)
+
+        margenes = self.client.get("/platillos/margenes", headers=admin_h)
+        self.assertEqual(margenes.status_code, 200)
+        data = margenes.get_json()
+        self.assertEqual([p["nombre"] for p in data["platillos"]], ["Arroz con Pollo", "Agua"])
+        self.assertEqual(data["platillos"][0]["margen"], 6.0)
+        self.assertEqual(data["platillos"][0]["margen_pct"], 60.0)
+        self.assertEqual(data["platillos"][1]["margen_pct"], 100.0)
+        self.assertEqual(data["resumen"]["platillos"], 2)
+
+    def test_disponibilidad_por_stock_con_indice_de_recetas(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        admin_h = self._login_headers("admin", "admin123")
+
+        def producto(nombre, stock):
+            return self.client.post(
+                "/productos",
+                json={"nombre": nombre, "unidad": "kg", "stock_actual": stock, "costo_promedio": 1},
+                headers=admin_h,
+            ).get_json()["id"]
+
+        arroz_id = producto("Arroz", 3)
+        pollo_id = producto("Pollo", 1)
+
+        def platillo(nombre, ingredientes):
+            return self.client.post(
+                "/platillos",
+                json={
+                    "nombre": nombre,
+                    "precio": 10,
+                    "ingredientes": [{"producto_id": pid, "cantidad_por_unidad": cant} for pid, cant in ingredientes],
+                },
+                headers=admin_h,
+            ).get_json()["id"]
+
+        con_pollo_id = platillo("Arroz con Pollo", [(arroz_id, 0.5), (pollo_id, 0.25)])
+        solo_arroz_id = platillo("Arroz Blanco", [(arroz_id, 0.4)])
+        self.client.post("/platillos", json={"nombre": "Agua", "precio": 1}, headers=admin_h)
+
+        resp = self.client.get("/platillos/disponibilidad", headers=admin_h)
+        self.assertEqual(resp.status_code, 200)
+        disponibles = {p["nombre"]: p for p in resp.get_json()}
+        self.assertEqual(disponibles["Arroz con Pollo"]["porciones_disponibles"], 4)
+        self.assertEqual(disponibles["Arroz con Pollo"]["producto_limitante_id"], pollo_id)
+        self.assertEqual(disponibles["Arroz Blanco"]["porciones_disponibles"], 7)
+        self.assertIsNone(disponibles["Agua"]["porciones_disponibles"])
+        self.assertTrue(disponibles["Agua"]["disponible"])
+
+        dependientes = self.client.get(f"/platillos/disponibilidad?producto_id={pollo_id}", headers=admin_h)
+        self.assertEqual([p["id"] for p in dependientes.get_json()], [con_pollo_id])
+
+        # Una receta editada fuera de este proceso se detecta por la huella de platillo_ingrediente.
+        with self.app.app_context():
+            db.session.add(PlatilloIngrediente(platillo_id=solo_arroz_id, producto_id=pollo_id, cantidad_por_unidad=0.5))
+            db.session.commit()
+        dependientes = self.client.get(f"/platillos/disponibilidad?producto_id={pollo_id}", headers=admin_h)
+        self.assertEqual(sorted(p["id"] for p in dependientes.get_json()), sorted([con_pollo_id, solo_arroz_id]))
+        solo_arroz = next(p for p in dependientes.get_json() if p["id"] == solo_arroz_id)
+        self.assertEqual(solo_arroz["porciones_disponibles"], 2)
+
 
 if __name__ == "__main__":
     unittest.main()
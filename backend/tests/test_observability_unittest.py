@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from app.extensions import db
+from app.models import RoleEnum, User
+
+
+class ObservabilityTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(prefix="garrobito_test_observability_", suffix=".db")
+        self.profiles_dir = tempfile.mkdtemp(prefix="garrobito_test_profiles_")
+
+        class TestConfig:
+            TESTING = True
+            SECRET_KEY = "test-secret"
+            JWT_SECRET_KEY = "test-jwt-secret"
+            SQLALCHEMY_TRACK_MODIFICATIONS = False
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.db_path}"
+            METRICS_API_KEY = "metrics-key"
+            PROFILING_ENABLED = True
+            PROFILING_DIR = self.profiles_dir
+
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+        shutil.rmtree(self.profiles_dir, ignore_errors=True)
+
+    def _create_user(self, username, password, role):
+        with self.app.app_context():
+            user = User(
+                username=username,
+                password_hash=generate_password_hash(password),
+                role=role,
+                is_active=True,
+            )
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+
+    def _login_headers(self, username, password):
+        resp = self.client.post("/auth/login", json={"username": username, "password": password})
+        self.assertEqual(resp.status_code, 200)
+        token = resp.get_json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_metrics_expone_latencia_por_endpoint(self):
+        self.assertEqual(self.client.get("/health").status_code, 200)
+        self.assertEqual(self.client.post("/auth/login", json={"username": "x", "password": "y"}).status_code, 401)
+
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+
+        resp = self.client.get("/metrics", headers={"Authorization": "Bearer metrics-key"})
+        self.assertEqual(resp.status_code, 200)
+        body = resp.get_data(as_text=True)
+        self.assertIn('garrobito_http_request_duration_seconds_bucket{blueprint="none",endpoint="health"', body)
+        self.assertIn('garrobito_http_requests_total{blueprint="auth",endpoint="auth.login",method="POST",status="401"}', body)
+        self.assertIn('garrobito_db_queries_total{blueprint="auth",endpoint="auth.login"}', body)
+
+    def test_profiling_solo_admin_y_consulta_de_perfil(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        self._create_user("cajero", "cajero123", RoleEnum.CAJERO)
+        admin_h = self._login_headers("admin", "admin123")
+        cajero_h = self._login_headers("cajero", "cajero123")
+
+        sin_perfil = self.client.get("/productos?_profile=1", headers=cajero_h)
+        self.assertEqual(sin_perfil.status_code, 200)
+        self.assertNotIn("X-Profile-Id", sin_perfil.headers)
+
+        con_perfil = self.client.get("/productos", headers={**admin_h, "X-Profile": "1"})
+        self.assertEqual(con_perfil.status_code, 200)
+        profile_id = con_perfil.headers["X-Profile-Id"]
+
+        listado = self.client.get("/api/admin/profiles", headers=admin_h)
+        self.assertIn(profile_id, listado.get_json()["profiles"])
+
+        reporte = self.client.get(f"/api/admin/profiles/{profile_id}?sort=tottime&limit=5", headers=admin_h)
+        self.assertEqual(reporte.status_code, 200)
+        self.assertIn("function calls", reporte.get_data(as_text=True))
+
+        self.assertEqual(self.client.get(f"/api/admin/profiles/{profile_id}", headers=cajero_h).status_code, 403)
+        self.assertEqual(self.client.get("/api/admin/profiles/../../etc", headers=admin_h).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
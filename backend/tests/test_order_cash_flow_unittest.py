@@ -1,12 +1,15 @@
 import os
 import tempfile
 import unittest
+from contextlib import contextmanager
 
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash
 
 from app import create_app
 from app.extensions import db
-from app.models import RoleEnum, User
+from app.models import Pedido, ReservaInventario, RoleEnum, User
+from app.services.order_service import repair_order_totals
 
 
 class OrderCashFlowTestCase(unittest.TestCase):
@@ -52,6 +55,24 @@ class OrderCashFlowTestCase(unittest.TestCase):
         token = resp.get_json()["access_token"]
         return {"Authorization": f"Bearer {token}"}
 
+    @contextmanager
+    def _capture_statements(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(" ".join(statement.split()))
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    def _first_index(self, statements, prefix):
+        return next(index for index, statement in enumerate(statements) if statement.startswith(prefix))
+
     def test_pedido_cobro_descuenta_stock_y_genera_kardex(self):
         self._create_user("admin", "admin123", RoleEnum.ADMIN)
         mesero_id = self._create_user("mesero", "mesero123", RoleEnum.MESERO)
@@ -128,6 +149,17 @@ class OrderCashFlowTestCase(unittest.TestCase):
             headers=cajero_h,
         )
         self.assertEqual(cobro.status_code, 201)
+        self.assertEqual(cobro.get_json()["monto"], 24.0)
+
+        cierre = self.client.post(
+            "/caja/cierre",
+            json={"apertura_caja_id": apertura.get_json()["id"]},
+            headers=cajero_h,
+        )
+        self.assertEqual(cierre.status_code, 201)
+        self.assertEqual(cierre.get_json()["total_ventas"], 24.0)
+        self.assertEqual(cierre.get_json()["total_efectivo"], 24.0)
+        self.assertEqual(cierre.get_json()["total_tarjeta"], 0.0)
 
         productos = self.client.get("/productos", headers=admin_h).get_json()
         tomate = next(p for p in productos if p["id"] == producto_id)
@@ -138,6 +170,131 @@ class OrderCashFlowTestCase(unittest.TestCase):
         self.assertIn("COMPRA", tipos)
         self.assertIn("VENTA", tipos)
 
+    def test_reservas_de_stock_por_pedido(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        mesero_id = self._create_user("mesero", "mesero123", RoleEnum.MESERO)
+        self._create_user("cocina", "cocina123", RoleEnum.COCINA)
+        cajero_id = self._create_user("cajero", "cajero123", RoleEnum.CAJERO)
+        admin_h = self._login_headers("admin", "admin123")
+        mesero_h = self._login_headers("mesero", "mesero123")
+        cocina_h = self._login_headers("cocina", "cocina123")
+        cajero_h = self._login_headers("cajero", "cajero123")
+
+        mesa_a = self.client.post("/mesas", json={"numero": 1}, headers=mesero_h).get_json()["id"]
+        mesa_b = self.client.post("/mesas", json={"numero": 2}, headers=mesero_h).get_json()["id"]
+        producto_id = self.client.post(
+            "/productos",
+            json={"nombre": "Tomate", "unidad": "kg", "stock_actual": 10, "costo_promedio": 2},
+            headers=admin_h,
+        ).get_json()["id"]
+        platillo_id = self.client.post(
+            "/platillos",
+            json={"nombre": "Ensalada", "precio": 12, "ingredientes": [{"producto_id": producto_id, "cantidad_por_unidad": 1}]},
+            headers=admin_h,
+        ).get_json()["id"]
+
+        def tomate():
+            productos = self.client.get("/productos", headers=admin_h).get_json()
+            return next(p for p in productos if p["id"] == producto_id)
+
+        pedido_a = self.client.post("/pedidos", json={"mesa_id": mesa_a, "user_id": mesero_id}, headers=mesero_h).get_json()["id"]
+        item = self.client.post(f"/pedidos/{pedido_a}/items", json={"platillo_id": platillo_id, "cantidad": 4}, headers=mesero_h)
+        self.assertEqual(item.status_code, 201)
+        self.assertEqual((tomate()["stock_actual"], tomate()["stock_reservado"], tomate()["stock_disponible"]), (10.0, 4.0, 6.0))
+
+        pedido_b = self.client.post("/pedidos", json={"mesa_id": mesa_b, "user_id": mesero_id}, headers=mesero_h).get_json()["id"]
+        sin_stock = self.client.post(f"/pedidos/{pedido_b}/items", json={"platillo_id": platillo_id, "cantidad": 7}, headers=mesero_h)
+        self.assertEqual(sin_stock.status_code, 400)
+
+        detalle_id = item.get_json()["detalle"]["id"]
+        self.client.patch(f"/pedidos/{pedido_a}/items/{detalle_id}", json={"cantidad": 2}, headers=mesero_h)
+        self.assertEqual(tomate()["stock_reservado"], 2.0)
+
+        cancelado = self.client.patch(f"/pedidos/{pedido_a}/estado", json={"estado": "CANCELADO"}, headers=mesero_h)
+        self.assertEqual(cancelado.status_code, 200)
+        self.assertEqual(tomate()["stock_reservado"], 0.0)
+
+        with self._capture_statements() as statements:
+            item = self.client.post(f"/pedidos/{pedido_b}/items", json={"platillo_id": platillo_id, "cantidad": 7}, headers=mesero_h)
+        self.assertEqual(item.status_code, 201)
+        # Mismo orden de locks que el cobro: primero la fila del pedido, después las de producto.
+        self.assertLess(self._first_index(statements, "UPDATE pedido"), self._first_index(statements, "UPDATE producto"))
+        self.client.patch(f"/pedidos/{pedido_b}/estado", json={"estado": "PREPARACION"}, headers=mesero_h)
+        self.client.patch(f"/pedidos/{pedido_b}/estado", json={"estado": "SERVIDO"}, headers=cocina_h)
+        self.client.post("/caja/apertura", json={"user_id": cajero_id, "monto_inicial": 0}, headers=cajero_h)
+        with self._capture_statements() as statements:
+            cobro = self.client.post("/caja/cobro", json={"pedido_id": pedido_b, "metodo": "EFECTIVO"}, headers=cajero_h)
+        self.assertEqual(cobro.status_code, 201)
+        self.assertLess(self._first_index(statements, "UPDATE pedido"), self._first_index(statements, "UPDATE producto"))
+        # Las reservas ya cubrían el pedido: el cobro no las vuelve a ajustar y descuenta todo en un lote.
+        self.assertFalse([s for s in statements if s.startswith(("INSERT INTO reserva_inventario", "UPDATE reserva_inventario"))])
+        self.assertEqual(len([s for s in statements if s.startswith("UPDATE producto")]), 1)
+        self.assertEqual((tomate()["stock_actual"], tomate()["stock_reservado"]), (3.0, 0.0))
+
+        kardex = self.client.get(f"/kardex/{producto_id}", headers=admin_h).get_json()["movimientos"]
+        self.assertEqual([m["tipo"] for m in kardex].count("VENTA"), 1)
+        with self.app.app_context():
+            self.assertEqual(db.session.query(ReservaInventario).count(), 0)
+
+    def test_porciones_disponibles_siguen_al_stock(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        mesero_id = self._create_user("mesero", "mesero123", RoleEnum.MESERO)
+        self._create_user("cocina", "cocina123", RoleEnum.COCINA)
+        cajero_id = self._create_user("cajero", "cajero123", RoleEnum.CAJERO)
+        admin_h = self._login_headers("admin", "admin123")
+        mesero_h = self._login_headers("mesero", "mesero123")
+        cocina_h = self._login_headers("cocina", "cocina123")
+        cajero_h = self._login_headers("cajero", "cajero123")
+
+        mesa_id = self.client.post("/mesas", json={"numero": 1}, headers=mesero_h).get_json()["id"]
+        producto_id = self.client.post(
+            "/productos",
+            json={"nombre": "Tomate", "unidad": "kg", "stock_actual": 5, "costo_promedio": 2},
+            headers=admin_h,
+        ).get_json()["id"]
+        creado = self.client.post(
+            "/platillos",
+            json={"nombre": "Ensalada", "precio": 12, "ingredientes": [{"producto_id": producto_id, "cantidad_por_unidad": 2}]},
+            headers=admin_h,
+        )
+        self.assertEqual(creado.get_json()["porciones_disponibles"], 2)
+        platillo_id = creado.get_json()["id"]
+
+        def porciones():
+            platillos = self.client.get("/platillos", headers=mesero_h).get_json()
+            return next(p for p in platillos if p["id"] == platillo_id)["porciones_disponibles"]
+
+        self.client.post(
+            "/compras",
+            json={"proveedor": "Mercado", "detalles": [{"producto_id": producto_id, "cantidad": 3, "costo_unitario": 2}]},
+            headers=admin_h,
+        )
+        self.assertEqual(porciones(), 4)
+
+        pedido_id = self.client.post(
+            "/pedidos", json={"mesa_id": mesa_id, "user_id": mesero_id}, headers=mesero_h
+        ).get_json()["id"]
+        exceso = self.client.post(f"/pedidos/{pedido_id}/items", json={"platillo_id": platillo_id, "cantidad": 5}, headers=mesero_h)
+        self.assertEqual(exceso.status_code, 400)
+        self.assertIn("Solo quedan 4 porciones", exceso.get_json()["error"])
+
+        self.client.post(f"/pedidos/{pedido_id}/items", json={"platillo_id": platillo_id, "cantidad": 3}, headers=mesero_h)
+        self.client.patch(f"/pedidos/{pedido_id}/estado", json={"estado": "PREPARACION"}, headers=mesero_h)
+        self.client.patch(f"/pedidos/{pedido_id}/estado", json={"estado": "SERVIDO"}, headers=cocina_h)
+        self.client.post("/caja/apertura", json={"user_id": cajero_id, "monto_inicial": 0}, headers=cajero_h)
+        cobro = self.client.post("/caja/cobro", json={"pedido_id": pedido_id, "metodo": "EFECTIVO"}, headers=cajero_h)
+        self.assertEqual(cobro.status_code, 201)
+        self.assertEqual(porciones(), 1)
+
+        self.client.patch(f"/productos/{producto_id}", json={"activo": False}, headers=admin_h)
+        self.assertEqual(porciones(), 0)
+        pedido_id = self.client.post(
+            "/pedidos", json={"mesa_id": mesa_id, "user_id": mesero_id}, headers=mesero_h
+        ).get_json()["id"]
+        agotado = self.client.post(f"/pedidos/{pedido_id}/items", json={"platillo_id": platillo_id, "cantidad": 1}, headers=mesero_h)
+        self.assertEqual(agotado.status_code, 400)
+        self.assertIn("agotado", agotado.get_json()["error"])
+
     def test_mesero_edita_items_y_no_libera_mesa_con_pedido_activo(self):
         self._create_user("admin", "admin123", RoleEnum.ADMIN)
         mesero_id = self._create_user("mesero", "mesero123", RoleEnum.MESERO)
@@ -177,6 +334,12 @@ class OrderCashFlowTestCase(unittest.TestCase):
         )
         self.assertEqual(edit_item.status_code, 200)
         self.assertEqual(edit_item.get_json()["pedido_total"], 27.0)
+        for cantidad in ("nan", "inf", "-inf"):
+            no_finito = self.client.patch(
+                f"/pedidos/{pedido_id}/items/{detalle_id}", json={"cantidad": cantidad}, headers=mesero_h
+            )
+            self.assertEqual(no_finito.status_code, 400)
+            self.assertEqual(no_finito.get_json()["error"], "cantidad inválida")
 
         remove_item = self.client.delete(
             f"/pedidos/{pedido_id}/items/{detalle_id}",
@@ -189,5 +352,137 @@ class OrderCashFlowTestCase(unittest.TestCase):
         self.assertEqual(liberar.status_code, 400)
 
 
+    def test_if_match_desactualizado_devuelve_412(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        mesero_id = self._create_user("mesero", "mesero123", RoleEnum.MESERO)
+
+        admin_h = self._login_headers("admin", "admin123")
+        mesero_h = self._login_headers("mesero", "mesero123")
+
+        mesa_id = self.client.post("/mesas", json={"numero": 7}, headers=mesero_h).get_json()["id"]
+        platillo_id = self.client.post("/platillos", json={"nombre": "Taco", "precio": 5}, headers=admin_h).get_json()["id"]
+
+        pedido = self.client.post("/pedidos", json={"mesa_id": mesa_id, "user_id": mesero_id}, headers=mesero_h)
+        self.assertEqual(pedido.status_code, 201)
+        self.assertEqual(pedido.headers["ETag"], '"1"')
+        pedido_id = pedido.get_json()["id"]
+
+        item = self.client.post(
+            f"/pedidos/{pedido_id}/items",
+            json={"platillo_id": platillo_id, "cantidad": 1},
+            headers={**mesero_h, "If-Match": '"1"'},
+        )
+        self.assertEqual(item.status_code, 201)
+        self.assertEqual(item.get_json()["pedido_version"], 2)
+        self.assertEqual(item.headers["ETag"], '"2"')
+
+        stale = self.client.patch(
+            f"/pedidos/{pedido_id}/estado",
+            json={"estado": "CANCELADO"},
+            headers={**mesero_h, "If-Match": '"1"'},
+        )
+        self.assertEqual(stale.status_code, 412)
+        self.assertEqual(stale.headers["ETag"], '"2"')
+
+        cancelar = self.client.patch(
+            f"/pedidos/{pedido_id}/estado",
+            json={"estado": "CANCELADO"},
+            headers={**mesero_h, "If-Match": '"2"'},
+        )
+        self.assertEqual(cancelar.status_code, 200)
+        self.assertEqual(cancelar.get_json()["version"], 3)
+
+        mesas = self.client.get("/mesas", headers=mesero_h).get_json()
+        mesa = next(m for m in mesas if m["id"] == mesa_id)
+        self.assertEqual(mesa["estado"], "LIBRE")
+        self.assertEqual(mesa["version"], 3)
+
+        stale_mesa = self.client.patch(f"/mesas/{mesa_id}", json={"numero": 8}, headers={**mesero_h, "If-Match": '"1"'})
+        self.assertEqual(stale_mesa.status_code, 412)
+
+
+    def test_total_se_recalcula_desde_lineas(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        mesero_id = self._create_user("mesero", "mesero123", RoleEnum.MESERO)
+
+        admin_h = self._login_headers("admin", "admin123")
+        mesero_h = self._login_headers("mesero", "mesero123")
+
+        mesa_id = self.client.post("/mesas", json={"numero": 9}, headers=mesero_h).get_json()["id"]
+        cafe_id = self.client.post("/platillos", json={"nombre": "Café", "precio": 0.1}, headers=admin_h).get_json()["id"]
+        pan_id = self.client.post("/platillos", json={"nombre": "Pan", "precio": 0.2}, headers=admin_h).get_json()["id"]
+        pedido_id = self.client.post("/pedidos", json={"mesa_id": mesa_id, "user_id": mesero_id}, headers=mesero_h).get_json()["id"]
+
+        cafe = self.client.post(f"/pedidos/{pedido_id}/items", json={"platillo_id": cafe_id, "cantidad": 3}, headers=mesero_h)
+        pan = self.client.post(f"/pedidos/{pedido_id}/items", json={"platillo_id": pan_id, "cantidad": 1}, headers=mesero_h)
+        self.assertEqual(pan.get_json()["pedido_total"], 0.5)
+
+        editar = self.client.patch(
+            f"/pedidos/{pedido_id}/items/{cafe.get_json()['detalle']['id']}",
+            json={"cantidad": 7},
+            headers=mesero_h,
+        )
+        self.assertEqual(editar.get_json()["pedido_total"], 0.9)
+
+        borrar = self.client.delete(f"/pedidos/{pedido_id}/items/{pan.get_json()['detalle']['id']}", headers=mesero_h)
+        self.assertEqual(borrar.get_json()["pedido_total"], 0.7)
+
+        with self.app.app_context():
+            db.session.get(Pedido, pedido_id).total = 0.69
+            db.session.commit()
+
+            resumen = repair_order_totals(dry_run=True)
+            self.assertEqual(resumen["corregidos"], 1)
+            self.assertEqual(float(db.session.get(Pedido, pedido_id).total), 0.69)
+
+            repair_order_totals()
+            db.session.commit()
+            db.session.expire_all()
+            self.assertEqual(float(db.session.get(Pedido, pedido_id).total), 0.7)
+
+
+    def test_agregar_items_en_lote(self):
+        self._create_user("admin", "admin123", RoleEnum.ADMIN)
+        mesero_id = self._create_user("mesero", "mesero123", RoleEnum.MESERO)
+
+        admin_h = self._login_headers("admin", "admin123")
+        mesero_h = self._login_headers("mesero", "mesero123")
+
+        mesa_id = self.client.post("/mesas", json={"numero": 11}, headers=mesero_h).get_json()["id"]
+        sopa_id = self.client.post("/platillos", json={"nombre": "Sopa", "precio": 4.5}, headers=admin_h).get_json()["id"]
+        jugo_id = self.client.post("/platillos", json={"nombre": "Jugo", "precio": 1.25}, headers=admin_h).get_json()["id"]
+        pedido_id = self.client.post("/pedidos", json={"mesa_id": mesa_id, "user_id": mesero_id}, headers=mesero_h).get_json()["id"]
+
+        lote = self.client.post(
+            f"/pedidos/{pedido_id}/items/batch",
+            json={"items": [{"platillo_id": sopa_id, "cantidad": 2}, {"platillo_id": jugo_id, "cantidad": 3}, {"platillo_id": sopa_id, "cantidad": 1}]},
+            headers=mesero_h,
+        )
+        self.assertEqual(lote.status_code, 201)
+        data = lote.get_json()
+        self.assertEqual([d["subtotal"] for d in data["detalles"]], [9.0, 3.75, 4.5])
+        self.assertEqual(data["pedido_total"], 17.25)
+        self.assertEqual(data["pedido_version"], 2)
+
+        invalido = self.client.post(
+            f"/pedidos/{pedido_id}/items/batch",
+            json={"items": [{"platillo_id": jugo_id, "cantidad": 1}, {"platillo_id": 999, "cantidad": 1}]},
+            headers=mesero_h,
+        )
+        self.assertEqual(invalido.status_code, 400)
+        for ruta, payload in (
+            ("items", {"platillo_id": jugo_id, "cantidad": "nan"}),
+            ("items/batch", {"items": [{"platillo_id": jugo_id, "cantidad": "inf"}]}),
+        ):
+            no_finito = self.client.post(f"/pedidos/{pedido_id}/{ruta}", json=payload, headers=mesero_h)
+            self.assertEqual(no_finito.status_code, 400)
+            self.assertEqual(no_finito.get_json()["error"], "cantidad inválida")
+
+        pedidos = self.client.get("/pedidos?estado=ABIERTO", headers=mesero_h).get_json()
+        pedido = next(p for p in pedidos if p["id"] == pedido_id)
+        self.assertEqual(len(pedido["detalles"]), 3)
+        self.assertEqual(pedido["total"], 17.25)
+
+
 if __name__ == "__main__":
     unittest.main()
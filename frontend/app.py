@@ -1,4 +1,5 @@
 import os
+import uuid
 from functools import wraps
 
 import requests
@@ -37,6 +38,12 @@ def _api_call(base_url, method, path, payload=None, token=None, params=None, ext
     return data
 
 
+def _idempotency_headers():
+    # Cada formulario trae su propia clave: un doble envío o un reenvío del navegador reutiliza la misma.
+    key = (request.form.get("idempotency_key") or "").strip()
+    return {"Idempotency-Key": key} if key else None
+
+
 def _safe_get(base_url, path, default, token, params=None):
     try:
         return _api_call(base_url, "GET", path, token=token, params=params)
@@ -123,6 +130,10 @@ def create_frontend_app():
     app.config["SECRET_KEY"] = os.getenv("FRONTEND_SECRET_KEY", "frontend-dev-secret")
     app.config["BACKEND_DEPLOY_KEY"] = os.getenv("BACKEND_DEPLOY_KEY", "")
 
+    @app.context_processor
+    def inject_idempotency_key():
+        return {"idempotency_key": lambda: uuid.uuid4().hex}
+
     def auth_token():
         return session.get("access_token")
 
@@ -269,8 +280,9 @@ def create_frontend_app():
         mesas = _safe_get(api, "/mesas", [], token)
         productos = _safe_get(api, "/productos", [], token)
         platillos = _safe_get(api, "/platillos", [], token)
-        compras = _safe_get(api, "/compras", [], token, compras_filters)
-        inventarios_fisicos = _safe_get(api, "/inventarios-fisicos", [], token, inventario_filters)
+        # El tablero solo muestra los encabezados: no se piden las líneas de detalle.
+        compras = _safe_get(api, "/compras", [], token, {**compras_filters, "detalles": "0"})
+        inventarios_fisicos = _safe_get(api, "/inventarios-fisicos", [], token, {**inventario_filters, "detalles": "0"})
         kardex_producto_id = request.args.get("kardex_producto_id", "").strip()
         kardex_data = None
         if kardex_producto_id:
@@ -280,6 +292,10 @@ def create_frontend_app():
             "users": _safe_get(api, "/auth/users", [], token),
             "mesas": mesas,
             "productos": productos,
+            "bajo_stock": _safe_get(api, "/inventario/bajo-stock", [], token),
+            "valorizacion": _safe_get(
+                api, "/inventario/valorizacion", {"items": [], "total": None}, token, {"agrupacion": "unidad"}
+            ),
             "platillos": platillos,
             "compras": compras,
             "inventarios_fisicos": inventarios_fisicos,
@@ -324,7 +340,10 @@ def create_frontend_app():
         pedidos_abiertos = [p for p in pedidos if p.get("estado") == "ABIERTO"]
         pedidos_preparacion = [p for p in pedidos if p.get("estado") == "PREPARACION"]
         pedidos_servidos = [p for p in pedidos if p.get("estado") == "SERVIDO"]
-        platillos_disponibles = [p for p in platillos if p.get("activo")]
+        # porciones_disponibles es None para platillos sin receta: no tienen límite de stock.
+        platillos_disponibles = [
+            p for p in platillos if p.get("activo") and (p.get("porciones_disponibles") is None or p["porciones_disponibles"] > 0)
+        ]
         context = {
             "backend_api_url": api,
             "mesas": mesas,
@@ -435,6 +454,7 @@ def create_frontend_app():
             "unidad": unidad,
             "stock_actual": float(request.form.get("stock_actual", "0") or 0),
             "costo_promedio": float(request.form.get("costo_promedio", "0") or 0),
+            "stock_minimo": float(request.form.get("stock_minimo", "0") or 0),
         }
         try:
             data = _api_call(app.config["BACKEND_API_URL"], "POST", "/productos", payload, auth_token())
@@ -566,7 +586,14 @@ def create_frontend_app():
             ],
         }
         try:
-            data = _api_call(app.config["BACKEND_API_URL"], "POST", "/compras", payload, auth_token())
+            data = _api_call(
+                app.config["BACKEND_API_URL"],
+                "POST",
+                "/compras",
+                payload,
+                auth_token(),
+                extra_headers=_idempotency_headers(),
+            )
             flash(f"Compra registrada: ID {data.get('id')}", "success")
         except Exception as exc:
             flash(f"Error registrando compra: {exc}", "error")
@@ -619,7 +646,14 @@ def create_frontend_app():
             "user_id": int(request.form.get("user_id", "0") or 0),
         }
         try:
-            data = _api_call(app.config["BACKEND_API_URL"], "POST", "/pedidos", payload, auth_token())
+            data = _api_call(
+                app.config["BACKEND_API_URL"],
+                "POST",
+                "/pedidos",
+                payload,
+                auth_token(),
+                extra_headers=_idempotency_headers(),
+            )
             flash(f"Pedido creado: ID {data.get('id')}", "success")
         except Exception as exc:
             flash(f"Error creando pedido: {exc}", "error")
@@ -641,6 +675,26 @@ def create_frontend_app():
             flash(f"Error agregando item: {exc}", "error")
         return redirect(url_for("dashboard_mesas"))
 
+    @app.post("/actions/pedido-items")
+    @login_required
+    @roles_required("ADMIN", "MESERO")
+    def add_items_pedido():
+        pedido_id = int(request.form.get("pedido_id", "0") or 0)
+        items = [
+            {"platillo_id": int(platillo_id), "cantidad": float(cantidad)}
+            for platillo_id, cantidad in zip(request.form.getlist("platillo_id"), request.form.getlist("cantidad"))
+            if platillo_id and cantidad
+        ]
+        if not items:
+            flash("Selecciona al menos un platillo con cantidad", "error")
+            return redirect(url_for("dashboard_mesas"))
+        try:
+            _api_call(app.config["BACKEND_API_URL"], "POST", f"/pedidos/{pedido_id}/items/batch", {"items": items}, auth_token())
+            flash(f"{len(items)} item(s) agregados al pedido", "success")
+        except Exception as exc:
+            flash(f"Error agregando items: {exc}", "error")
+        return redirect(url_for("dashboard_mesas"))
+
     @app.post("/actions/pedido-item-editar")
     @login_required
     @roles_required("ADMIN", "MESERO")
@@ -720,7 +774,14 @@ def create_frontend_app():
             "metodo": request.form.get("metodo", "EFECTIVO").strip(),
         }
         try:
-            data = _api_call(app.config["BACKEND_API_URL"], "POST", "/caja/cobro", payload, auth_token())
+            data = _api_call(
+                app.config["BACKEND_API_URL"],
+                "POST",
+                "/caja/cobro",
+                payload,
+                auth_token(),
+                extra_headers=_idempotency_headers(),
+            )
             flash(f"Cobro registrado: ID {data.get('id')}", "success")
         except Exception as exc:
             flash(f"Error en cobro: {exc}", "error")